@@ -1,267 +1,322 @@
+import signal
+import sys
+
 import cv2
 import mediapipe as mp
-import pyautogui
-import socket
-import threading
-import os
-import time
 from PIL import Image
 
+from capture import FrameGrabber, open_camera
+from codec_select import CodecSelector
+from discovery import RECEIVE, Discovery
+from gesture_engine import FIST, OPEN_PALM, TWO_FINGERS
+from gesture_state import ANY_STATE, GestureFlow
+from hand_tracker import HandTracker
+from metrics import Metrics
+from netinfo import get_ip_address
+from pipeline import GesturePipeline
+from preview import PREVIEW_FPS, PreviewRenderer
+from receive_service import ReceiveService
+from scheduler import InferenceScheduler
+from screenshot_encoder import ScreenshotEncoder
+from tile_delta import PeerTileCache
+from transfer_manager import CANCELLED, DONE, FAILED, TransferManager
+
 # Initialize MediaPipe Hands
 mp_hands = mp.solutions.hands
 mp_drawing = mp.solutions.drawing_utils
 hands = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
 
-screenshot_path = "screenshot.png"
+# Track the hand in a small region of interest; search a downscaled frame when it's lost
+INFERENCE_WIDTH = 320
+tracker = HandTracker(hands, inference_width=INFERENCE_WIDTH)
+# Only a trickle of inferences while nobody is in front of the camera; motion or a hand
+# brings back full rate. See scheduler.POLICIES ("always" runs every frame)
+INFERENCE_POLICY = "balanced"
+scheduler = InferenceScheduler(tracker, policy=INFERENCE_POLICY)
+# The same mirror/track/classify/vote pipeline the replay benchmarks run
+pipeline = GesturePipeline(scheduler)
+
+# Per-stage frame timings: a debug overlay ('m' toggles it), Prometheus text at
+# http://127.0.0.1:9464/metrics and a JSON line in metrics.jsonl every 10 s
+METRICS_ENABLED = False
+metrics = Metrics(enabled=METRICS_ENABLED)
+
+# --headless runs gestures and transfers with no window and no drawing (stop it with
+# Ctrl+C); otherwise the preview redraws at most PREVIEW_FPS times a second, however
+# fast inference runs
+HEADLESS = "--headless" in sys.argv
+
+screenshot_path = "screenshot.png"  # only written when SAVE_SCREENSHOT_COPY is on
+SCREENSHOT_CODEC = "png-fast"  # png-fast, png, jpeg, webp, webp-lossless or raw-zlib
+# Pick the codec per send from measured link speed and encode cost instead (see codec_select.py);
+# ALLOW_LOSSY lets slow links get jpeg or webp, which are smaller but not pixel-exact
+ADAPTIVE_CODEC = True
+ALLOW_LOSSY = False
+RECEIVED_CODEC = None  # re-save received screenshots in this codec, e.g. "png"; None keeps what arrives
+SAVE_SCREENSHOT_COPY = False
+# Shared by both laptops, e.g. "4821": transfers are then encrypted, and only a peer with the same
+# code can exchange screenshots with you (needs the cryptography package). None sends in the clear
+VERIFICATION_CODE = None
+# Send each screenshot to every receiver discovered at once (a class or a team) instead of one;
+# a chosen partner still gets it alone
+FAN_OUT = False
+screenshot_encoder = ScreenshotEncoder(codec=SCREENSHOT_CODEC)
+pending_screenshot = None  # Future for the last EncodedImage
 PORT = 5001
 receiving_mode = False
-receive_thread = None
-partner_ip = None  # Will store the partner's IP address
+READY, CAPTURED = "ready", "captured"  # screenshot flow states
+receive_service = None
+# Chosen partner's IP address, or --to <IP> at startup; None sends to the receiver discovered on
+# the network, if it's the only one
+partner_ip = sys.argv[sys.argv.index("--to") + 1] if "--to" in sys.argv[:-1] else None
+peer_discovery = None
+transfer_manager = None
 
-def get_ip_address():
-    """Get the local IP address of the device."""
+def take_screenshot():
+    """Capture and encode a screenshot in memory on a worker thread."""
+    global pending_screenshot
+    save_path = screenshot_path if SAVE_SCREENSHOT_COPY else None
+    pending_screenshot = screenshot_encoder.capture(save_path=save_path,
+                                                    codec=transfer_manager.choose_codec(partner_ip))
+    pending_screenshot.add_done_callback(report_screenshot)
+
+def report_screenshot(future):
+    """Print the encode result once the worker has finished."""
     try:
-        hostname = socket.gethostname()
-        return socket.gethostbyname(hostname)
+        print(f"\n📸 Screenshot taken! ({future.result().describe()})")
     except Exception as e:
-        print(f"Error getting IP address: {e}")
-        return "127.0.0.1"
+        print(f"Error taking screenshot: {e}")
 
 def send_screenshot():
-    """Send screenshot to the stored partner IP address."""
-    global partner_ip
-    
-    try:
-        if not os.path.exists(screenshot_path):
-            print("No screenshot found to send!")
+    """Queue the screenshot for sending to the chosen partner, or the only receiver discovered (every one with FAN_OUT)."""
+    if pending_screenshot is None:
+        print("No screenshot found to send!")
+        return
+
+    target = partner_ip
+    if not target and FAN_OUT:
+        targets = [peer.address for peer in peer_discovery.peers(receiving=True)]
+        if not targets:
+            print("No receivers found on the network yet. Ask them to show an open palm (✋) first.")
             return
-            
-        if not partner_ip:
-            print("No partner IP address configured. Use 'p' key to configure.")
+        print(f"Sending screenshot to {len(targets)} receivers: {', '.join(targets)}...")
+        return transfer_manager.submit_group(targets, pending_screenshot)
+    if not target:
+        peer = peer_discovery.resolve()
+        if peer is None:
+            receivers = peer_discovery.peers(receiving=True)
+            if receivers:
+                print(f"Several receivers found: {', '.join(p.describe() for p in receivers)}. "
+                      "Press 'p' to choose one (or start with --to <IP>).")
+            else:
+                print("No receivers found on the network yet. Ask your partner to show an open palm (✋) first.")
             return
+        target = peer.address
 
-        print(f"Sending screenshot to {partner_ip}...")
-        max_retries = 3
-        retry_delay = 2  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(5)  # 5 second timeout for connection
-                    s.connect((partner_ip, PORT))
-                    
-                    # Send file size first
-                    file_size = os.path.getsize(screenshot_path)
-                    s.send(str(file_size).encode())
-                    
-                    # Wait for acknowledgment
-                    s.recv(1024)
-                    
-                    # Send the file
-                    with open(screenshot_path, 'rb') as f:
-                        data = f.read(1024)
-                        while data:
-                            s.send(data)
-                            data = f.read(1024)
-                    
-                    print(f"Screenshot sent successfully to {partner_ip}!")
-                    return
-                    
-            except ConnectionRefusedError:
-                if attempt < max_retries - 1:
-                    print(f"Connection refused. Make sure the receiver is in receive mode. Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    print("Error: Receiver is not in receive mode. Ask them to use the open palm gesture (✋) first.")
-            except Exception as e:
-                print(f"Error on attempt {attempt + 1}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                
+    print(f"Sending screenshot to {target}...")
+    return transfer_manager.submit(target, pending_screenshot)
+
+def report_transfer(job):
+    """Print how a background send ended."""
+    # on_status also fires for queued and sending; only a finished transfer is counted
+    if job.status in (DONE, FAILED, CANCELLED):
+        metrics.inc("transfers_total", status=job.status)
+    if job.status == DONE:
+        metrics.inc("transfer_bytes_total", job.total)
+        print(f"Screenshot sent successfully to {job.target}!")
+    elif job.status == FAILED:
+        if isinstance(job.error, ConnectionRefusedError):
+            print("Error: Receiver is not in receive mode. Ask them to use the open palm gesture (✋) first.")
+        else:
+            print(f"Error sending screenshot: {job.error}")
+    elif job.status == CANCELLED:
+        print(f"Transfer to {job.target} cancelled.")
+
+def show_received_screenshot(path, addr):
+    """Automatically open a screenshot as soon as it has been received."""
+    try:
+        img = Image.open(path)
+        img.show()
     except Exception as e:
-        print(f"Error sending screenshot: {e}")
+        print(f"Error opening received image: {e}")
 
 def start_receive_server():
-    """Start the receive server in a separate thread."""
-    global receiving_mode
-    receiving_mode = True
-    
-    def receive_server():
+    """Start the persistent receive service (many senders at once, no timeout)."""
+    global receiving_mode, receive_service
+
+    if receive_service is None:
         try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('', PORT))
-                s.settimeout(60)  # 60 second timeout (increased from 30)
-                s.listen(1)
-                print(f"\n📱 Ready to receive! Your IP address is: {get_ip_address()}")
-                print("Waiting for incoming screenshots... (60 second timeout)")
-                
-                conn, addr = s.accept()
-                with conn:
-                    print(f"\nReceiving screenshot from {addr[0]}")
-                    
-                    # Receive file size first
-                    file_size = int(conn.recv(1024).decode())
-                    conn.send(b"ACK")
-                    
-                    # Receive the file
-                    received_data = b""
-                    while len(received_data) < file_size:
-                        data = conn.recv(1024)
-                        if not data:
-                            break
-                        received_data += data
-                    
-                    # Save the received screenshot
-                    with open("received_screenshot.png", 'wb') as f:
-                        f.write(received_data)
-                    
-                    print("✅ Screenshot received successfully!")
-                    # Automatically open the received screenshot
-                    try:
-                        img = Image.open("received_screenshot.png")
-                        img.show()
-                    except Exception as e:
-                        print(f"Error opening received image: {e}")
-                    
-        except socket.timeout:
-            print("\n⏰ Receive mode timed out. Use open palm gesture (✋) to start receiving again.")
+            receive_service = ReceiveService(port=PORT, save_codec=RECEIVED_CODEC, code=VERIFICATION_CODE,
+                                             on_received=show_received_screenshot)
+            receive_service.start()
         except Exception as e:
-            print(f"\n❌ Error receiving screenshot: {e}")
-        finally:
-            global receiving_mode
-            receiving_mode = False
-    
-    return threading.Thread(target=receive_server, daemon=True)
+            print(f"\n❌ Error starting receive server: {e}")
+            receive_service = None
+            return
+        peer_discovery.set_caps(RECEIVE)
+        print(f"\n📱 Ready to receive! Your IP address is: {get_ip_address()}")
+        print("Waiting for incoming screenshots from any number of senders...")
+    receiving_mode = True
 
-def configure_partner_ip():
-    """Configure the partner's IP address."""
+def next_partner():
+    """Cycle the partner through the receivers discovered on the network, then back to automatic."""
     global partner_ip
-    partner_ip = input("\n🔄 Enter your partner's IP address: ")
-    print(f"Partner IP set to: {partner_ip}")
-    return partner_ip    
+    choices = [None] + [peer.address for peer in peer_discovery.peers(receiving=True)]
+    index = choices.index(partner_ip) if partner_ip in choices else 0
+    partner_ip = choices[(index + 1) % len(choices)]
+    if len(choices) == 1:
+        print("No receivers found on the network yet.")
+    print(f"Partner set to: {partner_ip or 'the only receiver found'}")
+    if partner_ip:
+        # Open the session now so the next fist gesture just writes to it
+        transfer_manager.connect(partner_ip)
 
 def detect_gestures():
     """Detects hand gestures for taking, sending, and receiving screenshots."""
-    global receive_thread, receiving_mode, partner_ip
+    global receiving_mode, transfer_manager, peer_discovery
     
     # Try different camera indices
-    for camera_index in [0, 1, -1]:
-        try:
-            print(f"Trying to open camera {camera_index}")
-            cap = cv2.VideoCapture(camera_index)
-            
-            if not cap.isOpened():
-                print(f"Failed to open camera {camera_index}")
-                continue
-                
-            print(f"Successfully opened camera {camera_index}")
-            break
-        except Exception as e:
-            print(f"Error opening camera {camera_index}: {e}")
-            continue
-    else:
+    cap = open_camera()
+    if cap is None:
         print("Error: Could not open any camera")
         return
 
-    # Configure partner IP at startup
+    # Find other AirShare devices on the network instead of asking for an IP
     print(f"\n📱 Your IP address is: {get_ip_address()}")
-    partner_ip = configure_partner_ip()
+    peer_discovery = Discovery(port=PORT).start()
+    print("🔍 Looking for AirShare devices on your network...")
 
-    screenshot_taken = False
+    # Gestures fire once they've held steady for a few frames; the flow only
+    # lets a fist send after two fingers took a screenshot
+    flow = GestureFlow(READY, {
+        (READY, TWO_FINGERS): (CAPTURED, take_screenshot),
+        (CAPTURED, FIST): (READY, send_screenshot),
+        (ANY_STATE, OPEN_PALM): (ANY_STATE, start_receive_server),
+    })
     
     print("\n👋 Gesture Controls:")
     print("✌  Two Fingers to take a screenshot")
-    print("✊  Closed Fist to send screenshot to pre-configured IP")
-    print("✋  Open Palm to enter receive mode (60 second timeout)")
-    print("Press 'p' to change partner IP address")
-    print("Press 'q' to quit\n")
+    print("✊  Closed Fist to send screenshot to your partner")
+    print("✋  Open Palm to enter receive mode")
+    if HEADLESS:
+        print("Running headless: no preview window. Press Ctrl+C to quit\n")
+    else:
+        print("Press 'p' to switch between the receivers found on your network")
+        print("Press 'c' to cancel transfers in progress")
+        if METRICS_ENABLED:
+            print("Press 'm' to toggle the metrics overlay")
+        print("Press 'q' to quit\n")
     
+    # Sends run on background workers so the gesture loop keeps its frame rate;
+    # repeat screenshots to the same peer only carry the tiles that changed
+    transfer_manager = TransferManager(PORT, on_status=report_transfer, tile_cache=PeerTileCache(),
+                                       codec_selector=CodecSelector(ALLOW_LOSSY) if ADAPTIVE_CODEC else None,
+                                       code=VERIFICATION_CODE)
+
+    # Grab frames on their own thread so gestures are always read from the newest frame
+    grabber = FrameGrabber(cap).start()
+    preview = PreviewRenderer("AirShare - Gesture Recognition", PREVIEW_FPS, headless=HEADLESS)
+    metrics.serve()
+    metrics.start_log("metrics.jsonl")
+
     try:
         while True:
-            ret, frame = cap.read()
+            timer = metrics.frame()
+            ret, frame = grabber.read()
             if not ret:
                 print("Error: Couldn't read frame from camera")
                 break
+            timer.mark("cap.read")
 
-            frame = cv2.flip(frame, 1)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
+            # Mirror, track, classify and vote, exactly as the replay benchmarks do
             try:
-                result = hands.process(rgb_frame)
+                step = pipeline.process(frame)
             except Exception as e:
                 print(f"Error processing frame: {e}")
+                timer.end()
+                continue
+            frame, result = step.frame, step.result
+            timer.add(step.timings)
+
+            # Only gestures that held steady for a few frames arrive here
+            try:
+                for gesture in step.events:
+                    flow.fire(gesture)
+            except Exception as e:
+                print(f"Error handling gesture: {e}")
+            timer.mark("gestures")
+            metrics.set("frames_dropped", grabber.dropped)
+            metrics.set("inference_duty_cycle", scheduler.duty_cycle)
+
+            # Every frame goes through the pipeline; only some are drawn and shown
+            if not preview.due():
+                timer.end()
                 continue
 
             if result.multi_hand_landmarks:
                 for hand_landmarks in result.multi_hand_landmarks:
-                    try:
-                        mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-                        
-                        landmarks = hand_landmarks.landmark
-                        thumb_tip = landmarks[mp_hands.HandLandmark.THUMB_TIP].y
-                        index_tip = landmarks[mp_hands.HandLandmark.INDEX_FINGER_TIP].y
-                        middle_tip = landmarks[mp_hands.HandLandmark.MIDDLE_FINGER_TIP].y
-                        ring_tip = landmarks[mp_hands.HandLandmark.RING_FINGER_TIP].y
-                        pinky_tip = landmarks[mp_hands.HandLandmark.PINKY_TIP].y
-
-                        # Gesture: Two Fingers Up (Take Screenshot)
-                        if (index_tip < thumb_tip and middle_tip < thumb_tip and
-                            ring_tip > index_tip and pinky_tip > index_tip and not screenshot_taken):
-                            try:
-                                screenshot = pyautogui.screenshot()
-                                screenshot.save(screenshot_path)
-                                screenshot_taken = True
-                                print("\n📸 Screenshot taken!")
-                                time.sleep(1)
-                            except Exception as e:
-                                print(f"Error taking screenshot: {e}")
-                        
-                        # Gesture: Closed Fist (Send Screenshot)
-                        elif (index_tip > thumb_tip and middle_tip > thumb_tip and
-                              ring_tip > thumb_tip and pinky_tip > thumb_tip and screenshot_taken):
-                            send_screenshot()
-                            screenshot_taken = False
-                        
-                        # Gesture: Open Palm (Receive Screenshot)
-                        elif (index_tip < thumb_tip and middle_tip < thumb_tip and
-                              ring_tip < thumb_tip and pinky_tip < thumb_tip and not receiving_mode):
-                            receive_thread = start_receive_server()
-                            receive_thread.start()
-                            
-                    except Exception as e:
-                        print(f"Error processing hand landmarks: {e}")
-                        continue
+                    mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+            timer.mark("draw_landmarks")
 
             # Add status text and IP info to the frame
             status_text = "Ready"
-            if screenshot_taken:
+            if flow.state == CAPTURED:
                 status_text = "Screenshot taken - Ready to send"
             elif receiving_mode:
                 status_text = "Receiving mode active"
             
             cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+            # Show background transfers; the loop never waits for them
+            for i, job in enumerate(transfer_manager.recent_jobs()[-3:]):
+                cv2.putText(frame, job.describe(), (10, 60 + i * 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
             
             # Display connection info
             ip_text = f"Your IP: {get_ip_address()}"
-            partner_text = f"Partner: {partner_ip if partner_ip else 'Not set'}"
+            receivers = len(peer_discovery.peers(receiving=True))
+            partner_text = f"Partner: {partner_ip or 'auto'} ({receivers} receivers nearby)"
             cv2.putText(frame, ip_text, (10, frame.shape[0] - 60), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             cv2.putText(frame, partner_text, (10, frame.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
             
-            cv2.imshow("AirShare - Gesture Recognition", frame)
+            inference_text = f"Inference: {scheduler.inference_ms:.1f} ms ({scheduler.mode})"
+            cv2.putText(frame, inference_text, (frame.shape[1] - 260, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            metrics.draw(frame)
+            timer.mark("putText")
 
-            key = cv2.waitKey(1) & 0xFF
+            preview.draw(frame)
+            timer.mark("imshow")
+            key = preview.poll()
+            timer.mark("waitKey")
+            timer.end()
             if key == ord('q'):
                 break
             elif key == ord('p'):
-                partner_ip = configure_partner_ip()
+                next_partner()
+            elif key == ord('c'):
+                transfer_manager.cancel_all()
+            elif key == ord('m'):
+                metrics.overlay = not metrics.overlay
 
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"Unexpected error: {e}")
     
     finally:
         print("\nCleaning up...")
+        transfer_manager.shutdown()
+        screenshot_encoder.shutdown()
+        metrics.stop()
+        if receive_service:
+            receive_service.stop()
+        peer_discovery.stop()
+        grabber.stop()
+        print(f"Dropped {grabber.dropped} of {grabber.grabbed} camera frames to stay on the newest one")
+        print(f"Ran {scheduler.describe()}")
         cap.release()
-        cv2.destroyAllWindows()
+        preview.close()
 
 if __name__ == "__main__":
+    # A headless run is stopped with SIGTERM as cleanly as with Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     detect_gestures()
\ No newline at end of file
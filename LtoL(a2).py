@@ -1,258 +1,313 @@
+import signal
+import sys
+
 import cv2
 import mediapipe as mp
-import pyautogui
-import socket
-import threading
-import os
-import time
 from PIL import Image
 
+from capture import FrameGrabber, open_camera
+from codec_select import CodecSelector
+from discovery import RECEIVE, Discovery
+from gesture_engine import FIST, TWO_FINGERS
+from gesture_state import GestureFlow
+from hand_tracker import HandTracker
+from metrics import Metrics
+from netinfo import get_ip_address
+from pipeline import GesturePipeline
+from preview import PREVIEW_FPS, PreviewRenderer
+from receive_service import ReceiveService
+from scheduler import InferenceScheduler
+from screenshot_encoder import ScreenshotEncoder
+from tile_delta import PeerTileCache
+from transfer_manager import CANCELLED, DONE, FAILED, TransferManager
+
 # Initialize MediaPipe Hands
 mp_hands = mp.solutions.hands
 mp_drawing = mp.solutions.drawing_utils
 hands = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
 
-screenshot_path = "screenshot.png"
+# Track the hand in a small region of interest; search a downscaled frame when it's lost
+INFERENCE_WIDTH = 320
+tracker = HandTracker(hands, inference_width=INFERENCE_WIDTH)
+# Only a trickle of inferences while nobody is in front of the camera; motion or a hand
+# brings back full rate. See scheduler.POLICIES ("always" runs every frame)
+INFERENCE_POLICY = "balanced"
+scheduler = InferenceScheduler(tracker, policy=INFERENCE_POLICY)
+# The same mirror/track/classify/vote pipeline the replay benchmarks run
+pipeline = GesturePipeline(scheduler)
+
+# Per-stage frame timings: a debug overlay ('m' toggles it), Prometheus text at
+# http://127.0.0.1:9464/metrics and a JSON line in metrics.jsonl every 10 s
+METRICS_ENABLED = False
+metrics = Metrics(enabled=METRICS_ENABLED)
+
+# --headless runs gestures and transfers with no window and no drawing (stop it with
+# Ctrl+C); otherwise the preview redraws at most PREVIEW_FPS times a second, however
+# fast inference runs
+HEADLESS = "--headless" in sys.argv
+
+screenshot_path = "screenshot.png"  # only written when SAVE_SCREENSHOT_COPY is on
+SCREENSHOT_CODEC = "png-fast"  # png-fast, png, jpeg, webp, webp-lossless or raw-zlib
+# Pick the codec per send from measured link speed and encode cost instead (see codec_select.py);
+# ALLOW_LOSSY lets slow links get jpeg or webp, which are smaller but not pixel-exact
+ADAPTIVE_CODEC = True
+ALLOW_LOSSY = False
+RECEIVED_CODEC = None  # re-save received screenshots in this codec, e.g. "png"; None keeps what arrives
+SAVE_SCREENSHOT_COPY = False
+# Shared by both laptops, e.g. "4821": transfers are then encrypted, and only a peer with the same
+# code can exchange screenshots with you (needs the cryptography package). None sends in the clear.
+# --code <value> sets it for any run; otherwise an interactive setup asks for it
+VERIFICATION_CODE = sys.argv[sys.argv.index("--code") + 1] if "--code" in sys.argv[:-1] else None
+screenshot_encoder = ScreenshotEncoder(codec=SCREENSHOT_CODEC)
+pending_screenshot = None  # Future for the last EncodedImage
 PORT = 5001
 receiving_mode = False
-receive_thread = None
-partner_ip = None
-
-def get_ip_address():
-    """Get the local IP address of the device."""
-    try:
-        hostname = socket.gethostname()
-        return socket.gethostbyname(hostname)
-    except Exception as e:
-        print(f"Error getting IP address: {e}")
-        return "127.0.0.1"
+READY, CAPTURED = "ready", "captured"  # screenshot flow states
+receive_service = None
+transfer_manager = None
+peer_discovery = None
+partner_ip = None  # the receiver's IP if given at setup (or --to <IP>); None finds it on the network
 
 def setup_connection():
-    """Initial setup to establish connection role and partner IP."""
-    global partner_ip
-    
+    """Initial setup to establish connection role and, optionally, the receiver's IP."""
+    global VERIFICATION_CODE, partner_ip
     print("\n🔄 AirShare Connection Setup")
     print("----------------------------")
     print(f"Your IP address is: {get_ip_address()}")
-    choice = input("Are you the sender (S) or receiver (R)? ").lower()
+    if HEADLESS:
+        # Nobody to ask: a headless run receives unless started with --sender
+        choice = 's' if "--sender" in sys.argv else 'r'
+        if "--to" in sys.argv[:-1]:
+            partner_ip = sys.argv[sys.argv.index("--to") + 1]
+    else:
+        choice = input("Are you the sender (S) or receiver (R)? ").lower()
+        if VERIFICATION_CODE is None:
+            VERIFICATION_CODE = input("Verification code shared with the other laptop (Enter for none): ").strip() or None
+    if VERIFICATION_CODE:
+        print("🔒 Transfers are encrypted with the verification code")
     
     if choice == 's':
-        partner_ip = input("Enter receiver's IP address: ")
-        print(f"\n✅ Setup complete! You can now use gestures to send screenshots to {partner_ip}")
+        if not HEADLESS:
+            partner_ip = input("Enter receiver's IP address (Enter for auto-discovery): ").strip() or None
+        if partner_ip:
+            print(f"\n✅ Setup complete! You can now use gestures to send screenshots to {partner_ip}")
+        else:
+            print("\n✅ Setup complete! Screenshots will go to the receiver found on your network")
         return "sender"
     else:
         print(f"\n✅ Setup complete! Other devices can send screenshots to your IP: {get_ip_address()}")
         return "receiver"
 
-def send_screenshot():
-    """Send screenshot to the pre-configured IP address."""
-    global partner_ip
-    
+def take_screenshot():
+    """Capture and encode a screenshot in memory on a worker thread."""
+    global pending_screenshot
+    save_path = screenshot_path if SAVE_SCREENSHOT_COPY else None
+    pending_screenshot = screenshot_encoder.capture(save_path=save_path,
+                                                    codec=transfer_manager.choose_codec(partner_ip))
+    pending_screenshot.add_done_callback(report_screenshot)
+
+def report_screenshot(future):
+    """Print the encode result once the worker has finished."""
     try:
-        if not os.path.exists(screenshot_path):
-            print("No screenshot found to send!")
+        print(f"\n📸 Screenshot taken! ({future.result().describe()})")
+    except Exception as e:
+        print(f"Error taking screenshot: {e}")
+
+def send_screenshot():
+    """Queue the screenshot for sending to the receiver set up, or the one discovered on the network."""
+    if pending_screenshot is None:
+        print("No screenshot found to send!")
+        return
+
+    target = partner_ip
+    if not target:
+        peer = peer_discovery.resolve()
+        if peer is None:
+            receivers = peer_discovery.peers(receiving=True)
+            if receivers:
+                print(f"❌ Several receivers found: {', '.join(p.describe() for p in receivers)}. "
+                      "Restart and enter the receiver's IP at setup (or --to <IP>).")
+            else:
+                print("❌ No receiver found on your network yet. Ask them to start AirShare as the receiver.")
             return
+        target = peer.address
 
-        print(f"Sending screenshot to {partner_ip}...")
-        max_retries = 3
-        retry_delay = 2  # seconds
-        
-        for attempt in range(max_retries):
-            try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(5)
-                    s.connect((partner_ip, PORT))
-                    
-                    # Send file size first
-                    file_size = os.path.getsize(screenshot_path)
-                    s.send(str(file_size).encode())
-                    
-                    # Wait for acknowledgment
-                    s.recv(1024)
-                    
-                    # Send the file
-                    with open(screenshot_path, 'rb') as f:
-                        data = f.read(1024)
-                        while data:
-                            s.send(data)
-                            data = f.read(1024)
-                    
-                    print(f"✅ Screenshot sent successfully!")
-                    return
-                    
-            except ConnectionRefusedError:
-                if attempt < max_retries - 1:
-                    print(f"Connection refused. Make sure receiver is ready. Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-                else:
-                    print("❌ Error: Receiver is not ready. Ask them to restart in receive mode.")
-            except Exception as e:
-                print(f"Error on attempt {attempt + 1}: {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(retry_delay)
-                
-    except Exception as e:
-        print(f"Error sending screenshot: {e}")
+    print(f"Sending screenshot to {target}...")
+    return transfer_manager.submit(target, pending_screenshot)
+
+def report_transfer(job):
+    """Print how a background send ended."""
+    # on_status also fires for queued and sending; only a finished transfer is counted
+    if job.status in (DONE, FAILED, CANCELLED):
+        metrics.inc("transfers_total", status=job.status)
+    if job.status == DONE:
+        metrics.inc("transfer_bytes_total", job.total)
+        print(f"✅ Screenshot sent successfully!")
+    elif job.status == FAILED:
+        if isinstance(job.error, ConnectionRefusedError):
+            print("❌ Error: Receiver is not ready. Ask them to restart in receive mode.")
+        else:
+            print(f"Error sending screenshot: {job.error}")
+    elif job.status == CANCELLED:
+        print(f"Transfer to {job.target} cancelled.")
 
 def start_receive_server():
-    """Start the receive server in a separate thread."""
-    def receive_server():
-        global receiving_mode  # Declare global at start of function
-        
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.bind(('', PORT))
-                s.listen(1)
-                print("\n📱 Ready to receive screenshots!")
-                
-                while receiving_mode:  # Now receiving_mode is properly scoped
-                    try:
-                        s.settimeout(1)  # Short timeout for checking receiving_mode
-                        conn, addr = s.accept()
-                        with conn:
-                            print(f"\nReceiving screenshot from {addr[0]}")
-                            
-                            # Receive file size first
-                            file_size = int(conn.recv(1024).decode())
-                            conn.send(b"ACK")
-                            
-                            # Receive the file
-                            received_data = b""
-                            while len(received_data) < file_size:
-                                data = conn.recv(1024)
-                                if not data:
-                                    break
-                                received_data += data
-                            
-                            # Save the received screenshot
-                            with open("received_screenshot.png", 'wb') as f:
-                                f.write(received_data)
-                            
-                            print("✅ Screenshot received successfully!")
-                            
-                    except socket.timeout:
-                        continue
-                    except Exception as e:
-                        print(f"\n❌ Error receiving screenshot: {e}")
-                    
-        except Exception as e:
-            print(f"\n❌ Error in receive server: {e}")
-    
-    global receiving_mode
-    receiving_mode = True  # Set receiving_mode to True before starting the thread
-    return threading.Thread(target=receive_server, daemon=True)
+    """Start the persistent receive service (many senders at once)."""
+    global receiving_mode, receive_service
+
+    try:
+        receive_service = ReceiveService(port=PORT, save_codec=RECEIVED_CODEC, code=VERIFICATION_CODE)
+        receive_service.start()
+    except Exception as e:
+        print(f"\n❌ Error in receive server: {e}")
+        receive_service = None
+        return
+    receiving_mode = True
+    peer_discovery.set_caps(RECEIVE)
+    print("\n📱 Ready to receive screenshots!")
 
 def detect_gestures():
     """Detects hand gestures for taking, sending, and receiving screenshots."""
-    global receive_thread, receiving_mode
-    
+    global receiving_mode, transfer_manager, peer_discovery
+
+    # Announce ourselves and listen for the other devices while the role is chosen
+    peer_discovery = Discovery(port=PORT).start()
+
     # Setup connection role
     role = setup_connection()
     
     # Start receive server immediately if we're the receiver
     if role == "receiver":
-        receive_thread = start_receive_server()
-        receive_thread.start()
+        start_receive_server()
     
     # Try different camera indices
-    for camera_index in [0, 1, -1]:
-        try:
-            print(f"Trying to open camera {camera_index}")
-            cap = cv2.VideoCapture(camera_index)
-            
-            if not cap.isOpened():
-                print(f"Failed to open camera {camera_index}")
-                continue
-                
-            print(f"Successfully opened camera {camera_index}")
-            break
-        except Exception as e:
-            print(f"Error opening camera {camera_index}: {e}")
-            continue
-    else:
+    cap = open_camera()
+    if cap is None:
         print("Error: Could not open any camera")
         return
 
-    screenshot_taken = False
+    # Gestures fire once they've held steady for a few frames; the flow only
+    # lets a fist send after two fingers took a screenshot. Receivers ignore gestures
+    flow = GestureFlow(READY, {
+        (READY, TWO_FINGERS): (CAPTURED, take_screenshot),
+        (CAPTURED, FIST): (READY, send_screenshot),
+    } if role == "sender" else {})
     
     print("\n👋 Gesture Controls:")
     if role == "sender":
         print("✌  Two Fingers to take screenshot")
         print("✊  Closed Fist to send screenshot")
-    print("Press 'q' to quit\n")
+    if HEADLESS:
+        print("Running headless: no preview window. Press Ctrl+C to quit\n")
+    else:
+        print("Press 'c' to cancel transfers in progress")
+        if METRICS_ENABLED:
+            print("Press 'm' to toggle the metrics overlay")
+        print("Press 'q' to quit\n")
     
+    # Sends run on background workers so the gesture loop keeps its frame rate;
+    # repeat screenshots to the same peer only carry the tiles that changed
+    transfer_manager = TransferManager(PORT, on_status=report_transfer, tile_cache=PeerTileCache(),
+                                       codec_selector=CodecSelector(ALLOW_LOSSY) if ADAPTIVE_CODEC else None,
+                                       code=VERIFICATION_CODE)
+
+    # Grab frames on their own thread so gestures are always read from the newest frame
+    grabber = FrameGrabber(cap).start()
+    preview = PreviewRenderer("AirShare - Gesture Recognition", PREVIEW_FPS, headless=HEADLESS)
+    metrics.serve()
+    metrics.start_log("metrics.jsonl")
+
     try:
         while True:
-            ret, frame = cap.read()
+            timer = metrics.frame()
+            ret, frame = grabber.read()
             if not ret:
                 print("Error: Couldn't read frame from camera")
                 break
+            timer.mark("cap.read")
 
-            frame = cv2.flip(frame, 1)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
+            # Mirror, track, classify and vote, exactly as the replay benchmarks do
             try:
-                result = hands.process(rgb_frame)
+                step = pipeline.process(frame)
             except Exception as e:
                 print(f"Error processing frame: {e}")
+                timer.end()
+                continue
+            frame, result = step.frame, step.result
+            timer.add(step.timings)
+
+            # Only gestures that held steady for a few frames arrive here
+            try:
+                for gesture in step.events:
+                    flow.fire(gesture)
+            except Exception as e:
+                print(f"Error handling gesture: {e}")
+            timer.mark("gestures")
+            metrics.set("frames_dropped", grabber.dropped)
+            metrics.set("inference_duty_cycle", scheduler.duty_cycle)
+
+            # Every frame goes through the pipeline; only some are drawn and shown
+            if not preview.due():
+                timer.end()
                 continue
 
             if result.multi_hand_landmarks and role == "sender":
                 for hand_landmarks in result.multi_hand_landmarks:
-                    try:
-                        mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-                        
-                        landmarks = hand_landmarks.landmark
-                        thumb_tip = landmarks[mp_hands.HandLandmark.THUMB_TIP].y
-                        index_tip = landmarks[mp_hands.HandLandmark.INDEX_FINGER_TIP].y
-                        middle_tip = landmarks[mp_hands.HandLandmark.MIDDLE_FINGER_TIP].y
-                        ring_tip = landmarks[mp_hands.HandLandmark.RING_FINGER_TIP].y
-                        pinky_tip = landmarks[mp_hands.HandLandmark.PINKY_TIP].y
-
-                        # Gesture: Two Fingers Up (Take Screenshot)
-                        if (index_tip < thumb_tip and middle_tip < thumb_tip and
-                            ring_tip > index_tip and pinky_tip > index_tip and not screenshot_taken):
-                            try:
-                                screenshot = pyautogui.screenshot()
-                                screenshot.save(screenshot_path)
-                                screenshot_taken = True
-                                print("\n📸 Screenshot taken!")
-                                time.sleep(1)
-                            except Exception as e:
-                                print(f"Error taking screenshot: {e}")
-                        
-                        # Gesture: Closed Fist (Send Screenshot)
-                        elif (index_tip > thumb_tip and middle_tip > thumb_tip and
-                              ring_tip > thumb_tip and pinky_tip > thumb_tip and screenshot_taken):
-                            send_screenshot()
-                            screenshot_taken = False
-                            
-                    except Exception as e:
-                        print(f"Error processing hand landmarks: {e}")
-                        continue
+                    mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
+            timer.mark("draw_landmarks")
 
             # Add status text to the frame
             if role == "sender":
                 status_text = "Ready"
-                if screenshot_taken:
+                if flow.state == CAPTURED:
                     status_text = "Screenshot taken - Ready to send"
             else:
                 status_text = "Receiving mode active"
             
             cv2.putText(frame, status_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-            cv2.imshow("AirShare - Gesture Recognition", frame)
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
+            # Show background transfers; the loop never waits for them
+            for i, job in enumerate(transfer_manager.recent_jobs()[-3:]):
+                cv2.putText(frame, job.describe(), (10, 60 + i * 25), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+            inference_text = f"Inference: {scheduler.inference_ms:.1f} ms ({scheduler.mode})"
+            cv2.putText(frame, inference_text, (frame.shape[1] - 260, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+            metrics.draw(frame)
+            timer.mark("putText")
+
+            preview.draw(frame)
+            timer.mark("imshow")
+            key = preview.poll()
+            timer.mark("waitKey")
+            timer.end()
+            if key == ord('q'):
                 break
+            elif key == ord('c'):
+                transfer_manager.cancel_all()
+            elif key == ord('m'):
+                metrics.overlay = not metrics.overlay
 
+    except KeyboardInterrupt:
+        pass
     except Exception as e:
         print(f"Unexpected error: {e}")
     
     finally:
         print("\nCleaning up...")
+        transfer_manager.shutdown()
+        screenshot_encoder.shutdown()
+        metrics.stop()
         receiving_mode = False
+        if receive_service:
+            receive_service.stop()
+        peer_discovery.stop()
+        grabber.stop()
+        print(f"Dropped {grabber.dropped} of {grabber.grabbed} camera frames to stay on the newest one")
+        print(f"Ran {scheduler.describe()}")
         cap.release()
-        cv2.destroyAllWindows()
+        preview.close()
 
 if __name__ == "__main__":
+    # A headless run is stopped with SIGTERM as cleanly as with Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
     detect_gestures()
\ No newline at end of file
@@ -0,0 +1,71 @@
+import argparse
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from codec_select import CodecSelector
+from screenshot_encoder import CODECS, LOSSY_CODECS, encode_image
+
+
+def synthetic_screenshot(width, height, seed=0):
+    """A desktop-like image: flat panels and lines of text, plus a noisy photo in one corner."""
+    rng = np.random.default_rng(seed)
+    image = Image.new("RGB", (width, height), (243, 244, 246))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, width, 40], fill=(30, 41, 59))
+    draw.rectangle([0, 40, width // 7, height], fill=(226, 232, 240))
+    for y in range(60, height - 20, 18):
+        x = width // 7 + 20
+        while x < width * 0.6:
+            word = "".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), rng.integers(2, 10)))
+            draw.text((x, y), word, fill=(15, 23, 42))
+            x += 8 * len(word) + 6
+    rows, cols = np.mgrid[0:height * 3 // 8, 0:width * 5 // 16]
+    photo = np.stack([(cols * 0.4 + rows * 0.2) % 255, (rows * 0.5) % 255, (cols * 0.3) % 255], -1)
+    photo = np.clip(photo + rng.normal(0, 12, photo.shape), 0, 255).astype(np.uint8)
+    image.paste(Image.fromarray(photo), (width - photo.shape[1] - 40, height // 5))
+    return image
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gesture-to-delivered time of each screenshot codec per link speed")
+    parser.add_argument("--links-mbit", default="1000,300,100,30,10,3", help="comma-separated link speeds in Mbit/s")
+    parser.add_argument("--size", default="1920x1080", help="screenshot size")
+    parser.add_argument("--repeat", type=int, default=3, help="encodes per codec (best is reported)")
+    parser.add_argument("--lossy", action="store_true", help="let the selector pick jpeg and webp too")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    image = synthetic_screenshot(width, height)
+    selector = CodecSelector(allow_lossy=args.lossy)
+    encoded = {}
+    for codec in CODECS:
+        runs = [encode_image(image, codec) for _ in range(args.repeat)]
+        for run in runs:
+            selector.record_encode(run)
+        encoded[codec] = min(runs, key=lambda run: run.encode_ms)
+
+    print(f"{width}x{height} synthetic screenshot\n")
+    print(f"{'codec':<15}{'encode ms':>11}{'KB':>8}")
+    for codec, image_data in encoded.items():
+        print(f"{codec:<15}{image_data.encode_ms:>11.1f}{image_data.size / 1024:>8.0f}")
+
+    # Delivered time = encode + size over the link; the receiver's own save isn't counted
+    links = [float(link) for link in args.links_mbit.split(",")]
+    print(f"\n{'Mbit/s':>8}" + "".join(f"{codec:>15}" for codec in CODECS) + f"{'chosen':>16}{'vs png-fast':>13}")
+    for link in links:
+        peer = f"{link:g} Mbit/s"
+        rate = link * 1e6 / 8
+        selector.record_transfer(peer, rate, 1.0)
+        delivered = {codec: e.encode_ms + e.size / rate * 1000 for codec, e in encoded.items()}
+        chosen = selector.choose(peer)
+        best = min((codec for codec in delivered if args.lossy or codec not in LOSSY_CODECS), key=delivered.get)
+        row = "".join(f"{delivered[codec]:>15.0f}" for codec in CODECS)
+        mark = "" if chosen == best else f" (best {best})"
+        print(f"{link:>8g}{row}{chosen:>16}{delivered['png-fast'] / delivered[chosen]:>12.2f}x{mark}")
+    print("\nTimes are ms from starting the encode to the last byte arriving; "
+          "'vs png-fast' is the speedup of the chosen codec over the old fixed one")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import argparse
+import os
+import shutil
+import socket
+import statistics
+import tempfile
+import time
+
+import discovery
+import protocol
+from receive_service import ReceiveService
+
+
+def free_port(kind=socket.SOCK_STREAM):
+    """A port nothing is listening on right now."""
+    with socket.socket(socket.AF_INET, kind) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_once(payload, output_dir, multicast, interval):
+    """Start a fresh sender next to a running receiver; return (resolve ms, first transfer ms)."""
+    port = free_port()
+    service = ReceiveService(port=port, output_dir=output_dir)
+    service.start()
+
+    if multicast:
+        group_port = free_port(socket.SOCK_DGRAM)
+        receiver_targets = sender_targets = [(discovery.MULTICAST_GROUP, group_port)]
+        receiver_port = sender_port = group_port
+    else:
+        receiver_port, sender_port = free_port(socket.SOCK_DGRAM), free_port(socket.SOCK_DGRAM)
+        receiver_targets, sender_targets = [("127.0.0.1", sender_port)], [("127.0.0.1", receiver_port)]
+
+    receiver = discovery.Discovery(name="receiver", port=port, caps=[discovery.RECEIVE], discovery_port=receiver_port,
+                                   targets=receiver_targets, interval=interval, address="127.0.0.1").start()
+    # Let the receiver settle into its announce cycle, as a long-running instance would be
+    time.sleep(interval / 2)
+
+    start = time.perf_counter()
+    sender = discovery.Discovery(name="sender", discovery_port=sender_port, targets=sender_targets,
+                                 interval=interval, address="127.0.0.1").start()
+    try:
+        peer = sender.wait_for_peer(timeout=10 * interval)
+        resolved = time.perf_counter()
+        if peer is None:
+            raise RuntimeError("receiver was never discovered")
+        protocol.send_to(peer.address, peer.port, payload)
+        finished = time.perf_counter()
+    finally:
+        sender.stop()
+        receiver.stop()
+        service.stop()
+    return (resolved - start) * 1000, (finished - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from starting a sender to its first completed transfer")
+    parser.add_argument("--size-kb", type=int, default=512, help="payload size in KB")
+    parser.add_argument("--repeat", type=int, default=5, help="runs (median and worst are reported)")
+    parser.add_argument("--interval", type=float, default=discovery.ANNOUNCE_INTERVAL,
+                        help="seconds between announcements")
+    parser.add_argument("--multicast", action="store_true",
+                        help="announce to the multicast group instead of loopback unicast")
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_kb * 1024)
+    output_dir = tempfile.mkdtemp(prefix="airshare_bench_")
+    resolves, transfers = [], []
+    try:
+        for _ in range(args.repeat):
+            resolve_ms, transfer_ms = run_once(payload, output_dir, args.multicast, args.interval)
+            resolves.append(resolve_ms)
+            transfers.append(transfer_ms)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    mode = "multicast" if args.multicast else "loopback unicast"
+    print(f"Payload: {args.size_kb} KB, {mode}, announce interval {args.interval:.1f} s, {args.repeat} runs\n")
+    print(f"{'stage':<28}{'median ms':>12}{'worst ms':>12}")
+    print(f"{'peer resolved':<28}{statistics.median(resolves):>12.1f}{max(resolves):>12.1f}")
+    print(f"{'first transfer complete':<28}{statistics.median(transfers):>12.1f}{max(transfers):>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
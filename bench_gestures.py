@@ -0,0 +1,149 @@
+import argparse
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from gesture_engine import FIST, OPEN_PALM, TWO_FINGERS
+from pipeline import STAGES, GesturePipeline
+from recording import Recorder, Recording, ReplayResult, replay
+
+SYNTHETIC_POSES = {TWO_FINGERS: [0, 1, 1, 0, 0], FIST: [0, 0, 0, 0, 0], OPEN_PALM: [1, 1, 1, 1, 1]}
+
+# Finger joints (MCP, PIP, DIP, tip) on a hand with the wrist at the origin and
+# the middle knuckle one unit above it, straight and curled into the palm
+_KNUCKLES = [(-0.35, -0.95), (-0.12, -1.0), (0.1, -0.97), (0.3, -0.88)]
+_STRAIGHT = np.array([[0, 0], [0, -0.4], [0, -0.7], [0, -0.95]])
+_CURLED = np.array([[0, 0], [0, -0.4], [0, -0.15], [0, 0.1]])
+_THUMB_OUT = np.array([[-0.25, -0.25], [-0.5, -0.5], [-0.8, -0.65], [-1.1, -0.8]])
+_THUMB_IN = np.array([[-0.25, -0.25], [-0.5, -0.5], [-0.4, -0.75], [-0.1, -0.8]])
+
+
+def synthetic_hand(extension, angle, scale, center, frame_size, rng, jitter=0.03):
+    """(21, 3) landmarks, normalized to the frame like MediaPipe's, for a hand with the given finger extensions."""
+    points = np.zeros((21, 3))
+    e = extension[0]
+    points[1:5, :2] = _THUMB_IN + e * (_THUMB_OUT - _THUMB_IN)
+    for finger, knuckle in enumerate(_KNUCKLES):
+        e = extension[finger + 1]
+        points[5 + 4 * finger:9 + 4 * finger, :2] = np.array(knuckle) + _CURLED + e * (_STRAIGHT - _CURLED)
+    points[:, :2] += rng.normal(0, jitter, (21, 2))
+    cos, sin = np.cos(angle), np.sin(angle)
+    points[:, :2] = points[:, :2] @ np.array([[cos, sin], [-sin, cos]]) * scale + center
+    points[:, 0] *= frame_size[1] / frame_size[0]  # MediaPipe x is a fraction of the width
+    return points.astype(np.float32)
+
+
+def synthesize(path, seconds, fps=30, seed=0, frame_size=(640, 480), glitch_rate=0.04):
+    """Write a landmark-only recording of random gestures, with relaxed hands and misread frames in between."""
+    rng = np.random.default_rng(seed)
+    gestures = list(SYNTHETIC_POSES)
+    with Recorder(path, frames=False) as recorder:
+        t = 0.0
+        while t < seconds:
+            label = gestures[rng.integers(len(gestures))] if rng.random() < 0.7 else None
+            target = np.array(SYNTHETIC_POSES[label] if label else rng.uniform(0.3, 0.7, 5), dtype=float)
+            hold = rng.uniform(0.8, 2.0)
+            angle, scale = rng.uniform(-0.6, 0.6), rng.uniform(0.15, 0.3)
+            center = rng.uniform(0.35, 0.65, 2)
+            present = rng.random() > 0.1
+            for _ in range(int(hold * fps)):
+                extension = target
+                if rng.random() < glitch_rate:  # a misread frame: some other gesture for a moment
+                    extension = np.array(SYNTHETIC_POSES[gestures[rng.integers(len(gestures))]], dtype=float)
+                hands = [synthetic_hand(extension, angle, scale, center, frame_size, rng)] if present else []
+                recorder.add(result=ReplayResult(hands, None), label=label if present else None,
+                             timestamp=t, frame_size=frame_size)
+                t += 1 / fps
+
+
+def evaluate(recording, steps):
+    """Per-gesture detection latency and recall, false triggers and per-frame accuracy."""
+    fired = {}  # frame index -> gestures that fired
+    correct = judged = 0
+    for i, step in steps:
+        if step.events:
+            fired[i] = step.events
+        if step.poses:
+            judged += 1
+            correct += step.poses[0].gesture == recording.label(i)
+
+    stats = {gesture: {"segments": 0, "latencies": []} for gesture in recording.labels}
+    claimed = set()
+    for label, first, last in recording.segments():
+        stats[label]["segments"] += 1
+        for i in range(first, last + 1):
+            if label in fired.get(i, ()):
+                stats[label]["latencies"].append((recording.timestamps[i] - recording.timestamps[first]) * 1000)
+                claimed.add((i, label))
+                break
+    false_triggers = sum(1 for i, events in fired.items() for gesture in events if (i, gesture) not in claimed)
+    return stats, false_triggers, correct / judged if judged else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gesture pipeline fps, detection latency and accuracy on a recording")
+    parser.add_argument("recording", nargs="?", help="recording made with recording.py (omit to use a synthetic one)")
+    parser.add_argument("--landmarks-only", action="store_true",
+                        help="replay recorded landmarks even if the recording has frames (no MediaPipe needed)")
+    parser.add_argument("--speed", type=float, default=None, help="replay at this multiple of real time (default: max)")
+    parser.add_argument("--seconds", type=float, default=120, help="length of the synthetic recording")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic recording")
+    args = parser.parse_args()
+
+    workdir = None
+    path = args.recording
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix="airshare_bench_")
+        path = f"{workdir}/synthetic"
+        synthesize(path, args.seconds, seed=args.seed)
+
+    try:
+        recording = Recording(path)
+        use_frames = recording.has_frames and not args.landmarks_only
+        tracker = None
+        if use_frames:
+            import mediapipe as mp
+
+            from hand_tracker import HandTracker
+            tracker = HandTracker(mp.solutions.hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7))
+        pipeline = GesturePipeline(tracker)
+
+        timings = {stage: [] for stage in STAGES}
+        steps = []
+        start = time.perf_counter()
+        for i, step in replay(recording, pipeline, use_frames, args.speed):
+            steps.append((i, step))
+            for stage, ms in step.timings.items():
+                timings[stage].append(ms)
+        elapsed = time.perf_counter() - start
+        stats, false_triggers, accuracy = evaluate(recording, steps)
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    source = "frames through MediaPipe" if use_frames else "recorded landmarks"
+    duration = float(recording.timestamps[-1]) if len(recording) else 0.0
+    print(f"{path if workdir is None else 'synthetic recording'}: {len(recording)} frames, {duration:.0f} s, "
+          f"replaying {source}\n")
+    print(f"Throughput: {len(steps) / elapsed:.0f} fps")
+    for stage in STAGES:
+        if timings[stage]:
+            print(f"  {stage:<14}{statistics.mean(timings[stage]):>8.3f} ms/frame")
+
+    print(f"\n{'gesture':<14}{'segments':>10}{'detected':>10}{'p50 ms':>10}{'p90 ms':>10}")
+    for gesture, stat in stats.items():
+        latencies = sorted(stat["latencies"])
+        if not stat["segments"]:
+            continue
+        p50 = f"{latencies[len(latencies) // 2]:.0f}" if latencies else "-"
+        p90 = f"{latencies[min(len(latencies) - 1, int(0.9 * len(latencies)))]:.0f}" if latencies else "-"
+        print(f"{gesture:<14}{stat['segments']:>10}{len(latencies):>10}{p50:>10}{p90:>10}")
+    print(f"\nFalse triggers: {false_triggers}")
+    print(f"Per-frame classification accuracy: {accuracy:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import transfer
+
+
+def legacy_receive(conn, size, path):
+    """The original receive_server loop: 1024-byte recv() and bytes concatenation."""
+    received_data = b""
+    while len(received_data) < size:
+        data = conn.recv(1024)
+        if not data:
+            break
+        received_data += data
+    with open(path, 'wb') as f:
+        f.write(received_data)
+
+
+def streaming_receive(conn, size, path):
+    transfer.receive_file(conn, size, path)
+
+
+METHODS = {"legacy": legacy_receive, "streaming": streaming_receive}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024  # bytes on macOS
+    return peak / 1024  # KB on Linux
+
+
+def run_worker(method, size):
+    """Receive `size` bytes over loopback with one method and print a JSON result line."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+
+    def sender():
+        block = memoryview(os.urandom(1024 * 1024))
+        with socket.create_connection(('127.0.0.1', port)) as s:
+            remaining = size
+            while remaining > 0:
+                n = min(remaining, len(block))
+                s.sendall(block[:n])
+                remaining -= n
+
+    baseline = peak_rss_mb()
+    threading.Thread(target=sender, daemon=True).start()
+    conn, _ = server.accept()
+    fd, path = tempfile.mkstemp(prefix="airshare_bench_", suffix=".bin")
+    os.close(fd)
+    try:
+        with conn:
+            start = time.perf_counter()
+            METHODS[method](conn, size, path)
+            elapsed = time.perf_counter() - start
+    finally:
+        os.remove(path)
+        server.close()
+
+    print(json.dumps({
+        "method": method,
+        "size": size,
+        "seconds": elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "baseline_rss_mb": baseline,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmark for the screenshot receive path")
+    parser.add_argument("--sizes-mb", default="1,16,128,1024", help="comma separated payload sizes in MB")
+    parser.add_argument("--legacy-max-mb", type=float, default=4,
+                        help="skip the legacy loop above this size (it is quadratic and holds the whole file in RAM)")
+    parser.add_argument("--worker", nargs=2, metavar=("METHOD", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]))
+        return
+
+    print(f"{'size MB':>8}  {'method':<10}{'MB/s':>10}{'seconds':>10}{'peak RSS MB':>14}{'growth MB':>12}")
+    for size_mb in (float(s) for s in args.sizes_mb.split(",")):
+        size = int(size_mb * 1024 * 1024)
+        for method in METHODS:
+            if method == "legacy" and size_mb > args.legacy_max_mb:
+                print(f"{size_mb:>8g}  {method:<10}{'skipped':>10}")
+                continue
+            # Each case runs in a fresh process so peak RSS isn't polluted by earlier runs
+            output = subprocess.run([sys.executable, __file__, "--worker", method, str(size)],
+                                    capture_output=True, text=True, check=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            growth = result["peak_rss_mb"] - result["baseline_rss_mb"]
+            print(f"{size_mb:>8g}  {method:<10}{size / 1024 / 1024 / result['seconds']:>10.1f}"
+                  f"{result['seconds']:>10.3f}{result['peak_rss_mb']:>14.1f}{growth:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import argparse
+
+import numpy as np
+
+from recording import ReplayResult
+from scheduler import POLICIES, InferenceScheduler
+
+FRAME_SIZE = (320, 240)
+
+
+class FakeTracker:
+    """Stands in for HandTracker: "finds" a hand whenever the scene has one, at a fixed price."""
+
+    def __init__(self, inference_ms):
+        self.inference_ms = inference_ms
+        self.mode = "search"
+        self.present = False
+
+    def process(self, rgb_frame):
+        return ReplayResult([object()] if self.present else [], None)
+
+    def reset(self):
+        pass
+
+
+class Scene:
+    """A kiosk camera: a textured room with sensor noise and slow light changes, and someone
+    who now and then walks in, shows a hand for a few seconds and leaves."""
+
+    def __init__(self, seconds, fps, seed, drift):
+        self.rng = np.random.default_rng(seed)
+        self.fps = fps
+        self.drift = drift
+        width, height = FRAME_SIZE
+        self.room = self.rng.integers(40, 200, (height // 8, width // 8, 3)).astype(np.float32)
+        self.room = np.kron(self.room, np.ones((8, 8, 1), np.float32))
+        self.noise = self.rng.normal(0, 3, (16,) + self.room.shape).astype(np.float32)  # cycled, to keep it fast
+        self.visits = []  # (arrive, hand from, hand until, leave) in seconds
+        t = self.rng.uniform(5, 20)
+        while t < seconds:
+            hand = t + self.rng.uniform(0.3, 1.0)
+            until = hand + self.rng.uniform(2, 6)
+            self.visits.append((t, hand, until, until + self.rng.uniform(0.3, 1.0)))
+            t = until + self.rng.uniform(10, 60)
+
+    def frame(self, t):
+        """(rgb frame, hand visible?) at time t."""
+        light = 1 + self.drift * np.sin(t / 30)
+        frame = self.room * light + self.noise[int(t * self.fps) % len(self.noise)]
+        hand = False
+        for arrive, hand_from, hand_until, leave in self.visits:
+            if arrive <= t < leave:
+                # A person-sized block that walks in from the left and sways while standing
+                width, height = FRAME_SIZE
+                x = int(min(1, (t - arrive) / 0.5) * width / 3 + 10 * np.sin(3 * t))
+                frame[height // 6:, x:x + width // 3] = (150, 120, 100)
+                hand = hand_from <= t < hand_until
+                if hand:
+                    frame[height // 10:height // 4, x + width // 3:x + width // 3 + width // 10] = (200, 160, 140)
+        return np.clip(frame, 0, 255).astype(np.uint8), hand
+
+
+def run(policy, scene, seconds, inference_ms):
+    clock = [0.0]
+    tracker = FakeTracker(inference_ms)
+    scheduler = InferenceScheduler(tracker, policy, clock=lambda: clock[0])
+    hand_since, latencies, missed_frames = None, [], 0
+    for i in range(int(seconds * scene.fps)):
+        clock[0] = i / scene.fps
+        frame, tracker.present = scene.frame(clock[0])
+        result = scheduler.process(frame)
+        if tracker.present:
+            if hand_since is None:
+                hand_since = clock[0]
+            if result.multi_hand_landmarks:
+                if hand_since is not False:
+                    latencies.append((clock[0] - hand_since) * 1000)
+                    hand_since = False
+            else:
+                missed_frames += 1
+        else:
+            hand_since = None
+    return scheduler, latencies, missed_frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference duty cycle and wake-up latency of each scheduler policy")
+    parser.add_argument("--seconds", type=float, default=600, help="length of the synthetic kiosk day")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--inference-ms", type=float, default=12.0, help="assumed cost of one hands.process()")
+    parser.add_argument("--drift", type=float, default=0.15, help="amplitude of the slow light change")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.seconds:.0f} s at {args.fps} fps, {args.inference_ms:g} ms per inference\n")
+    print(f"{'policy':<12}{'duty':>7}{'wakeups':>9}{'saved s':>9}{'gate ms/frame':>15}{'first hand ms':>15}"
+          f"{'missed':>8}")
+    for policy in POLICIES:
+        scene = Scene(args.seconds, args.fps, args.seed, args.drift)
+        scheduler, latencies, missed = run(policy, scene, args.seconds, args.inference_ms)
+        stats = scheduler.stats()
+        worst = f"{max(latencies):.0f}" if latencies else "-"
+        print(f"{policy:<12}{stats['duty_cycle']:>7.1%}{stats['wakeups']:>9}{stats['saved_ms'] / 1000:>9.1f}"
+              f"{scheduler.gate_ms / stats['frames']:>15.3f}{worst:>15}{missed:>8}")
+    print(f"\n{len(scene.visits)} visits; 'first hand ms' is the worst delay before a shown hand was seen, "
+          f"'missed' counts frames with a hand that skipped inference")
+
+
+if __name__ == "__main__":
+    main()
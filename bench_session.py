@@ -0,0 +1,133 @@
+import argparse
+import contextlib
+import io
+import os
+import queue
+import random
+import shutil
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import protocol
+import session
+import transfer
+from receive_service import ReceiveService
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_delay_proxy(target_port, delay, loss=0.0, rto=0.2):
+    """Loopback TCP relay that holds data for `delay` seconds each way, like a Wi-Fi hop.
+
+    Only data is delayed: the kernel completes the relay's TCP handshake at
+    once, so connecting still looks free and per-connection sends look
+    better than they would on a real link. With `loss`, each relayed read is
+    "lost" with that probability and held `rto` seconds longer, stalling
+    everything behind it the way a TCP retransmission does.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(64)
+
+    def pump(src, dst):
+        pending = queue.Queue()
+
+        def deliver():
+            while True:
+                due, data = pending.get()
+                time.sleep(max(0.0, due - time.monotonic()))
+                try:
+                    if data is None:
+                        dst.shutdown(socket.SHUT_WR)
+                        break
+                    dst.sendall(data)
+                except OSError:
+                    break
+
+        threading.Thread(target=deliver, daemon=True).start()
+        while True:
+            try:
+                data = src.recv(256 * 1024)
+            except OSError:
+                data = b""
+            due = time.monotonic() + delay
+            if data and loss and random.random() < loss:
+                due += rto
+            pending.put((due, data or None))
+            if not data:
+                break
+
+    def accept():
+        while True:
+            client, _ = server.accept()
+            upstream = socket.create_connection(('127.0.0.1', target_port))
+            for src, dst in ((client, upstream), (upstream, client)):
+                src.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                threading.Thread(target=pump, args=(src, dst), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def measure(send, payloads):
+    """Latency of each send in ms."""
+    latencies = []
+    for payload in payloads:
+        start = time.perf_counter()
+        send(payload)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send latency of small screenshots: new connection per send vs. a session")
+    parser.add_argument("--sizes-kb", default="50,200,800", help="comma separated payload sizes in KB")
+    parser.add_argument("--count", type=int, default=50, help="sends per method and size")
+    parser.add_argument("--rtt-ms", type=float, default=10, help="round trip added by a delaying relay (0 for none)")
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix="airshare_bench_")
+    service = ReceiveService(port=free_port(), output_dir=output_dir, host='127.0.0.1')
+    service.start()
+    port = start_delay_proxy(service.port, args.rtt_ms / 2000) if args.rtt_ms else service.port
+    peer_session = session.Session('127.0.0.1', port).connect()
+
+    methods = [
+        ("connect + size/ACK (original)", lambda p: transfer.send_to('127.0.0.1', port, p)),
+        ("connect + framed", lambda p: protocol.send_to('127.0.0.1', port, p)),
+        ("session stream", peer_session.send),
+    ]
+
+    print(f"Loopback with {args.rtt_ms:.0f} ms RTT, {args.count} sends per row "
+          f"(the original format returns before the receiver has the file)\n")
+    print(f"{'method':<32}{'KB':>6}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    try:
+        for size_kb in (int(s) for s in args.sizes_kb.split(",")):
+            # Distinct payloads so no transfer is ever mistaken for a resume of another
+            payloads = [os.urandom(size_kb * 1024) for _ in range(args.count)]
+            for name, send in methods:
+                with contextlib.redirect_stdout(io.StringIO()):  # the receiver prints every file
+                    latencies = measure(send, payloads)
+                print(f"{name:<32}{size_kb:>6}{percentile(latencies, 0.5):>10.2f}"
+                      f"{percentile(latencies, 0.99):>10.2f}{statistics.mean(latencies):>10.2f}")
+    finally:
+        peer_session.close()
+        service.stop()
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import protocol
+import session
+import transfer
+from bench_receive import peak_rss_mb
+from bench_session import free_port, percentile, start_delay_proxy
+from receive_service import ReceiveService
+from transfer_manager import DONE, TransferManager
+
+ID_SIZE = 8  # each payload starts with a transfer id, so the receiver can tell which one just arrived
+CASE_TIMEOUT = 300  # seconds a case may take before its missing transfers count as errors
+ENGINES = ("original", "sized", "framed", "session", "secure", "manager")
+CHUNKED = ("original", "framed")  # engines whose chunk size is swept; the rest use their defaults
+BENCH_CODE = "2468"  # verification code of the "secure" engine's encrypted session
+
+
+def original_send(chunk_size):
+    """send_screenshot's first loop: size, ACK, then `chunk_size`-byte (1024 originally) sends."""
+    def send(sock, payload, progress=None, cancel=None):
+        sock.sendall(str(len(payload)).encode())
+        sock.recv(1024)
+        view = memoryview(payload)
+        for start in range(0, len(view), chunk_size):
+            sock.sendall(view[start:start + chunk_size])
+    return send
+
+
+class Engine:
+    """One way of getting a payload to the receiver; `send` blocks until the sender is done with it."""
+
+    def __init__(self, name, port, chunk_size, concurrency):
+        self.name = name
+        self.port = port
+        self.chunk_size = chunk_size
+        self._session = None
+        self._manager = None
+        if name in ("session", "secure"):
+            code = BENCH_CODE if name == "secure" else None
+            self._session = session.Session('127.0.0.1', port, code=code).connect()
+        elif name == "manager":
+            # What send_screenshot() really does: queue on the manager and let its workers send
+            self._manager = TransferManager(port, workers=concurrency)
+            self._manager.connect('127.0.0.1')
+
+    def send(self, payload):
+        if self.name == "original":
+            transfer.send_to('127.0.0.1', self.port, payload, send=original_send(self.chunk_size))
+        elif self.name == "sized":
+            transfer.send_to('127.0.0.1', self.port, payload)
+        elif self.name == "framed":
+            protocol.send_to('127.0.0.1', self.port, payload, chunk_size=self.chunk_size)
+        elif self._session:
+            self._session.send(payload)
+        else:
+            job = self._manager.submit('127.0.0.1', payload)
+            job.finished.wait()
+            if job.status != DONE:
+                raise RuntimeError(f"transfer {job.status}: {job.error}")
+
+    def close(self):
+        if self._session:
+            self._session.close()
+        if self._manager:
+            self._manager.shutdown()
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_case(case):
+    """Run one benchmark case in this process and return its result dict.
+
+    Latency runs from just before the sender starts until the receiver has
+    the whole file on disk, so engines that return before the receiver is
+    done (the size/ACK format) are timed the same as those that wait.
+    """
+    baseline_rss = peak_rss_mb()
+    output_dir = tempfile.mkdtemp(prefix="airshare_bench_")
+    started, latencies, errors = {}, [], []
+    arrived = threading.Condition()
+
+    def on_received(path, addr):
+        with open(path, 'rb') as f:
+            transfer_id = f.read(ID_SIZE)
+        os.remove(path)
+        with arrived:
+            latencies.append((time.perf_counter() - started[transfer_id]) * 1000)
+            arrived.notify_all()
+
+    size, total = case["size"], case["concurrency"] * case["count"]
+    service = ReceiveService(port=free_port(), output_dir=output_dir, host='127.0.0.1', on_received=on_received,
+                             code=BENCH_CODE if case["engine"] == "secure" else None)
+    service.start()
+    port = service.port
+    if case["rtt_ms"] or case["loss"]:
+        port = start_delay_proxy(service.port, case["rtt_ms"] / 2000, case["loss"])
+    engine = Engine(case["engine"], port, case["chunk"], case["concurrency"])
+    filler = os.urandom(size)
+    ids = itertools.count()
+
+    def worker():
+        for _ in range(case["count"]):
+            transfer_id = next(ids).to_bytes(ID_SIZE, "big")
+            payload = transfer_id + filler[ID_SIZE:]  # distinct, so a framed send is never taken for a resume
+            started[transfer_id] = time.perf_counter()
+            try:
+                engine.send(payload)
+            except Exception as e:
+                errors.append(str(e))
+
+    cpu_start = cpu_seconds()
+    wall_start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(case["concurrency"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    with arrived:
+        arrived.wait_for(lambda: len(latencies) + len(errors) >= total, CASE_TIMEOUT)
+    wall = time.perf_counter() - wall_start
+    cpu = cpu_seconds() - cpu_start
+
+    engine.close()
+    service.stop()
+    shutil.rmtree(output_dir, ignore_errors=True)
+    received_mb = len(latencies) * size / 1024 / 1024
+    return dict(case, transfers=len(latencies), errors=total - len(latencies), first_error=errors[0] if errors else None,
+                seconds=wall, throughput_mb_s=received_mb / wall if wall else 0.0,
+                latency_ms={"p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99),
+                            "mean": sum(latencies) / len(latencies)} if latencies else None,
+                cpu_seconds=cpu, cpu_ms_per_mb=cpu * 1000 / received_mb if received_mb else None,
+                peak_rss_mb=peak_rss_mb(), rss_growth_mb=peak_rss_mb() - baseline_rss)
+
+
+def build_cases(args):
+    links = [tuple(float(v) for v in link.split(":")) for link in args.links.split(",")]
+    for engine in args.engines.split(","):
+        if engine not in ENGINES:
+            raise SystemExit(f"Unknown engine {engine!r}; choose from {', '.join(ENGINES)}")
+        chunks = [int(c) for c in args.chunks.split(",")] if engine in CHUNKED else [None]
+        for size_kb, chunk, concurrency, (rtt_ms, loss) in itertools.product(
+                (int(s) for s in args.sizes_kb.split(",")), chunks,
+                (int(c) for c in args.concurrency.split(",")), links):
+            yield {"engine": engine, "size": size_kb * 1024, "chunk": chunk, "concurrency": concurrency,
+                   "rtt_ms": rtt_ms, "loss": loss, "count": args.count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback transfer benchmark suite with a JSON report")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="comma separated: " + ", ".join(ENGINES))
+    parser.add_argument("--sizes-kb", default="64,1024,16384", help="comma separated payload sizes in KB")
+    parser.add_argument("--chunks", default="1024,65536,262144",
+                        help="chunk sizes in bytes for the original and framed engines")
+    parser.add_argument("--concurrency", default="1,4", help="comma separated numbers of simultaneous senders")
+    parser.add_argument("--links", default="0:0,20:0,20:0.01",
+                        help="comma separated RTT_MS:LOSS pairs simulated by a local relay (0:0 is direct)")
+    parser.add_argument("--count", type=int, default=5, help="transfers per sender per case")
+    parser.add_argument("--output", default="bench_report.json", help="where to write the JSON report")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        with contextlib.redirect_stdout(io.StringIO()):  # the receiver prints every file
+            result = run_case(json.loads(args.worker))
+        print(json.dumps(result))
+        return
+
+    results = []
+    print(f"{'engine':<10}{'KB':>7}{'chunk':>8}{'conc':>5}{'rtt':>5}{'loss':>6}{'MB/s':>9}{'p50 ms':>9}"
+          f"{'p99 ms':>9}{'CPU ms/MB':>11}{'RSS MB':>8}{'errors':>8}")
+    for case in build_cases(args):
+        # Each case runs in a fresh process so peak RSS isn't polluted by earlier runs
+        completed = subprocess.run([sys.executable, __file__, "--worker", json.dumps(case)],
+                                   capture_output=True, text=True)
+        if completed.returncode != 0:
+            result = dict(case, errors=case["concurrency"] * case["count"],
+                          first_error=completed.stderr.strip().splitlines()[-1:] or None)
+            results.append(result)
+            print(f"{case['engine']:<10}{case['size'] // 1024:>7}  failed: {result['first_error']}")
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append(result)
+        latency = result["latency_ms"] or {"p50": float("nan"), "p99": float("nan")}
+        print(f"{result['engine']:<10}{result['size'] // 1024:>7}{result['chunk'] or '-':>8}{result['concurrency']:>5}"
+              f"{result['rtt_ms']:>5g}{result['loss']:>6g}{result['throughput_mb_s']:>9.1f}{latency['p50']:>9.1f}"
+              f"{latency['p99']:>9.1f}{result['cpu_ms_per_mb'] or 0:>11.1f}{result['peak_rss_mb']:>8.0f}"
+              f"{result['errors']:>8}")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
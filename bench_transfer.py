@@ -0,0 +1,94 @@
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import transfer
+
+
+def legacy_send_file(sock, path):
+    """The original send loop from send_screenshot: 1024-byte reads and unchecked send()."""
+    with open(path, 'rb') as f:
+        data = f.read(1024)
+        while data:
+            sock.send(data)
+            data = f.read(1024)
+
+
+def make_payload(size):
+    """Write a temporary file of `size` bytes and return its path."""
+    block = os.urandom(1024 * 1024)
+    fd, path = tempfile.mkstemp(prefix="airshare_bench_", suffix=".bin")
+    with os.fdopen(fd, 'wb') as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:min(remaining, len(block))])
+            remaining -= len(block)
+    return path
+
+
+def start_sink():
+    """Start a loopback receiver that drains every connection; return its port."""
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(('127.0.0.1', 0))
+    server.listen(16)
+
+    def drain():
+        buffer = bytearray(1024 * 1024)
+        while True:
+            conn, _ = server.accept()
+            with conn:
+                while conn.recv_into(buffer):
+                    pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def run_once(port, send):
+    """Time one transfer, returning (wall seconds, sender CPU seconds)."""
+    with socket.create_connection(('127.0.0.1', port)) as s:
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        send(s)
+        cpu = time.thread_time() - cpu_start
+        s.shutdown(socket.SHUT_WR)
+        s.recv(1)  # wait for the sink to close so the data really left the socket
+        wall = time.perf_counter() - wall_start
+    return wall, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Loopback benchmark for the screenshot send path")
+    parser.add_argument("--size-mb", type=float, default=32, help="payload size in MB")
+    parser.add_argument("--chunk-sizes", default="65536,262144,1048576",
+                        help="comma separated chunk sizes for the buffered fallback")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per method (best is reported)")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * 1024 * 1024)
+    path = make_payload(size)
+    port = start_sink()
+
+    methods = [("legacy 1024-byte send()", lambda s: legacy_send_file(s, path))]
+    for chunk_size in (int(c) for c in args.chunk_sizes.split(",")):
+        methods.append((f"sendall {chunk_size // 1024} KB",
+                        lambda s, c=chunk_size: transfer.send_file(s, path, chunk_size=c, use_sendfile=False)))
+    if transfer.sendfile_supported():
+        methods.append(("sendfile", lambda s: transfer.send_file(s, path, use_sendfile=True)))
+
+    print(f"Payload: {size / 1024 / 1024:.1f} MB over loopback, best of {args.repeat}\n")
+    print(f"{'method':<26}{'MB/s':>10}{'wall s':>10}{'CPU s':>10}")
+    try:
+        for name, send in methods:
+            wall, cpu = min(run_once(port, send) for _ in range(args.repeat))
+            print(f"{name:<26}{size / 1024 / 1024 / wall:>10.1f}{wall:>10.3f}{cpu:>10.3f}")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
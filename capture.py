@@ -0,0 +1,92 @@
+import collections
+import threading
+import time
+
+import cv2
+
+CAMERA_INDICES = [0, 1, -1]
+
+
+def open_camera(indices=CAMERA_INDICES):
+    """Try each camera index in turn and return the first capture that opens, or None."""
+    for camera_index in indices:
+        try:
+            print(f"Trying to open camera {camera_index}")
+            cap = cv2.VideoCapture(camera_index)
+
+            if not cap.isOpened():
+                print(f"Failed to open camera {camera_index}")
+                continue
+
+            print(f"Successfully opened camera {camera_index}")
+            return cap
+        except Exception as e:
+            print(f"Error opening camera {camera_index}: {e}")
+            continue
+    return None
+
+
+class FrameGrabber:
+    """Reads camera frames on its own thread so inference always works on the newest one.
+
+    Grabbed frames go into a small ring buffer. `read()` hands out the latest
+    frame and every older frame that was never handed out counts as dropped,
+    so a slow consumer skips ahead instead of working through a backlog.
+    """
+
+    def __init__(self, cap, buffer_size=2):
+        self.cap = cap
+        self.grabbed = 0
+        self.dropped = 0
+        self.latest_timestamp = None  # time.monotonic() when the last returned frame was grabbed
+        self._frames = collections.deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._last_read = 0
+        self._running = False
+        self._thread = None
+
+        # Keep the driver's own queue as short as possible; we drain it continuously anyway
+        try:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        except Exception:
+            pass
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2)
+
+    def _run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            with self._condition:
+                if not ret:
+                    self._running = False
+                    self._condition.notify_all()
+                    break
+                self.grabbed += 1
+                self._frames.append((self.grabbed, time.monotonic(), frame))
+                self._condition.notify_all()
+
+    def _has_new_frame(self):
+        return bool(self._frames) and self._frames[-1][0] > self._last_read
+
+    def read(self, timeout=5.0):
+        """Return (ret, frame) like cap.read(), with the newest frame not yet handed out."""
+        with self._condition:
+            self._condition.wait_for(lambda: self._has_new_frame() or not self._running, timeout)
+            if not self._has_new_frame():
+                return False, None
+            index, timestamp, frame = self._frames[-1]
+            self.dropped += index - self._last_read - 1
+            self._last_read = index
+            self.latest_timestamp = timestamp
+        return True, frame
@@ -0,0 +1,101 @@
+import threading
+
+from screenshot_encoder import CODECS, DEFAULT_CODEC, LOSSY_CODECS
+
+LINK_PRIOR = 10 * 1024 * 1024  # bytes/s assumed for a peer until a transfer to it has been timed
+SMOOTHING = 0.3  # weight of each new measurement in the running averages
+MIN_SAMPLE = 64 * 1024  # transfers smaller than this say more about latency than throughput
+# codec -> (encode ms per megapixel, bytes per pixel) on a typical screenshot, until measured here
+PRIORS = {
+    "png-fast": (60.0, 0.36),
+    "png": (80.0, 0.34),
+    "jpeg": (6.0, 0.12),
+    "webp": (40.0, 0.09),
+    "webp-lossless": (60.0, 0.36),
+    "raw-zlib": (25.0, 0.41),
+}
+
+
+class CodecSelector:
+    """Picks the screenshot codec that gets an image to each peer soonest.
+
+    A codec's cost is its encode time plus its size over the peer's link
+    throughput, and both halves are running averages of what this process
+    measured: encode ms per megapixel and bytes per pixel of every codec it
+    has encoded (starting from PRIORS), and the throughput of recent
+    transfers to each peer (starting from LINK_PRIOR). A fast LAN therefore
+    gets raw-zlib, which leaves the PNG encode to the receiver, while a
+    weak link gets the smallest output, lossy only with `allow_lossy`.
+    Only codecs the peer accepts are considered.
+    """
+
+    def __init__(self, allow_lossy=False, codecs=None):
+        self.allow_lossy = allow_lossy
+        self.codecs = list(codecs or CODECS)  # what this side may encode
+        self._cost = {codec: PRIORS[codec] for codec in self.codecs}
+        self._measured = set()  # codecs whose cost is a measurement rather than a prior
+        self._throughput = {}  # peer -> bytes/s
+        self._pixels = 1920 * 1080  # size of the last screenshot, for choosing before the next one exists
+        self.last_peer = None
+        self._lock = threading.Lock()
+
+    def choose(self, peer=None, accepted=None, have=None):
+        """The best codec for sending to `peer`.
+
+        `accepted` lists the codecs the peer can take (None for any). `have`
+        is an EncodedImage already in hand: keeping its codec costs no
+        encode, so it's only replaced when that's worth a second encode.
+        """
+        pixels = have.width * have.height if have is not None else self._pixels
+        candidates = [codec for codec in self.codecs
+                      if (accepted is None or codec in accepted) and (self.allow_lossy or codec not in LOSSY_CODECS)]
+        if have is not None and (accepted is None or have.codec in accepted) and have.codec not in candidates:
+            candidates.append(have.codec)  # re-encoding a lossy image losslessly gains nothing
+        if not candidates:
+            return have.codec if have is not None else DEFAULT_CODEC
+        return min(candidates, key=lambda codec: self.estimate(codec, peer, pixels, have))
+
+    def estimate(self, codec, peer=None, pixels=None, have=None):
+        """Estimated ms from starting the encode to the peer holding the image."""
+        if have is not None and have.codec == codec:
+            encode_ms, size = 0.0, have.size
+        else:
+            ms_per_megapixel, bytes_per_pixel = self._cost.get(codec, PRIORS[codec])
+            pixels = pixels or self._pixels
+            encode_ms, size = ms_per_megapixel * pixels / 1e6, bytes_per_pixel * pixels
+        return encode_ms + size / self.throughput(peer) * 1000
+
+    def throughput(self, peer=None):
+        """Bytes/s to `peer` (the last peer sent to if None)."""
+        with self._lock:
+            return self._throughput.get(peer or self.last_peer, LINK_PRIOR)
+
+    def record_encode(self, encoded):
+        """Fold an EncodedImage's encode time and size into its codec's averages."""
+        pixels = encoded.width * encoded.height
+        if not pixels or encoded.codec not in PRIORS:
+            return
+        sample = (encoded.encode_ms * 1e6 / pixels, encoded.size / pixels)
+        with self._lock:
+            self._pixels = pixels
+            if encoded.codec in self._measured:
+                sample = _blend(self._cost[encoded.codec], sample)
+            self._cost[encoded.codec] = sample
+            self._measured.add(encoded.codec)
+
+    def record_transfer(self, peer, size, seconds):
+        """Fold a timed transfer to `peer` into its link throughput."""
+        with self._lock:
+            self.last_peer = peer
+            if size < MIN_SAMPLE or seconds <= 0:
+                return
+            rate = size / seconds
+            self._throughput[peer] = _blend((self._throughput.get(peer, rate),), (rate,))[0]
+
+    def describe(self, peer=None):
+        """One line on the link and the codec it currently gets."""
+        return f"{self.throughput(peer) / 1e6:.1f} MB/s, sending {self.choose(peer)}"
+
+
+def _blend(average, sample):
+    return tuple(old + SMOOTHING * (new - old) for old, new in zip(average, sample))
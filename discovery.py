@@ -0,0 +1,214 @@
+import json
+import socket
+import threading
+import time
+import uuid
+
+import netinfo
+
+DISCOVERY_PORT = 5002
+MULTICAST_GROUP = "239.255.42.99"  # administratively scoped: never leaves the site
+ANNOUNCE_INTERVAL = 1.0  # seconds between announcements
+PEER_TTL = 4.0  # a peer not heard from for this long is dropped from the table
+APP = "airshare"
+VERSION = 1
+
+RECEIVE = "receive"  # capability: the instance has a receive service listening on its port
+
+
+class Peer:
+    """One AirShare instance heard on the LAN."""
+
+    def __init__(self, peer_id, name, address, port, caps, last_seen):
+        self.id = peer_id
+        self.name = name
+        self.address = address
+        self.port = port
+        self.caps = set(caps)
+        self.last_seen = last_seen
+
+    @property
+    def receiving(self):
+        return RECEIVE in self.caps
+
+    def describe(self):
+        return f"{self.name} ({self.address})"
+
+
+class Discovery:
+    """Announces this instance over UDP multicast and broadcast and keeps a table of the others.
+
+    Every instance announces its id, name, address, transfer port and
+    capabilities once a second; any instance that hears a peer it didn't
+    know announces again straight away, so a new instance fills its table
+    within one round trip instead of one interval. Peers that go quiet for `ttl` seconds
+    (or say goodbye on `stop()`) drop out of the table. `targets` replaces
+    the multicast/broadcast destinations, e.g. with loopback ports so several
+    instances can find each other on one machine.
+    """
+
+    def __init__(self, name=None, port=5001, caps=(), discovery_port=DISCOVERY_PORT, group=MULTICAST_GROUP,
+                 interval=ANNOUNCE_INTERVAL, ttl=PEER_TTL, targets=None, address=None, on_change=None):
+        self.id = uuid.uuid4().hex
+        self.name = name or socket.gethostname()
+        self.port = port
+        self.caps = set(caps)
+        self.discovery_port = discovery_port
+        self.group = group
+        self.interval = interval
+        self.ttl = ttl
+        self.targets = targets or [(group, discovery_port), ("<broadcast>", discovery_port)]
+        self.address = address
+        self.on_change = on_change
+        self._peers = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()  # notified whenever a peer joins, leaves or changes
+        self._stop = threading.Event()
+        self._sock = None
+        self._threads = []
+
+    def start(self):
+        """Open the discovery socket and start announcing; returns self."""
+        self._sock = _open_socket(self.discovery_port, self.group)
+        self._threads = [threading.Thread(target=self._listen, daemon=True),
+                         threading.Thread(target=self._announce_loop, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        """Tell the other instances we're leaving and close the socket."""
+        if self._sock is None:
+            return
+        self._stop.set()
+        self._send({"bye": True})
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self._sock.close()
+
+    def set_caps(self, *caps):
+        """Replace our capabilities (e.g. once the receive service is up) and announce them now."""
+        self.caps = set(caps)
+        self.announce()
+
+    def announce(self):
+        self._send({"name": self.name, "address": self.address or netinfo.get_ip_address(), "port": self.port,
+                    "caps": sorted(self.caps)})
+
+    def peers(self, receiving=None):
+        """Live peers sorted by name; `receiving=True` keeps only those with a receive service."""
+        cutoff = time.monotonic() - self.ttl
+        with self._lock:
+            peers = [peer for peer in self._peers.values() if peer.last_seen >= cutoff]
+        if receiving is not None:
+            peers = [peer for peer in peers if peer.receiving == receiving]
+        return sorted(peers, key=lambda peer: (peer.name, peer.address))
+
+    def resolve(self, target=None):
+        """Find a receiving peer by name or address; with no `target`, the only one on the network.
+
+        Announcements aren't authenticated, so when several receivers are
+        visible none is picked: any host could announce a name that sorts
+        first and get the screen. The caller has to ask which one.
+        """
+        receivers = self.peers(receiving=True)
+        if target is None:
+            return receivers[0] if len(receivers) == 1 else None
+        for peer in receivers:
+            if target in (peer.name, peer.address, peer.id):
+                return peer
+        return None
+
+    def wait_for_peer(self, target=None, timeout=None):
+        """Block until resolve(target) finds someone or `timeout` seconds pass; returns the peer or None."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            peer = self.resolve(target)
+            while peer is None:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+                peer = self.resolve(target)
+            return peer
+
+    def _send(self, message):
+        message.update(app=APP, v=VERSION, id=self.id)
+        data = json.dumps(message).encode()
+        for destination in self.targets:
+            try:
+                self._sock.sendto(data, destination)
+            except OSError:
+                pass  # e.g. no broadcast route on this interface; the other targets may still work
+
+    def _announce_loop(self):
+        while not self._stop.is_set():
+            try:
+                self.announce()
+            except Exception as e:
+                print(f"Error announcing on the network: {e}")
+            self._stop.wait(self.interval)
+
+    def _listen(self):
+        while not self._stop.is_set():
+            try:
+                data, addr = self._sock.recvfrom(2048)
+            except socket.timeout:
+                continue  # wake up now and then to notice stop()
+            except OSError:
+                break
+            try:
+                message = json.loads(data)
+                if message.get("app") != APP or message.get("id") == self.id:
+                    continue
+                self._update(message, addr)
+            except Exception as e:
+                print(f"Ignoring bad discovery message from {addr[0]}: {e}")
+
+    def _update(self, message, addr):
+        peer_id = message["id"]
+        with self._lock:
+            known = self._peers.get(peer_id)
+            if message.get("bye"):
+                self._peers.pop(peer_id, None)
+                changed = known is not None
+            else:
+                # Trust the packet's source over the announced address; it's the one that routes back
+                peer = Peer(peer_id, str(message.get("name", addr[0])), addr[0], int(message["port"]),
+                            message.get("caps", ()), time.monotonic())
+                self._peers[peer_id] = peer
+                changed = known is None or known.caps != peer.caps or known.port != peer.port
+            for stale in [p for p, peer in self._peers.items() if peer.last_seen < time.monotonic() - self.ttl]:
+                del self._peers[stale]
+
+        if changed:
+            with self._changed:
+                self._changed.notify_all()
+
+        if known is None and not message.get("bye"):
+            # Answer a newcomer right away so it doesn't wait a whole interval to learn about us.
+            # Multicast rather than unicast: instances sharing the port on one host all need it
+            self.announce()
+        if changed and self.on_change:
+            try:
+                self.on_change(self.peers())
+            except Exception as e:
+                print(f"Error in discovery callback: {e}")
+
+
+def _open_socket(port, group):
+    """UDP socket that receives both multicast and broadcast announcements on `port`."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if hasattr(socket, "SO_REUSEPORT"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.bind(('', port))
+    sock.settimeout(0.5)
+    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+    try:
+        membership = socket.inet_aton(group) + socket.inet_aton("0.0.0.0")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+    except OSError as e:
+        print(f"Multicast unavailable ({e}); discovering peers by broadcast only")
+    return sock
@@ -0,0 +1,70 @@
+import os
+import time
+
+import protocol
+
+FANOUT_WORKERS = 8  # peers a group send writes to at once; the rest start as these finish
+
+
+class SharedPayload:
+    """One encoded payload, prepared once and sent to every peer of a group.
+
+    The bytes are held as a read-only memoryview that each connection slices
+    into chunks, so no peer gets a copy and none can change what the others
+    send. The HELLO metadata, whose sha256 is the expensive part, is also
+    worked out once. A file path stays a path; each peer reads the file.
+    The source image is deliberately not carried over, so the sends neither
+    re-encode for each peer nor turn into per-peer tile deltas.
+    """
+
+    def __init__(self, payload):
+        data = getattr(payload, "data", payload)
+        if not isinstance(data, (str, os.PathLike)):
+            data = memoryview(data).cast('B').toreadonly()
+        self.data = data
+        self.codec = getattr(payload, "codec", None)
+        self.metadata = protocol.describe(payload)
+
+    @property
+    def size(self):
+        return self.metadata["size"]
+
+
+class TransferGroup:
+    """The TransferJobs of one fan-out send, one per peer.
+
+    Every job keeps its own status, progress and error, so one slow or
+    failing receiver doesn't hold up or fail the others.
+    """
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    @property
+    def active(self):
+        return any(job.active for job in self.jobs)
+
+    def cancel(self):
+        for job in self.jobs:
+            job.cancel()
+
+    def wait(self, timeout=None):
+        """Wait for every job to finish; returns False if `timeout` ran out first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in self.jobs:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not job.finished.wait(remaining):
+                return False
+        return True
+
+    def counts(self):
+        """Status -> number of jobs in it."""
+        counts = {}
+        for job in self.jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    def describe(self):
+        """Short status line for the video overlay."""
+        summary = ", ".join(f"{count} {status}" for status, count in self.counts().items())
+        return f"To {len(self.jobs)} peers: {summary}"
@@ -0,0 +1,167 @@
+import numpy as np
+
+# MediaPipe Hands landmark indices
+WRIST = 0
+THUMB_MCP, THUMB_TIP = 2, 4
+INDEX_MCP, MIDDLE_MCP, PINKY_MCP = 5, 9, 17
+FINGER_TIPS = np.array([4, 8, 12, 16, 20])
+FINGER_PIPS = np.array([3, 6, 10, 14, 18])  # the thumb's IP joint stands in for a PIP
+FINGERS = ("thumb", "index", "middle", "ring", "pinky")
+
+# Tip-to-wrist over PIP-to-wrist distance: ~0.7 for a curled finger, ~1.3 for a straight one
+CURLED_RATIO = 0.8
+EXTENDED_RATIO = 1.2
+# Thumb tip-to-pinky-MCP over thumb-MCP-to-pinky-MCP distance: ~1.0 tucked in, ~1.6 spread out
+THUMB_CURLED_RATIO = 1.1
+THUMB_EXTENDED_RATIO = 1.5
+
+TWO_FINGERS = "two_fingers"
+FIST = "fist"
+OPEN_PALM = "open_palm"
+
+MAX_DISTANCE = 0.35  # weighted RMS distance beyond which a pose matches no template
+ANY = np.nan  # template value for a finger whose state doesn't matter
+SPECIFICITY_BONUS = 0.02  # per pinned finger: thumbs up [1,0,0,0,0] beats fist [?,0,0,0,0] on a near tie
+
+# gesture -> extension of (thumb, index, middle, ring, pinky), 0 curled to 1 extended
+DEFAULT_TEMPLATES = {
+    TWO_FINGERS: [ANY, 1, 1, 0, 0],
+    FIST: [ANY, 0, 0, 0, 0],
+    OPEN_PALM: [1, 1, 1, 1, 1],
+}
+
+
+def landmarks_to_array(hand_landmarks):
+    """The 21 landmarks of one hand as a (21, 3) float32 array; arrays pass through."""
+    if isinstance(hand_landmarks, np.ndarray):
+        return hand_landmarks.astype(np.float32, copy=False)
+    return np.fromiter((c for lm in hand_landmarks.landmark for c in (lm.x, lm.y, lm.z)),
+                       dtype=np.float32, count=63).reshape(21, 3)
+
+
+def normalize(points, aspect=1.0):
+    """Move the wrist to the origin, scale the palm to length 1 and rotate it to point up.
+
+    Works on (21, 3) or stacked (..., 21, 3) arrays, so several hands are
+    normalized in one go. MediaPipe scales x by the frame's width and y by its
+    height; `aspect` (width / height) puts them back on the same scale.
+    """
+    points = points - points[..., WRIST:WRIST + 1, :]
+    if aspect != 1.0:
+        points = points * np.array([aspect, 1.0, aspect], dtype=np.float32)
+    palm = points[..., MIDDLE_MCP, :2]
+    length = np.linalg.norm(palm, axis=-1)[..., None, None]
+    points = points / np.maximum(length, 1e-6)
+
+    # Rotate in the image plane so the wrist -> middle knuckle line points along -y
+    angle = np.arctan2(palm[..., 0], -palm[..., 1])
+    cos, sin = np.cos(angle)[..., None], np.sin(angle)[..., None]
+    x, y = points[..., 0], points[..., 1]
+    return np.stack([x * cos - y * sin, x * sin + y * cos, points[..., 2]], axis=-1)
+
+
+def finger_extension(normalized):
+    """Extension of each finger, 0 (curled) to 1 (straight), as a (..., 5) array."""
+    tips = normalized[..., FINGER_TIPS, :2]
+    pips = normalized[..., FINGER_PIPS, :2]
+    # The wrist sits at the origin after normalize()
+    ratio = np.linalg.norm(tips, axis=-1) / np.maximum(np.linalg.norm(pips, axis=-1), 1e-6)
+    extension = (ratio - CURLED_RATIO) / (EXTENDED_RATIO - CURLED_RATIO)
+
+    # Thumb: how far the tip sits from the far side of the palm, relative to the thumb's base
+    pinky = normalized[..., PINKY_MCP, :2]
+    thumb_ratio = (np.linalg.norm(normalized[..., THUMB_TIP, :2] - pinky, axis=-1) /
+                   np.maximum(np.linalg.norm(normalized[..., THUMB_MCP, :2] - pinky, axis=-1), 1e-6))
+    extension[..., 0] = (thumb_ratio - THUMB_CURLED_RATIO) / (THUMB_EXTENDED_RATIO - THUMB_CURLED_RATIO)
+    return np.clip(extension, 0.0, 1.0)
+
+
+class GestureIndex:
+    """Nearest-neighbour lookup over gesture templates in finger-extension space.
+
+    Each template is a vector of five extensions; NaN entries are fingers
+    whose state doesn't matter for that gesture. New gestures are added as
+    templates (or learned from example poses), never as code.
+    """
+
+    def __init__(self, templates=None):
+        self.labels = []
+        self._vectors = np.empty((0, len(FINGERS)), dtype=np.float32)
+        for label, vector in (DEFAULT_TEMPLATES if templates is None else templates).items():
+            self.add(label, vector)
+
+    def add(self, label, vector):
+        """Add a template; a label may have several."""
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, len(FINGERS))
+        self.labels.append(label)
+        self._vectors = np.vstack([self._vectors, vector])
+
+    def add_example(self, label, hand_landmarks, frame_size=None):
+        """Add the pose of a real hand as a template for `label`."""
+        aspect = frame_size[0] / frame_size[1] if frame_size else 1.0
+        self.add(label, finger_extension(normalize(landmarks_to_array(hand_landmarks), aspect)))
+
+    def nearest(self, extension):
+        """(label, distance) of the closest template for each row of a (..., 5) extension array."""
+        extension = np.asarray(extension, dtype=np.float32)
+        weights = ~np.isnan(self._vectors)
+        diff = np.where(weights, extension[..., None, :] - np.nan_to_num(self._vectors), 0.0)
+        # Weighted RMS so templates that ignore a finger aren't favoured for comparing fewer values
+        distances = np.sqrt((diff ** 2).sum(axis=-1) / np.maximum(weights.sum(axis=-1), 1))
+        best = (distances - SPECIFICITY_BONUS * weights.sum(axis=-1)).argmin(axis=-1)
+        return np.asarray(self.labels, dtype=object)[best], np.take_along_axis(
+            distances, best[..., None], axis=-1)[..., 0]
+
+    def save(self, path):
+        np.savez(path, labels=np.asarray(self.labels), vectors=self._vectors)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(dict(zip(data["labels"].tolist(), data["vectors"])))
+
+
+class HandPose:
+    """Everything the engine worked out about one hand in one frame."""
+
+    def __init__(self, points, normalized, extension, gesture, distance):
+        self.points = points  # (21, 3) landmarks normalized to the frame, as MediaPipe gives them
+        self.normalized = normalized  # wrist at the origin, palm length 1, pointing up
+        self.extension = extension  # (5,) thumb..pinky, 0 curled to 1 straight
+        self.gesture = gesture  # template label, or None if nothing is close enough
+        self.distance = distance
+
+    def describe(self):
+        fingers = "".join("^" if e > 0.5 else "_" for e in self.extension)
+        return f"{self.gesture or '-'} [{fingers}] d={self.distance:.2f}"
+
+
+class GestureEngine:
+    """Turns MediaPipe hand landmarks into gestures with one vectorized pass per frame.
+
+    All hands in a frame are converted to one array, normalized and scored
+    together; each is then matched against the template index.
+    """
+
+    def __init__(self, index=None, max_distance=MAX_DISTANCE):
+        self.index = index or GestureIndex()
+        self.max_distance = max_distance
+
+    def analyze(self, multi_hand_landmarks, frame_size=None):
+        """A HandPose for every hand (MediaPipe landmark lists or (21, 3) arrays).
+
+        `frame_size` is the (width, height) the landmarks were found in.
+        """
+        if not multi_hand_landmarks:
+            return []
+        points = np.stack([landmarks_to_array(hand) for hand in multi_hand_landmarks])
+        normalized = normalize(points, frame_size[0] / frame_size[1] if frame_size else 1.0)
+        extension = finger_extension(normalized)
+        labels, distances = self.index.nearest(extension)
+        return [HandPose(points[i], normalized[i], extension[i],
+                         labels[i] if distances[i] <= self.max_distance else None, float(distances[i]))
+                for i in range(len(points))]
+
+    def classify(self, hand_landmarks, frame_size=None):
+        """The gesture of a single hand, or None."""
+        return self.analyze([hand_landmarks], frame_size)[0].gesture
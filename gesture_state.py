@@ -0,0 +1,135 @@
+import time
+from collections import Counter, deque
+
+VOTE_WINDOW = 6  # M: recent frames each hand votes over
+ENTER_VOTES = 4  # N: frames of the window a gesture needs before it can start
+EXIT_VOTES = 2  # a started gesture lasts until it has fewer than this many votes left
+HOLD_SECONDS = 0.1  # the gesture must keep its majority this long before it fires
+COOLDOWN_SECONDS = 1.0  # the same gesture can't fire again (from any hand) within this time
+LOST_AFTER = 1.0  # seconds a hand may go missing before its history is forgotten
+
+ANY_STATE = None  # GestureFlow transition key that matches every state
+
+
+class HandFilter:
+    """Debounces one hand's per-frame gestures with N-of-M voting and enter/exit hysteresis.
+
+    A gesture starts once it holds `enter` of the last `window` votes for
+    `hold` seconds, and stays active until it drops below `exit` votes, so
+    a flicker can neither start a gesture nor end one.
+    """
+
+    def __init__(self, window=VOTE_WINDOW, enter=ENTER_VOTES, exit=EXIT_VOTES, hold=HOLD_SECONDS):
+        self.enter = enter
+        self.exit = exit
+        self.hold = hold
+        self.active = None
+        self.last_seen = 0.0
+        self._votes = deque(maxlen=window)
+        self._candidate = None
+        self._since = 0.0
+
+    def update(self, gesture, now):
+        """Add this frame's vote; returns the gesture if it started on this frame, else None."""
+        self._votes.append(gesture)
+        counts = Counter(vote for vote in self._votes if vote is not None)
+        candidate, votes = counts.most_common(1)[0] if counts else (None, 0)
+
+        if votes < self.enter:
+            self._candidate = None
+        elif candidate != self._candidate:
+            self._candidate, self._since = candidate, now
+
+        if self.active is not None and counts[self.active] < self.exit:
+            self.active = None
+        if self._candidate is not None and self._candidate != self.active and now - self._since >= self.hold:
+            self.active = self._candidate
+            return self.active
+        return None
+
+
+class GestureStateMachine:
+    """Turns every hand's frame-by-frame gestures into debounced gesture events.
+
+    Call `update()` once per frame, with or without hands in view; it never
+    blocks. Each hand (keyed by `hand_keys()`) has its own HandFilter; an
+    event is the moment a hand's gesture starts, and each gesture then has a
+    cooldown shared by all hands.
+    """
+
+    def __init__(self, window=VOTE_WINDOW, enter=ENTER_VOTES, exit=EXIT_VOTES, hold=HOLD_SECONDS,
+                 cooldown=COOLDOWN_SECONDS, lost_after=LOST_AFTER):
+        self.window = window
+        self.enter = enter
+        self.exit = exit
+        self.hold = hold
+        self.cooldown = cooldown
+        self.lost_after = lost_after
+        self._hands = {}
+        self._fired = {}  # gesture -> when it last fired
+
+    def update(self, gestures, keys=None, now=None):
+        """Feed one frame's gestures (one per hand, None for no gesture); returns the events it fires."""
+        now = time.monotonic() if now is None else now
+        if keys is None:
+            keys = range(len(gestures))
+
+        events = []
+        seen = dict(zip(keys, gestures))
+        for key in seen:
+            if key not in self._hands:
+                self._hands[key] = HandFilter(self.window, self.enter, self.exit, self.hold)
+        for key, hand in list(self._hands.items()):
+            if key in seen:
+                hand.last_seen = now
+            elif now - hand.last_seen > self.lost_after:
+                del self._hands[key]
+                continue
+            # A hand that's briefly out of view votes for nothing, so its gesture fades out
+            started = hand.update(seen.get(key), now)
+            if started is not None and now - self._fired.get(started, -self.cooldown) >= self.cooldown:
+                self._fired[started] = now
+                events.append(started)
+        return events
+
+    def active(self):
+        """Gestures currently held by any hand."""
+        return {hand.active for hand in self._hands.values() if hand.active is not None}
+
+    def reset(self):
+        self._hands.clear()
+
+
+class GestureFlow:
+    """The app's own states, moved along by gesture events instead of boolean flags.
+
+    `transitions` maps (state, gesture) to (next state, action); ANY_STATE
+    as the state matches everywhere and as the next state keeps the current
+    one. Gestures with no transition from the current state are ignored.
+    """
+
+    def __init__(self, initial, transitions):
+        self.state = initial
+        self.transitions = transitions
+
+    def fire(self, gesture):
+        """Apply one gesture event; returns True if it matched a transition."""
+        transition = self.transitions.get((self.state, gesture)) or self.transitions.get((ANY_STATE, gesture))
+        if transition is None:
+            return False
+        next_state, action = transition
+        if next_state is not ANY_STATE:
+            self.state = next_state
+        if action is not None:
+            action()
+        return True
+
+
+def hand_keys(result):
+    """Stable per-hand keys for a MediaPipe result: handedness label, numbered if it repeats."""
+    handedness = getattr(result, "multi_handedness", None) or []
+    keys = []
+    for i in range(len(result.multi_hand_landmarks or [])):
+        label = handedness[i].classification[0].label if i < len(handedness) else "hand"
+        keys.append(label if label not in keys else f"{label}{i}")
+    return keys
@@ -0,0 +1,114 @@
+import time
+
+import cv2
+
+DEFAULT_INFERENCE_WIDTH = 320  # width of the downscaled frame used to search for hands
+DEFAULT_ROI_SIZE = 256  # hand crops are resized to this square before inference
+ROI_PADDING = 0.6  # margin added around the hand box, as a fraction of its longest side
+ROI_MARGIN = 0.15  # the crop only moves when the hand comes this close to its edge
+SEARCH_CONFIDENCE = 0.7  # min_detection_confidence of the full-frame search instance made by default
+
+
+class HandTracker:
+    """Runs MediaPipe Hands on a small crop around the hand it saw last instead of the full frame.
+
+    While a hand is tracked, inference only sees a padded square region of
+    interest resized to `roi_size`; the landmarks are mapped back so callers
+    still get coordinates normalized to the full frame. When the crop loses
+    the hand, the tracker searches a copy of the whole frame downscaled to
+    `inference_width`. `inference_ms` holds the last frame's inference time.
+
+    The searches go through `search_hands`, a second instance, because
+    `hands` runs in video mode and tracks from one input to the next: fed
+    crops and full frames in turn, its landmarks jump at every switch. By
+    default it is a static-image Hands, which treats each search on its own.
+    """
+
+    def __init__(self, hands, inference_width=DEFAULT_INFERENCE_WIDTH, roi_size=DEFAULT_ROI_SIZE,
+                 padding=ROI_PADDING, search_hands=None):
+        if search_hands is None:
+            import mediapipe as mp
+
+            search_hands = mp.solutions.hands.Hands(static_image_mode=True,
+                                                    min_detection_confidence=SEARCH_CONFIDENCE)
+        self.hands = hands
+        self.search_hands = search_hands
+        self.inference_width = inference_width
+        self.roi_size = roi_size
+        self.padding = padding
+        self.inference_ms = 0.0
+        self.mode = "search"
+        self._roi = None
+
+    def process(self, rgb_frame):
+        """Same contract as hands.process(), but with landmarks found via the ROI when possible."""
+        frame_h, frame_w = rgb_frame.shape[:2]
+        start = time.perf_counter()
+
+        result = None
+        if self._roi is not None:
+            x0, y0, side = self._roi
+            crop = rgb_frame[y0:y0 + side, x0:x0 + side]
+            if side != self.roi_size:
+                crop = cv2.resize(crop, (self.roi_size, self.roi_size), interpolation=cv2.INTER_AREA)
+            result = self.hands.process(crop)
+            if result.multi_hand_landmarks:
+                _map_to_frame(result.multi_hand_landmarks, x0, y0, side, frame_w, frame_h)
+                self.mode = "roi"
+            else:
+                result = None
+
+        if result is None:
+            result = self.search_hands.process(_downscale(rgb_frame, self.inference_width))
+            self.mode = "search"
+
+        self._roi = self._next_roi(result.multi_hand_landmarks, frame_w, frame_h)
+        self.inference_ms = (time.perf_counter() - start) * 1000
+        return result
+
+    def reset(self):
+        """Forget the tracked region, forcing a full-frame search on the next frame."""
+        self._roi = None
+
+    def _next_roi(self, hand_landmarks, frame_w, frame_h):
+        """Square crop (x0, y0, side) in pixels covering every detected hand, or None."""
+        if not hand_landmarks:
+            return None
+
+        xs = [lm.x * frame_w for hand in hand_landmarks for lm in hand.landmark]
+        ys = [lm.y * frame_h for hand in hand_landmarks for lm in hand.landmark]
+        left, right, top, bottom = min(xs), max(xs), min(ys), max(ys)
+
+        # Keep the current crop while the hand stays well inside it, so the
+        # tracker isn't fed a jittering viewport
+        if self._roi is not None:
+            x0, y0, side = self._roi
+            margin = side * ROI_MARGIN
+            if (left > x0 + margin and right < x0 + side - margin and
+                    top > y0 + margin and bottom < y0 + side - margin and
+                    side < max(right - left, bottom - top) * (1 + 2 * self.padding) * 1.5):
+                return self._roi
+
+        side = int(max(right - left, bottom - top) * (1 + 2 * self.padding))
+        side = max(min(side, frame_w, frame_h), 32)
+        x0 = int(min(max((left + right - side) / 2, 0), frame_w - side))
+        y0 = int(min(max((top + bottom - side) / 2, 0), frame_h - side))
+        return x0, y0, side
+
+
+def _downscale(rgb_frame, width):
+    """Resize a frame to `width` keeping its aspect ratio; frames already that small pass through."""
+    frame_h, frame_w = rgb_frame.shape[:2]
+    if frame_w <= width:
+        return rgb_frame
+    height = int(frame_h * width / frame_w)
+    return cv2.resize(rgb_frame, (width, height), interpolation=cv2.INTER_AREA)
+
+
+def _map_to_frame(hand_landmarks, x0, y0, side, frame_w, frame_h):
+    """Convert landmarks normalized to a square crop into landmarks normalized to the full frame."""
+    for hand in hand_landmarks:
+        for lm in hand.landmark:
+            lm.x = (x0 + lm.x * side) / frame_w
+            lm.y = (y0 + lm.y * side) / frame_h
+            lm.z = lm.z * side / frame_w
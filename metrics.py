@@ -0,0 +1,240 @@
+import bisect
+import collections
+import http.server
+import json
+import threading
+import time
+
+import cv2
+
+# Upper bounds (ms) of the histogram buckets exported to Prometheus
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+WINDOW = 300  # recent samples per stage behind the rolling percentiles (~10 s at 30 fps)
+METRICS_PORT = 9464
+LOG_INTERVAL = 10.0  # seconds between JSON log lines
+PREFIX = "airshare"
+
+
+class Histogram:
+    """Latency samples of one stage: cumulative buckets for Prometheus, a rolling window for percentiles."""
+
+    def __init__(self, window=WINDOW):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        self.recent.append(ms)
+
+    def summary(self):
+        """p50/p99/mean over the rolling window, in ms."""
+        recent = sorted(self.recent)
+        if not recent:
+            return {"p50": 0.0, "p99": 0.0, "mean": 0.0, "count": self.count}
+        return {"p50": recent[len(recent) // 2], "p99": recent[min(len(recent) - 1, int(0.99 * len(recent)))],
+                "mean": sum(recent) / len(recent), "count": self.count}
+
+
+class FrameTimer:
+    """Times the stages of one frame: each `mark()` closes the stage that ran since the previous one."""
+
+    def __init__(self, metrics):
+        self._metrics = metrics
+        self._start = self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self._metrics.observe(stage, (now - self._last) * 1000)
+        self._last = now
+
+    def add(self, timings):
+        """Record stages timed elsewhere (e.g. a PipelineStep's timings) that ran since the last mark."""
+        for stage, ms in timings.items():
+            self._metrics.observe(stage, ms)
+        self._last = time.perf_counter()
+
+    def end(self):
+        now = time.perf_counter()
+        self._metrics.observe("frame", (now - self._start) * 1000)
+        self._metrics.frame_done(now)
+
+
+class _NullTimer:
+    """What a disabled Metrics hands out: every call is a no-op."""
+
+    def mark(self, stage):
+        pass
+
+    def add(self, timings):
+        pass
+
+    def end(self):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Metrics:
+    """Per-stage frame timings, fps and counters, with an overlay, a Prometheus endpoint and a JSON log.
+
+    Disabled (the default), `frame()` returns a shared no-op timer and
+    `inc()`/`set()` return at once, so instrumented code pays one attribute
+    check per call. Enabled, a stage costs one perf_counter() call and a
+    bucket lookup.
+    """
+
+    def __init__(self, enabled=False, window=WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.overlay = enabled
+        self._stages = {}
+        self._counters = {}  # (name, labels) -> value
+        self._gauges = {}
+        self._frame_times = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._server = None
+        self._log_stop = threading.Event()
+
+    def frame(self):
+        """Start timing a frame; returns a timer whose `mark()`s close each stage."""
+        return FrameTimer(self) if self.enabled else NULL_TIMER
+
+    def observe(self, stage, ms):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.window)
+            histogram.observe(ms)
+
+    def frame_done(self, now):
+        with self._lock:
+            self._frame_times.append(now)
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def fps(self):
+        with self._lock:
+            times = list(self._frame_times)
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def snapshot(self):
+        """Everything as a JSON-friendly dict."""
+        with self._lock:
+            stages = {stage: histogram.summary() for stage, histogram in self._stages.items()}
+            counters = {_key_name(key): value for key, value in self._counters.items()}
+            gauges = {_key_name(key): value for key, value in self._gauges.items()}
+        return {"time": time.time(), "fps": round(self.fps(), 2), "stages_ms": stages, "counters": counters,
+                "gauges": gauges}
+
+    def prometheus(self):
+        """Everything in the Prometheus text exposition format."""
+        lines = [f"# TYPE {PREFIX}_stage_ms histogram"]
+        with self._lock:
+            for stage, histogram in sorted(self._stages.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS_MS + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_stage_ms_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_ms_sum{{stage="{stage}"}} {histogram.sum:.3f}')
+                lines.append(f'{PREFIX}_stage_ms_count{{stage="{stage}"}} {histogram.count}')
+            for kind, values in (("counter", self._counters), ("gauge", self._gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+                    for (key_name, labels), value in values.items():
+                        if key_name == name:
+                            lines.append(f"{PREFIX}_{_key_name((name, labels))} {value}")
+        lines.append(f"# TYPE {PREFIX}_fps gauge")
+        lines.append(f"{PREFIX}_fps {self.fps():.2f}")
+        return "\n".join(lines) + "\n"
+
+    def draw(self, frame, origin=(10, None)):
+        """Debug overlay: fps and rolling p50/p99 per stage, bottom left of the frame."""
+        if not (self.enabled and self.overlay):
+            return
+        with self._lock:
+            stages = [(stage, histogram.summary()) for stage, histogram in self._stages.items()]
+            dropped = self._gauges.get(("frames_dropped", ()), 0)
+        lines = [f"{self.fps():.1f} fps, {dropped} frames dropped"]
+        lines += [f"{stage:<14} p50 {s['p50']:6.2f}  p99 {s['p99']:6.2f} ms" for stage, s in stages]
+        x, y = origin[0], origin[1] or frame.shape[0] - 18 * len(lines) - 10
+        for i, line in enumerate(lines):
+            cv2.putText(frame, line, (x, y + 18 * i), cv2.FONT_HERSHEY_PLAIN, 1.0, (0, 255, 255), 1)
+
+    def serve(self, port=METRICS_PORT, host='127.0.0.1'):
+        """Serve /metrics (Prometheus text) and /metrics.json on a background thread; returns the port."""
+        if not self.enabled:
+            return None
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = metrics.prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(metrics.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = http.server.ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print(f"Metrics endpoint unavailable on port {port}: {e}")
+            return None
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics at http://{host}:{self._server.server_address[1]}/metrics")
+        return self._server.server_address[1]
+
+    def start_log(self, path, interval=LOG_INTERVAL):
+        """Append a JSON snapshot to `path` every `interval` seconds."""
+        if not self.enabled:
+            return
+
+        def log():
+            while not self._log_stop.wait(interval):
+                try:
+                    with open(path, "a") as f:
+                        f.write(json.dumps(self.snapshot()) + "\n")
+                except Exception as e:
+                    print(f"Error writing metrics log: {e}")
+
+        threading.Thread(target=log, daemon=True).start()
+
+    def stop(self):
+        self._log_stop.set()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _key_name(key):
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{label}="{value}"' for label, value in labels) + "}"
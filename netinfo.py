@@ -0,0 +1,162 @@
+import ipaddress
+import socket
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CHECK_INTERVAL = 5  # seconds between background checks for interface changes
+SIOCGIFADDR = 0x8915  # Linux ioctl: IPv4 address of an interface
+PROBE_ADDRESS = "10.255.255.255"  # any non-local address; nothing is ever sent to it
+
+# Interfaces that carry an address but aren't the LAN other devices can reach us on
+VIRTUAL_PREFIXES = ("docker", "br-", "veth", "virbr", "vmnet", "vboxnet", "utun", "tun", "tap",
+                    "wg", "zt", "tailscale", "lxc", "cni", "flannel")
+
+
+def list_interfaces():
+    """Return (name, IPv4 address) for every interface that has an IPv4 address."""
+    if psutil is not None:
+        return [(name, addr.address)
+                for name, addrs in psutil.net_if_addrs().items()
+                for addr in addrs if addr.family == socket.AF_INET]
+
+    if fcntl is not None and hasattr(socket, "if_nameindex"):
+        interfaces = []
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            for _, name in socket.if_nameindex():
+                try:
+                    packed = fcntl.ioctl(s.fileno(), SIOCGIFADDR, struct.pack('256s', name.encode()[:15]))
+                except OSError:
+                    continue  # interface is down or has no IPv4 address
+                interfaces.append((name, socket.inet_ntoa(packed[20:24])))
+        return interfaces
+
+    # Last resort: whatever the resolver knows about our hostname (no interface names)
+    try:
+        infos = socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET)
+    except OSError:
+        return []
+    return [("", info[4][0]) for info in infos]
+
+
+def route_address(destination=PROBE_ADDRESS):
+    """Local address the kernel would use to reach `destination`, without sending anything."""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((destination, 1))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+
+def pick_lan_address(interfaces, routed=None):
+    """Choose the address other devices on the LAN should use to reach this machine.
+
+    Prefers the address on the default route, then private addresses on
+    physical interfaces, then anything that isn't loopback or link-local.
+    """
+    def usable(name, address):
+        ip = ipaddress.ip_address(address)
+        return not (ip.is_loopback or ip.is_link_local or ip.is_unspecified)
+
+    candidates = [(name, address) for name, address in interfaces if usable(name, address)]
+    physical = [(name, address) for name, address in candidates if not name.startswith(VIRTUAL_PREFIXES)]
+
+    if routed and any(address == routed for _, address in physical):
+        return routed
+    for name, address in physical:
+        if ipaddress.ip_address(address).is_private:
+            return address
+    if physical:
+        return physical[0][1]
+    if routed and usable("", routed):
+        return routed
+    if candidates:
+        return candidates[0][1]
+    return "127.0.0.1"
+
+
+class NetworkIdentity:
+    """Caches this machine's interfaces and LAN address so reading them costs nothing.
+
+    The first read scans the interfaces; after that a daemon thread rescans
+    every `check_interval` seconds and only swaps in new values when the
+    interfaces or the default route actually changed.
+    """
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._address = "127.0.0.1"
+        self._peer_addresses = {}
+        self._monitor = None
+        self._stop = threading.Event()
+
+    def ip_address(self):
+        """The best LAN address for this machine."""
+        self._ensure_started()
+        return self._address
+
+    def interfaces(self):
+        """Cached (name, address) pairs for every IPv4 interface."""
+        self._ensure_started()
+        return list(self._snapshot[0])
+
+    def address_for_peer(self, peer_ip):
+        """Our address on the interface that routes to `peer_ip`, for multi-homed hosts."""
+        self._ensure_started()
+        address = self._peer_addresses.get(peer_ip)
+        if address is None:
+            address = route_address(peer_ip) or self._address
+            self._peer_addresses[peer_ip] = address
+        return address
+
+    def refresh(self):
+        """Rescan now; returns True if anything changed."""
+        snapshot = (tuple(list_interfaces()), route_address())
+        with self._lock:
+            if snapshot == self._snapshot:
+                return False
+            self._snapshot = snapshot
+            self._address = pick_lan_address(*snapshot)
+            self._peer_addresses = {}
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def _ensure_started(self):
+        if self._monitor is not None:
+            return
+        with self._lock:
+            if self._monitor is not None:
+                return
+            self._monitor = threading.Thread(target=self._watch, daemon=True)
+        self.refresh()
+        self._monitor.start()
+
+    def _watch(self):
+        while not self._stop.wait(self.check_interval):
+            try:
+                if self.refresh():
+                    print(f"🌐 Network changed. Your IP address is now: {self._address}")
+            except Exception as e:
+                print(f"Error checking network interfaces: {e}")
+
+
+identity = NetworkIdentity()
+
+
+def get_ip_address():
+    """Get the local LAN IP address of the device (cached, never blocks on DNS)."""
+    return identity.ip_address()
@@ -0,0 +1,58 @@
+import time
+
+import cv2
+
+from gesture_engine import GestureEngine
+from gesture_state import GestureStateMachine, hand_keys
+
+STAGES = ("flip", "cvtColor", "hands.process", "classify", "vote")
+
+
+class PipelineStep:
+    """What the pipeline made of one frame."""
+
+    def __init__(self, frame, result, poses, events, timings):
+        self.frame = frame  # the (mirrored) BGR frame the landmarks refer to, or None on landmark replay
+        self.result = result  # MediaPipe-style result: multi_hand_landmarks, multi_handedness
+        self.poses = poses  # a HandPose per hand
+        self.events = events  # gestures that fired on this frame
+        self.timings = timings  # stage (see STAGES) -> ms
+
+
+class GesturePipeline:
+    """Camera frame in, debounced gesture events out: mirror, track, classify, vote.
+
+    The live scripts and the replay tools run the same object, so anything
+    measured on a recording holds for the camera. `process()` takes a camera
+    frame; `process_landmarks()` starts from landmarks that were already
+    found (e.g. replayed from a recording) and needs no MediaPipe at all.
+    Pass `now` to run the state machine on a recording's clock.
+    """
+
+    def __init__(self, tracker=None, engine=None, events=None, mirror=True):
+        self.tracker = tracker
+        self.engine = engine or GestureEngine()
+        self.events = events or GestureStateMachine()
+        self.mirror = mirror
+
+    def process(self, frame, now=None):
+        start = time.perf_counter()
+        if self.mirror:
+            frame = cv2.flip(frame, 1)
+        flipped = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        converted = time.perf_counter()
+        result = self.tracker.process(rgb_frame)
+        timings = {"flip": (flipped - start) * 1000, "cvtColor": (converted - flipped) * 1000,
+                   "hands.process": (time.perf_counter() - converted) * 1000}
+        return self.process_landmarks(result, (frame.shape[1], frame.shape[0]), now, frame, timings)
+
+    def process_landmarks(self, result, frame_size, now=None, frame=None, timings=None):
+        timings = {} if timings is None else timings
+        start = time.perf_counter()
+        poses = self.engine.analyze(result.multi_hand_landmarks, frame_size)
+        classified = time.perf_counter()
+        events = self.events.update([pose.gesture for pose in poses], hand_keys(result), now)
+        timings["classify"] = (classified - start) * 1000
+        timings["vote"] = (time.perf_counter() - classified) * 1000
+        return PipelineStep(frame, result, poses, events, timings)
@@ -0,0 +1,57 @@
+import time
+
+import cv2
+
+PREVIEW_FPS = 15  # the preview window redraws at most this often; inference still sees every frame
+
+
+class PreviewRenderer:
+    """Decides when the preview window gets drawn, so drawing never sets the inference rate.
+
+    Call `due()` once per processed frame and only draw (landmarks, text,
+    overlays) and `show()` when it returns True. Headless, it is never due:
+    nothing is drawn, no window is opened and no HighGUI call is made, so
+    the loop runs on machines without a display or with opencv-headless.
+    """
+
+    def __init__(self, window, max_fps=PREVIEW_FPS, headless=False):
+        self.window = window
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.headless = headless
+        self.rendered = 0
+        self.skipped = 0
+        self._next = 0.0
+        self._opened = False
+
+    def due(self):
+        """True if this frame should be drawn and shown."""
+        if self.headless:
+            return False
+        now = time.monotonic()
+        if now < self._next:
+            self.skipped += 1
+            return False
+        # Schedule from the ideal time so the rate holds steady, but don't bank missed slots
+        self._next = max(self._next + self.interval, now)
+        return True
+
+    def show(self, frame):
+        """Show the frame and pump window events; returns the key pressed (0-255) or -1."""
+        self.draw(frame)
+        return self.poll()
+
+    def draw(self, frame):
+        """Hand the frame to the window; the first half of show(), for callers that time the two apart."""
+        cv2.imshow(self.window, frame)
+        self._opened = True
+        self.rendered += 1
+
+    def poll(self):
+        """Pump window events, which is when the frame actually appears; returns the key pressed or -1."""
+        key = cv2.waitKey(1)
+        return key & 0xFF if key != -1 else -1
+
+    def close(self):
+        if self._opened:
+            cv2.destroyWindow(self.window)
+            self._opened = False
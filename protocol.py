@@ -0,0 +1,411 @@
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import struct
+import time
+import zlib
+
+import transfer
+
+# Every frame: magic, version, frame type, stream id, body length, CRC-32 of the body
+MAGIC = b"AS"
+VERSION = 1
+HEADER = struct.Struct("!2sBBIII")
+OFFSET = struct.Struct("!Q")  # leads every DATA body: where in the file the chunk belongs
+
+HELLO = 1  # sender -> receiver: JSON metadata (name, type, size, sha256)
+RESUME = 2  # receiver -> sender: JSON {"offset": bytes already held}
+DATA = 3  # sender -> receiver: offset + chunk
+END = 4  # sender -> receiver: no more chunks
+DONE = 5  # receiver -> sender: JSON {"ok": bool, "error": str}
+OPEN = 6  # sender -> receiver: JSON {"session": id, ...}; answered with OPEN when the receiver accepts a session
+# (with a verification code, both carry the key exchange, and a second OPEN from the sender confirms it)
+PING = 7  # either way, empty; keeps an idle session alive
+PONG = 8
+CANCEL = 9  # sender -> receiver: abandon a stream, keeping its partial file
+
+MAX_METADATA = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+SEAL_OVERHEAD = 8 + 16  # frame number and AES-GCM tag added to every body of an encrypted session (secure.py)
+MAX_IN_MEMORY = 64 * 1024 * 1024  # largest payload a receiver buffers instead of writing to disk
+PARTIAL_DIR = ".partial"  # under the output directory; holds interrupted transfers until they resume
+PARTIAL_MAX_AGE = 24 * 60 * 60  # seconds an abandoned partial file is kept
+
+
+class ProtocolError(Exception):
+    """A frame was malformed, failed its checksum or arrived out of order."""
+
+
+class FramingUnsupported(transfer.IncompatiblePeer):
+    """The receiver hung up on our HELLO; it only understands the plain size header."""
+
+
+def pack_frame(frame_type, body=b"", stream=0):
+    """Frame header announcing `body`; callers send the body right after it."""
+    return HEADER.pack(MAGIC, VERSION, frame_type, stream, len(body), zlib.crc32(body))
+
+
+def sealed_header(frame_type, length, stream=0):
+    """Frame header for an encrypted body, whose AEAD tag stands in for the CRC (left 0)."""
+    return HEADER.pack(MAGIC, VERSION, frame_type, stream, length, 0)
+
+
+def send_frame(sock, frame_type, body=b"", stream=0):
+    sock.sendall(pack_frame(frame_type, body, stream) + bytes(body))
+
+
+def send_json(sock, frame_type, value, stream=0):
+    send_frame(sock, frame_type, json.dumps(value).encode(), stream)
+
+
+def parse_header(header):
+    """Validate a frame header; returns (type, stream, length, crc)."""
+    magic, version, frame_type, stream, length, crc = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad frame magic {magic!r}")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    limit = (OFFSET.size + MAX_CHUNK if frame_type == DATA else MAX_METADATA) + SEAL_OVERHEAD
+    if length > limit:
+        raise ProtocolError(f"Frame of {length} bytes exceeds the {limit} byte limit")
+    return frame_type, stream, length, crc
+
+
+def check_body(body, crc):
+    if zlib.crc32(body) != crc:
+        raise ProtocolError("Frame checksum mismatch")
+    return body
+
+
+def recv_frame(sock, sealed=False):
+    """Read one frame from a blocking socket; returns (type, stream, body).
+
+    Sealed frames skip the CRC: their body is checked when it's decrypted.
+    """
+    frame_type, stream, length, crc = parse_header(transfer.recv_exactly(sock, HEADER.size))
+    body = transfer.recv_exactly(sock, length)
+    return frame_type, stream, body if sealed else check_body(body, crc)
+
+
+def describe(payload, name=None):
+    """HELLO metadata for a payload: an EncodedImage, a file path or a bytes-like buffer."""
+    data = getattr(payload, "data", payload)
+    digest = hashlib.sha256()
+    if isinstance(data, (str, os.PathLike)):
+        name = name or os.path.basename(data)
+        with open(data, 'rb') as f:
+            for chunk in iter(lambda: f.read(transfer.DEFAULT_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    else:
+        digest.update(data)
+    extension = getattr(payload, "extension", "")
+    return {
+        "name": name or f"screenshot{extension}",
+        "type": getattr(payload, "content_type", "application/octet-stream"),
+        "size": transfer.payload_size(data),
+        "sha256": digest.hexdigest(),
+    }
+
+
+def send_framed(sock, payload, metadata, chunk_size=transfer.DEFAULT_CHUNK_SIZE, progress=None, cancel=None):
+    """Send a payload as HELLO, DATA... END, starting at whatever offset the receiver already holds.
+
+    Returns the bytes sent on this connection. Raises FramingUnsupported if
+    the receiver closes the connection instead of answering HELLO.
+    """
+    # Small frames follow large writes; don't let Nagle hold them back
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    send_json(sock, HELLO, metadata)
+    try:
+        frame_type, _, body = recv_frame(sock)
+    except (ConnectionError, struct.error) as e:
+        raise FramingUnsupported(f"Receiver closed the connection after HELLO ({e})")
+    reply = json.loads(body)
+    if frame_type == DONE:
+        raise ProtocolError(f"Receiver refused the transfer: {reply.get('error')}")
+    if frame_type != RESUME:
+        raise ProtocolError(f"Expected RESUME, got frame type {frame_type}")
+
+    total = metadata["size"]
+    offset = reply.get("offset", 0)
+    if not 0 <= offset <= total:
+        raise ProtocolError(f"Receiver asked to resume at {offset} of {total} bytes")
+    if offset:
+        print(f"Resuming transfer at {offset / 1024:.0f} of {total / 1024:.0f} KB")
+
+    sent = 0
+    for position, chunk in iter_chunks(getattr(payload, "data", payload), offset, chunk_size):
+        if cancel is not None and cancel.is_set():
+            raise transfer.TransferCancelled()
+        sock.sendall(data_header(position, chunk))
+        sock.sendall(chunk)
+        sent += len(chunk)
+        if progress:
+            progress(position + len(chunk), total)
+
+    send_frame(sock, END)
+    frame_type, _, body = recv_frame(sock)
+    reply = json.loads(body)
+    if frame_type != DONE or not reply.get("ok"):
+        raise ProtocolError(f"Receiver rejected the transfer: {reply.get('error')}")
+    return sent
+
+
+def data_header(position, chunk, stream=0):
+    """Frame header plus offset for a DATA frame; the chunk itself follows it on the wire."""
+    prefix = OFFSET.pack(position)
+    crc = zlib.crc32(chunk, zlib.crc32(prefix))
+    return HEADER.pack(MAGIC, VERSION, DATA, stream, len(prefix) + len(chunk), crc) + prefix
+
+
+def iter_chunks(data, offset=0, chunk_size=transfer.DEFAULT_CHUNK_SIZE):
+    """(offset, chunk) pairs covering a file path or buffer from `offset` to the end."""
+    if isinstance(data, (str, os.PathLike)):
+        return _file_chunks(data, offset, chunk_size)
+    return _buffer_chunks(data, offset, chunk_size)
+
+
+def _buffer_chunks(data, offset, chunk_size):
+    view = memoryview(data).cast('B')
+    for position in range(offset, len(view), chunk_size):
+        yield position, view[position:position + chunk_size]
+
+
+def _file_chunks(path, offset, chunk_size):
+    """Read a file from `offset` through one reusable buffer."""
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        position = offset
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            yield position, view[:n]
+            position += n
+
+
+def send_to(host, port, payload, metadata=None, timeout=5, retries=3, retry_delay=2, progress=None,
+            cancel=None, chunk_size=transfer.DEFAULT_CHUNK_SIZE):
+    """Send a payload with the framed protocol, retrying; each retry resumes where the last one stopped."""
+    if metadata is None:
+        metadata = describe(payload)
+
+    def send(sock, payload, progress=None, cancel=None):
+        return send_framed(sock, payload, metadata, chunk_size, progress=progress, cancel=cancel)
+
+    return transfer.send_to(host, port, getattr(payload, "data", payload), timeout=timeout, retries=retries,
+                            retry_delay=retry_delay, progress=progress, cancel=cancel, send=send)
+
+
+class FrameReader:
+    """Reads frames from a non-blocking socket, starting with bytes already pulled off it."""
+
+    def __init__(self, sock, initial=b""):
+        self.sock = sock
+        self.sealed = False  # set once the connection is encrypted, whose frames carry no CRC
+        self._pending = bytes(initial)
+
+    async def read_exactly(self, size):
+        if len(self._pending) >= size:
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+        data, self._pending = self._pending, b""
+        return data + await transfer.recv_exactly_async(self.sock, size - len(data))
+
+    async def peek_type(self):
+        """Type of the next frame, without consuming it."""
+        if len(self._pending) < HEADER.size:
+            self._pending += await transfer.recv_exactly_async(self.sock, HEADER.size - len(self._pending))
+        return parse_header(self._pending[:HEADER.size])[0]
+
+    async def read_frame(self):
+        """Next frame as (type, stream, body); raises ProtocolError on a bad header or checksum."""
+        frame_type, stream, length, crc = parse_header(await self.read_exactly(HEADER.size))
+        body = await self.read_exactly(length)
+        return frame_type, stream, body if self.sealed else check_body(body, crc)
+
+
+async def receive_framed(reader, peer, output_dir, path, in_progress):
+    """Receive one framed transfer into `path`, resuming from an earlier partial copy if there is one.
+
+    `in_progress` is the set of partial files currently being written, shared
+    by all connections. Returns the metadata from HELLO. The partial file is
+    read, hashed and written from the default executor, never on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    sock = reader.sock
+    frame_type, _, body = await reader.read_frame()
+    if frame_type != HELLO:
+        raise ProtocolError(f"Expected HELLO, got frame type {frame_type}")
+    try:
+        metadata = check_metadata(json.loads(body))
+        incoming = IncomingFile(metadata, partial_path(output_dir, peer, metadata["sha256"]), in_progress)
+    except (ValueError, ProtocolError) as e:
+        await send_json_async(sock, DONE, {"ok": False, "error": str(e)})
+        raise
+
+    try:
+        await loop.run_in_executor(None, incoming.open)
+        await send_json_async(sock, RESUME, {"offset": incoming.offset})
+        while True:
+            frame_type, _, body = await reader.read_frame()
+            if frame_type == END:
+                break
+            if frame_type != DATA:
+                raise ProtocolError(f"Expected DATA, got frame type {frame_type}")
+            await loop.run_in_executor(None, incoming.write, *split_data(body))
+        try:
+            await loop.run_in_executor(None, incoming.finish, path)
+        except ProtocolError as e:
+            await send_json_async(sock, DONE, {"ok": False, "error": str(e)})
+            raise
+    finally:
+        incoming.close()
+
+    await send_json_async(sock, DONE, {"ok": True})
+    return metadata
+
+
+class IncomingFile:
+    """Receiver side of one framed transfer: chunks land in a partial file that outlives the connection.
+
+    Chunks are written only after their checksum passes, so whatever the
+    partial file holds when a connection drops is good data and the sender's
+    retry picks up from its end (`offset`). With `restart` the partial file
+    is emptied instead, for senders that start streaming before they hear
+    the offset.
+
+    Creating one only claims the partial file in `in_progress`, which is
+    safe on the event loop. `open`, `write` and `finish` touch the disk and
+    are meant for an executor thread.
+    """
+
+    def __init__(self, metadata, partial, in_progress, restart=False):
+        if partial in in_progress:
+            raise ProtocolError(f"{metadata['name']} is already being received")
+        self.metadata = metadata
+        self.size = metadata["size"]
+        self.partial = partial
+        self.offset = 0
+        self._restart = restart
+        self._in_progress = in_progress
+        self._digest = hashlib.sha256()
+        self._file = None
+        self.closed = False
+        in_progress.add(partial)
+
+    def open(self):
+        """Open the partial file and find where to resume; hashes whatever it already holds."""
+        self._file = open(self.partial, 'ab+')
+        self.offset = self._file.tell()
+        if self._restart or self.offset > self.size:
+            self._file.truncate(0)
+            self.offset = 0
+        else:
+            # Everything already on disk passed its checksum; hash it so the final check covers the whole file
+            self._file.seek(0)
+            for chunk in iter(lambda: self._file.read(transfer.DEFAULT_CHUNK_SIZE), b""):
+                self._digest.update(chunk)
+
+    def write(self, position, chunk):
+        if position != self.offset or self.offset + len(chunk) > self.size:
+            raise ProtocolError(f"Chunk at {position} doesn't continue the file at {self.offset}")
+        self._file.write(chunk)
+        self._digest.update(chunk)
+        self.offset += len(chunk)
+
+    def finish(self, path):
+        """Check the whole file against its SHA-256 and move it to `path`."""
+        self._file.close()
+        try:
+            if self.offset != self.size or self._digest.hexdigest() != self.metadata["sha256"]:
+                # The pieces checked out but the whole doesn't; start this file over next time
+                os.remove(self.partial)
+                raise ProtocolError(f"{self.metadata['name']} failed its SHA-256 check")
+            os.replace(self.partial, path)
+        finally:
+            # Only now may another connection claim the partial path again
+            self.close()
+
+    def close(self):
+        """Stop writing; the partial file stays for a later resume."""
+        if not self.closed:
+            if self._file is not None:
+                self._file.close()
+            self.closed = True
+            self._in_progress.discard(self.partial)
+
+
+class IncomingBuffer:
+    """IncomingFile for small payloads that are consumed in memory and never resumed."""
+
+    def __init__(self, metadata):
+        if metadata["size"] > MAX_IN_MEMORY:
+            raise ProtocolError(f"{metadata['size']} bytes is too large to receive in memory")
+        self.metadata = metadata
+        self.size = metadata["size"]
+        self.offset = 0
+        self._data = bytearray()
+
+    def write(self, position, chunk):
+        if position != self.offset or self.offset + len(chunk) > self.size:
+            raise ProtocolError(f"Chunk at {position} doesn't continue the buffer at {self.offset}")
+        self._data += chunk
+        self.offset += len(chunk)
+
+    def finish(self):
+        """The received bytes, once they match their SHA-256."""
+        if self.offset != self.size or hashlib.sha256(self._data).hexdigest() != self.metadata["sha256"]:
+            raise ProtocolError(f"{self.metadata['name']} failed its SHA-256 check")
+        return self._data
+
+    def close(self):
+        pass
+
+
+def split_data(body):
+    """(offset, chunk) from the body of a DATA frame."""
+    (position,) = OFFSET.unpack_from(body)
+    return position, memoryview(body)[OFFSET.size:]
+
+
+def partial_path(output_dir, peer, sha256):
+    """Where an interrupted transfer of `sha256` from `peer` is kept until it resumes."""
+    directory = os.path.join(output_dir, PARTIAL_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{peer}-{sha256[:32]}.part")
+
+
+def clean_partials(output_dir, max_age=PARTIAL_MAX_AGE):
+    """Delete partial transfers nobody came back to finish."""
+    directory = os.path.join(output_dir, PARTIAL_DIR)
+    if not os.path.isdir(directory):
+        return
+    cutoff = time.time() - max_age
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def check_metadata(metadata):
+    """Validate HELLO metadata from an untrusted sender."""
+    size = metadata.get("size")
+    sha256 = metadata.get("sha256")
+    if not isinstance(size, int) or size < 0:
+        raise ProtocolError(f"Bad size in HELLO: {size!r}")
+    if not isinstance(sha256, str) or len(sha256) != 64 or not all(c in "0123456789abcdef" for c in sha256):
+        raise ProtocolError(f"Bad sha256 in HELLO: {sha256!r}")
+    metadata.setdefault("name", "screenshot")
+    return metadata
+
+
+async def send_json_async(sock, frame_type, value, stream=0):
+    body = json.dumps(value).encode()
+    await asyncio.get_running_loop().sock_sendall(sock, pack_frame(frame_type, body, stream) + body)
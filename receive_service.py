@@ -0,0 +1,448 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+import protocol
+import secure
+import session
+import tile_delta
+import transfer
+from screenshot_encoder import CODECS, DEFAULT_CODEC, decode_image, encode_image
+
+PORT = 5001
+DEFAULT_MAX_CONCURRENT = 16  # connections streamed at once; the rest wait in the accept backlog
+ACCEPT_BACKLOG = 128  # pending connections the kernel queues instead of refusing
+HEADER_TIMEOUT = 10  # seconds a sender gets to send its first frame or the file size
+SESSION_TIMEOUT = 2 * session.HEARTBEAT_TIMEOUT  # a session silent for this long is closed
+
+
+class ReceiveService:
+    """Persistent, event-driven receive server that takes screenshots from many senders at once.
+
+    All connections are multiplexed on one asyncio loop running in a daemon
+    thread. At most `max_concurrent` transfers are streamed at a time; while
+    that limit is reached the service stops accepting, so further senders
+    queue in the kernel backlog (backpressure) rather than being refused.
+    Long-lived sessions, which carry many transfers each, don't hold a slot.
+    Sessions are told which codecs this side decodes. Screenshots that
+    arrive as raw pixels, or in another format than `save_codec` when one
+    is set, are re-encoded off the loop before `on_received` sees them.
+    With a verification `code`, only encrypted sessions from senders with
+    the same code are taken; everything else is turned away.
+    """
+
+    def __init__(self, port=PORT, output_dir="received_screenshots", max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 chunk_size=transfer.DEFAULT_CHUNK_SIZE, on_received=None, host='', save_codec=None, code=None):
+        if code is not None:
+            secure.require()
+        if save_codec is not None and save_codec not in CODECS:
+            raise ValueError(f"Unknown codec {save_codec!r}; choose one of {', '.join(CODECS)}")
+        self.port = port
+        self.host = host
+        self.output_dir = output_dir
+        self.max_concurrent = max_concurrent
+        self.chunk_size = chunk_size
+        self.on_received = on_received
+        self.save_codec = save_codec
+        self.code = code
+        self.tile_cache = tile_delta.PeerTileCache()
+        self._partials = set()  # partial files of framed transfers in progress
+        self._connections = set()  # tasks serving open connections
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self._loop = None
+        self._thread = None
+        self._server = None
+        self._ready = threading.Event()
+        self._start_error = None
+        self._counter = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Bind the port and start serving in the background; raises if the port can't be bound."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        protocol.clean_partials(self.output_dir)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._start_error:
+            raise self._start_error
+
+    def stop(self):
+        """Stop accepting, close the listening socket and drop open connections."""
+        if self._loop and self.running:
+            self._loop.call_soon_threadsafe(self._shutdown.set)
+            self._thread.join(timeout=5)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+
+    async def _serve(self):
+        loop = asyncio.get_running_loop()
+        self._shutdown = asyncio.Event()
+        try:
+            self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self._server.bind((self.host, self.port))
+            self._server.listen(ACCEPT_BACKLOG)
+            self._server.setblocking(False)
+        except OSError as e:
+            self._start_error = e
+            self._server.close()
+            self._ready.set()
+            return
+        self._ready.set()
+
+        slots = asyncio.Semaphore(self.max_concurrent)
+        accept_task = loop.create_task(self._accept_loop(slots))
+        await self._shutdown.wait()
+        accept_task.cancel()
+        self._server.close()
+        # Close open connections too, so session peers notice at once rather than by heartbeat
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+
+    async def _accept_loop(self, slots):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Only accept when a slot is free so excess senders wait in the backlog
+            await slots.acquire()
+            try:
+                conn, addr = await loop.sock_accept(self._server)
+            except OSError as e:
+                slots.release()
+                print(f"\n❌ Error accepting connection: {e}")
+                continue
+            conn.setblocking(False)
+            task = loop.create_task(self._handle(conn, addr, slots))
+            self._connections.add(task)
+            task.add_done_callback(self._connections.discard)
+
+    async def _handle(self, conn, addr, slots):
+        loop = asyncio.get_running_loop()
+        self.active += 1
+        holding_slot = True
+        try:
+            with conn:
+                # Framed senders open with HELLO or OPEN; older ones send the delta marker or the file size
+                header = await asyncio.wait_for(loop.sock_recv(conn, 1024), HEADER_TIMEOUT)
+                reader = protocol.FrameReader(conn, header)
+                if header.startswith(protocol.MAGIC) and await reader.peek_type() == protocol.OPEN:
+                    slots.release()
+                    holding_slot = False
+                    await self._serve_session(reader, addr)
+                    return
+                if self.code is not None:
+                    self.failed += 1
+                    print(f"\n🔒 Turned away an unencrypted transfer from {addr[0]}")
+                    if header.startswith(protocol.MAGIC):
+                        # Framed senders can be told why; the plain size header has no way to say no
+                        await protocol.send_json_async(conn, protocol.DONE, {
+                            "ok": False, "error": "this receiver only takes encrypted sessions"})
+                    return
+
+                print(f"\nReceiving screenshot from {addr[0]}")
+                if header.startswith(protocol.MAGIC):
+                    path = self._output_path(addr)
+                    await protocol.receive_framed(reader, addr[0], self.output_dir, path, self._partials)
+                elif header == tile_delta.DELTA_HEADER:
+                    await loop.sock_sendall(conn, b"ACK")
+                    path = await self._receive_delta(conn, addr)
+                else:
+                    file_size = int(header.decode())
+                    await loop.sock_sendall(conn, b"ACK")
+
+                    path = self._output_path(addr)
+                    buffer = bytearray(min(self.chunk_size, max(file_size, 1)))
+                    await transfer.receive_file_async(conn, file_size, path, buffer)
+
+            self._received(path, addr)
+        except Exception as e:
+            self.failed += 1
+            print(f"\n❌ Error receiving screenshot from {addr[0]}: {e!r}")
+        finally:
+            self.active -= 1
+            if holding_slot:
+                slots.release()
+
+    def _received(self, path, addr):
+        """Name a finished file after its real format, count it and hand it on to be saved and reported."""
+        # Senders may encode as PNG, JPEG, WebP or raw pixels; name the file after what actually arrived
+        extension = transfer.sniff_extension(path)
+        if not path.endswith(extension):
+            renamed = os.path.splitext(path)[0] + extension
+            os.replace(path, renamed)
+            path = renamed
+
+        self.completed += 1
+        save_codec = self.save_codec or (DEFAULT_CODEC if extension == CODECS["raw-zlib"][2] else None)
+        if save_codec and extension != CODECS[save_codec][2]:
+            # Decoding and re-encoding takes a while, and callbacks may block (e.g. opening an image
+            # viewer), so both stay off the loop
+            asyncio.get_running_loop().run_in_executor(None, self._convert, path, addr, save_codec)
+        else:
+            asyncio.get_running_loop().run_in_executor(None, self._deliver, path, addr)
+        return path
+
+    def _convert(self, path, addr, codec):
+        """Re-encode a received screenshot as `codec`, replacing the file it arrived in."""
+        try:
+            with open(path, 'rb') as f:
+                encoded = encode_image(decode_image(f.read()), codec)
+            converted = os.path.splitext(path)[0] + encoded.extension
+            with transfer.atomic_output(converted, encoded.size) as f:
+                f.write(encoded.data)
+            os.remove(path)
+            path = converted
+        except Exception as e:
+            print(f"\n❌ Couldn't save {path} as {codec}: {e}")
+        self._deliver(path, addr)
+
+    def _deliver(self, path, addr):
+        print(f"✅ Screenshot from {addr[0]} saved to {path}")
+        if self.on_received:
+            self.on_received(path, addr)
+
+    async def _serve_session(self, reader, addr):
+        """Receive any number of interleaved streams over one long-lived connection."""
+        loop = asyncio.get_running_loop()
+        conn = reader.sock
+        peer = addr[0]
+        write_lock = asyncio.Lock()
+        channel = None
+
+        async def send(frame_type, value=None, stream=0):
+            body = b"" if value is None else json.dumps(value).encode()
+            async with write_lock:
+                if channel is not None:
+                    frame = b"".join(channel.seal(frame_type, body, stream))
+                else:
+                    frame = protocol.pack_frame(frame_type, body, stream) + body
+                await loop.sock_sendall(conn, frame)
+
+        frame_type, _, body = await reader.read_frame()
+        # Echo the session id and say which codecs we decode, so the sender can pick one for the link
+        opening = json.loads(body)
+        reply = dict(opening, codecs=list(CODECS))
+        reply.pop("spake2", None)  # only answered with our own half of the exchange
+        if self.code is not None:
+            if "spake2" not in opening:
+                self.failed += 1
+                await send(protocol.OPEN, {"error": "this receiver needs a verification code"})
+                print(f"\n🔒 Turned away a session without a verification code from {peer}")
+                return
+            try:
+                # A few big modular exponentiations; keep them off the loop
+                exchange = await loop.run_in_executor(None, self._key_exchange, opening)
+            except secure.VerificationFailed as e:
+                self.failed += 1
+                print(f"\n🔒 Turned away a session from {peer}: {e}")
+                return
+            reply.update(spake2=exchange.message(), confirm=exchange.confirmation())
+        await send(protocol.OPEN, reply)
+        if self.code is not None:
+            try:
+                frame_type, _, body = await asyncio.wait_for(reader.read_frame(), HEADER_TIMEOUT)
+            except ConnectionError:
+                self.failed += 1
+                print(f"\n🔒 {peer} hung up during the key exchange (a different verification code?)")
+                return
+            try:
+                if frame_type != protocol.OPEN:
+                    raise secure.VerificationFailed(f"expected the sender's confirmation, got frame type {frame_type}")
+                exchange.verify(json.loads(body).get("confirm"))
+            except secure.VerificationFailed as e:
+                self.failed += 1
+                print(f"\n🔒 Turned away a session from {peer}: {e}")
+                return
+            channel = exchange.channel()
+            reader.sealed = True
+        print(f"\n🔗 {'Encrypted session' if channel else 'Session'} opened with {peer}")
+
+        streams = {}  # stream id -> IncomingFile or IncomingBuffer
+        tasks = set()
+        last_frame = loop.time()
+        expired = False
+
+        def watchdog():
+            # One timer for the whole session; wrapping every read in wait_for costs a task per frame
+            nonlocal timer, expired
+            if loop.time() - last_frame > SESSION_TIMEOUT:
+                expired = True
+                conn.shutdown(socket.SHUT_RDWR)  # the pending read sees the connection close
+            else:
+                timer = loop.call_later(session.HEARTBEAT_INTERVAL, watchdog)
+
+        timer = loop.call_later(session.HEARTBEAT_INTERVAL, watchdog)
+        try:
+            while True:
+                frame_type, stream, body = await reader.read_frame()
+                if channel is not None:
+                    body = channel.open(frame_type, stream, body)
+                last_frame = loop.time()
+
+                if frame_type == protocol.PING:
+                    await send(protocol.PONG)
+                elif frame_type == protocol.HELLO:
+                    try:
+                        streams[stream] = await self._open_stream(peer, json.loads(body))
+                    except (ValueError, protocol.ProtocolError) as e:
+                        self.failed += 1
+                        await send(protocol.DONE, {"ok": False, "error": str(e)}, stream)
+                        continue
+                    if not streams[stream].metadata.get("pipelined"):
+                        await send(protocol.RESUME, {"offset": streams[stream].offset}, stream)
+                elif frame_type == protocol.DATA:
+                    incoming = streams.get(stream)
+                    if incoming is None:
+                        continue  # a stream we already rejected; drop the rest of it
+                    try:
+                        if isinstance(incoming, protocol.IncomingFile):
+                            # Awaited before the next frame is read, so a stream's chunks still land in order
+                            await loop.run_in_executor(None, incoming.write, *protocol.split_data(body))
+                        else:
+                            incoming.write(*protocol.split_data(body))
+                    except protocol.ProtocolError as e:
+                        streams.pop(stream).close()
+                        self.failed += 1
+                        await send(protocol.DONE, {"ok": False, "error": str(e)}, stream)
+                elif frame_type == protocol.CANCEL:
+                    if stream in streams:
+                        streams.pop(stream).close()
+                elif frame_type == protocol.END:
+                    incoming = streams.pop(stream, None)
+                    if incoming is not None:
+                        # Finish off the loop's critical path so other streams keep flowing meanwhile
+                        task = loop.create_task(self._finish_stream(incoming, addr, stream, send))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                elif frame_type != protocol.PONG:
+                    raise protocol.ProtocolError(f"Unexpected frame type {frame_type} in a session")
+        except ConnectionError as e:
+            reason = f"no heartbeat for {SESSION_TIMEOUT:.0f} seconds" if expired else e
+            print(f"\n🔌 Session with {peer} closed ({reason})")
+        finally:
+            timer.cancel()
+            for incoming in streams.values():
+                incoming.close()
+            for task in tasks:
+                task.cancel()
+
+    def _key_exchange(self, opening):
+        return secure.KeyExchange(self.code, secure.RECEIVER, str(opening.get("session", ""))).finish(
+            opening["spake2"])
+
+    async def _open_stream(self, peer, metadata):
+        metadata = protocol.check_metadata(metadata)
+        if metadata.get("kind") == "delta":
+            return protocol.IncomingBuffer(metadata)
+        partial = protocol.partial_path(self.output_dir, peer, metadata["sha256"])
+        incoming = protocol.IncomingFile(metadata, partial, self._partials, restart=metadata.get("pipelined", False))
+        try:
+            # Re-hashing a large partial for RESUME takes a while; keep it off the loop
+            await asyncio.get_running_loop().run_in_executor(None, incoming.open)
+        except OSError:
+            incoming.close()
+            raise
+        return incoming
+
+    async def _finish_stream(self, incoming, addr, stream, send):
+        loop = asyncio.get_running_loop()
+        peer = addr[0]
+        try:
+            path = self._output_path(addr)
+            if isinstance(incoming, protocol.IncomingFile):
+                await loop.run_in_executor(None, incoming.finish, path)
+                self._received(path, addr)
+                await send(protocol.DONE, {"ok": True}, stream)
+                return
+
+            manifest, content = tile_delta.read_delta(incoming.finish())
+            if manifest[0] == tile_delta.MODE_FULL:
+                await self._store_full(peer, manifest, content, path)
+                self._received(path, addr)
+                await send(protocol.DONE, {"ok": True}, stream)
+                return
+
+            pixels = self._rebuild(peer, manifest, content)
+            if pixels is None:
+                # The stream itself arrived fine, but our cache can't rebuild it; ask for the full image
+                await send(protocol.DONE, {"ok": True, "need_full": True}, stream)
+                return
+            # The frame is held once it's in the cache; release the sender before the slow PNG encode
+            await send(protocol.DONE, {"ok": True}, stream)
+            await loop.run_in_executor(None, tile_delta.save_pixels, pixels, path)
+            self._received(path, addr)
+        except Exception as e:
+            self.failed += 1
+            print(f"\n❌ Error receiving screenshot from {peer}: {e!r}")
+            try:
+                await send(protocol.DONE, {"ok": False, "error": str(e)}, stream)
+            except OSError:
+                pass
+
+    async def _receive_delta(self, conn, addr):
+        """Rebuild a screenshot from new tiles plus the ones cached from this sender's last frames."""
+        loop = asyncio.get_running_loop()
+        peer = addr[0]
+        header = await transfer.recv_exactly_async(conn, tile_delta.MANIFEST.size)
+        count = tile_delta.MANIFEST.unpack(header)[-1]
+        digest_bytes = await transfer.recv_exactly_async(conn, count * tile_delta.DIGEST_SIZE)
+        manifest = tile_delta.parse_manifest(header, digest_bytes)
+        path = self._output_path(addr)
+
+        if manifest[0] == tile_delta.MODE_DELTA:
+            pixels = self._rebuild(peer, manifest, await tile_delta.receive_tiles(conn, manifest[-1]))
+            if pixels is None:
+                # Our cache doesn't match what the sender assumed; ask for the whole image
+                await loop.sock_sendall(conn, tile_delta.REPLY_NEED_FULL)
+            else:
+                # The frame is held once it's in the cache; release the sender before the slow PNG encode
+                await loop.sock_sendall(conn, tile_delta.REPLY_OK)
+                await loop.run_in_executor(None, tile_delta.save_pixels, pixels, path)
+                return path
+
+        await self._store_full(peer, manifest, await tile_delta.receive_full(conn), path)
+        await loop.sock_sendall(conn, tile_delta.REPLY_OK)
+        return path
+
+    def _rebuild(self, peer, manifest, new_tiles):
+        """Pixels of a delta from its new tiles plus cached ones, or None if our cache lacks some."""
+        mode, width, height, tile_size, channels, digests = manifest
+        tiles = [new_tiles[i] if i in new_tiles else self.tile_cache.tile(peer, digest)
+                 for i, digest in enumerate(digests)]
+        if None in tiles:
+            return None
+        print(f"Rebuilt screenshot from {len(new_tiles)} new of {len(tiles)} tiles")
+        self.tile_cache.record(peer, digests, tiles)
+        return tile_delta.assemble(tiles, width, height, channels, tile_size)
+
+    async def _store_full(self, peer, manifest, data, path):
+        """Save a full image sent in a delta transfer and cache its tiles for the next one."""
+        loop = asyncio.get_running_loop()
+        mode, width, height, tile_size, channels, digests = manifest
+        with transfer.atomic_output(path, len(data)) as f:
+            f.write(data)
+        tiles = await loop.run_in_executor(None, tile_delta.decode_tiles, data, tile_size, len(digests))
+        if tiles is None:
+            self.tile_cache.forget(peer)
+        else:
+            self.tile_cache.record(peer, digests, tiles)
+
+    def _output_path(self, addr):
+        """Unique destination for each incoming screenshot so concurrent senders never collide."""
+        self._counter += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        return os.path.join(self.output_dir, f"{addr[0]}_{stamp}_{self._counter}.png")
@@ -0,0 +1,299 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from gesture_engine import FIST, OPEN_PALM, TWO_FINGERS, landmarks_to_array
+
+FORMAT_VERSION = 1
+MAX_HANDS = 2  # MediaPipe Hands' default max_num_hands
+HANDEDNESS = ("Left", "Right")
+JPEG_QUALITY = 90
+LABEL_KEYS = {ord('1'): TWO_FINGERS, ord('2'): FIST, ord('3'): OPEN_PALM, ord('0'): None}
+
+
+class Recorder:
+    """Writes camera frames and/or landmarks to a recording directory.
+
+    The layout is made to be memory-mapped on replay:
+      meta.json        frame count, frame size, label names
+      timestamps.npy   (N,) float64 seconds since the first frame
+      landmarks.npy    (N, 2, 21, 3) float32, NaN where there's no hand
+      handedness.npy   (N, 2) int8 index into HANDEDNESS, -1 for no hand
+      labels.npy       (N,) int8 index into the label names, -1 for none
+      frames.bin       the frames as JPEGs, back to back
+      frames.idx.npy   (N, 2) int64 offset and length of each JPEG
+    A label is the gesture the person recording says they're making, the
+    ground truth for the benchmarks.
+    """
+
+    def __init__(self, path, frames=True, landmarks=True, jpeg_quality=JPEG_QUALITY):
+        self.path = path
+        self.frames = frames
+        self.landmarks = landmarks
+        self.jpeg_quality = jpeg_quality
+        self.frame_size = None
+        self.labels = [TWO_FINGERS, FIST, OPEN_PALM]
+        self._start = None
+        self._timestamps = []
+        self._landmarks = []
+        self._handedness = []
+        self._label_ids = []
+        self._index = []
+        os.makedirs(path, exist_ok=True)
+        self._blob = open(os.path.join(path, "frames.bin"), "wb") if frames else None
+        self._offset = 0
+
+    def add(self, frame=None, result=None, label=None, timestamp=None, frame_size=None):
+        """Record one frame: the raw camera image and/or the landmarks found in it."""
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        if self._start is None:
+            self._start = timestamp
+        if frame is not None:
+            frame_size = (frame.shape[1], frame.shape[0])
+        if self.frame_size is None:
+            self.frame_size = frame_size
+        self._timestamps.append(timestamp - self._start)
+
+        if self.frames:
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                raise ValueError("Could not encode frame")
+            self._blob.write(jpeg.tobytes())
+            self._index.append((self._offset, len(jpeg)))
+            self._offset += len(jpeg)
+
+        if self.landmarks:
+            points = np.full((MAX_HANDS, 21, 3), np.nan, dtype=np.float32)
+            handedness = np.full(MAX_HANDS, -1, dtype=np.int8)
+            hands = (result.multi_hand_landmarks or []) if result is not None else []
+            labels = getattr(result, "multi_handedness", None) or []
+            for i, hand in enumerate(hands[:MAX_HANDS]):
+                points[i] = landmarks_to_array(hand)
+                if i < len(labels) and labels[i].classification[0].label in HANDEDNESS:
+                    handedness[i] = HANDEDNESS.index(labels[i].classification[0].label)
+            self._landmarks.append(points)
+            self._handedness.append(handedness)
+
+        if label is not None and label not in self.labels:
+            self.labels.append(label)
+        self._label_ids.append(-1 if label is None else self.labels.index(label))
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def close(self):
+        if self._blob is not None:
+            self._blob.close()
+            np.save(os.path.join(self.path, "frames.idx.npy"), np.array(self._index, dtype=np.int64).reshape(-1, 2))
+        if self.landmarks:
+            np.save(os.path.join(self.path, "landmarks.npy"),
+                    np.array(self._landmarks, dtype=np.float32).reshape(-1, MAX_HANDS, 21, 3))
+            np.save(os.path.join(self.path, "handedness.npy"),
+                    np.array(self._handedness, dtype=np.int8).reshape(-1, MAX_HANDS))
+        np.save(os.path.join(self.path, "timestamps.npy"), np.array(self._timestamps, dtype=np.float64))
+        np.save(os.path.join(self.path, "labels.npy"), np.array(self._label_ids, dtype=np.int8))
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"version": FORMAT_VERSION, "count": len(self._timestamps), "frame_size": self.frame_size,
+                       "frames": self.frames, "landmarks": self.landmarks, "labels": self.labels}, f, indent=2)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Handedness:
+    """Stands in for MediaPipe's ClassificationList so hand_keys() works on replayed hands."""
+
+    def __init__(self, label):
+        self.classification = [self]
+        self.label = label
+
+
+class ReplayResult:
+    """A recorded frame's hands in the shape of a MediaPipe Hands result."""
+
+    def __init__(self, multi_hand_landmarks, multi_handedness):
+        self.multi_hand_landmarks = multi_hand_landmarks or None
+        self.multi_handedness = multi_handedness or None
+
+
+class Recording:
+    """A recording opened for replay; arrays and frames are memory-mapped, not loaded."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported recording version {self.meta.get('version')}")
+        self.frame_size = tuple(self.meta["frame_size"]) if self.meta["frame_size"] else None
+        self.labels = self.meta["labels"]
+        self.timestamps = np.load(os.path.join(path, "timestamps.npy"), mmap_mode="r")
+        self.label_ids = np.load(os.path.join(path, "labels.npy"), mmap_mode="r")
+        self.has_frames = self.meta["frames"] and len(self) > 0
+        self.has_landmarks = self.meta["landmarks"]
+        if self.has_frames:
+            self._index = np.load(os.path.join(path, "frames.idx.npy"), mmap_mode="r")
+            self._blob = np.memmap(os.path.join(path, "frames.bin"), dtype=np.uint8, mode="r")
+        if self.has_landmarks:
+            self._landmarks = np.load(os.path.join(path, "landmarks.npy"), mmap_mode="r")
+            self._handedness = np.load(os.path.join(path, "handedness.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def frame(self, i):
+        """Frame `i` as a BGR array, decoded straight from the mapped file."""
+        offset, length = self._index[i]
+        return cv2.imdecode(self._blob[offset:offset + length], cv2.IMREAD_COLOR)
+
+    def result(self, i):
+        """The hands recorded for frame `i`, as a ReplayResult."""
+        hands, handedness = [], []
+        for points, side in zip(self._landmarks[i], self._handedness[i]):
+            if np.isnan(points[0, 0]):
+                continue
+            hands.append(np.array(points))
+            handedness.append(Handedness(HANDEDNESS[side] if side >= 0 else "hand"))
+        return ReplayResult(hands, handedness)
+
+    def label(self, i):
+        label_id = self.label_ids[i]
+        return None if label_id < 0 else self.labels[label_id]
+
+    def segments(self):
+        """Runs of frames with the same label: [(label, first index, last index)], unlabelled runs left out."""
+        segments, start = [], 0
+        for i in range(1, len(self) + 1):
+            if i == len(self) or self.label_ids[i] != self.label_ids[start]:
+                if self.label_ids[start] >= 0:
+                    segments.append((self.labels[self.label_ids[start]], start, i - 1))
+                start = i
+        return segments
+
+
+class ReplaySource:
+    """Plays a recording's frames back like a cv2.VideoCapture, at `speed` x real time or as fast as possible.
+
+    Works anywhere a capture does, FrameGrabber included, so the scripts
+    can run on a recording instead of a camera.
+    """
+
+    def __init__(self, recording, speed=None, loop=False):
+        self.recording = recording
+        self.speed = speed
+        self.loop = loop
+        self.index = -1
+        self.timestamp = None
+        self._start = None
+        self._offset = 0.0  # recording time at which the current pass started
+
+    def isOpened(self):
+        return self.recording.has_frames
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+    def read(self):
+        if self.index + 1 >= len(self.recording):
+            if not self.loop or not len(self.recording):
+                return False, None
+            self._offset += float(self.recording.timestamps[-1]) + 1 / 30
+            self.index = -1
+        self.index += 1
+        self.timestamp = self._offset + float(self.recording.timestamps[self.index])
+        self._pace(self.timestamp)
+        return True, self.recording.frame(self.index)
+
+    def _pace(self, timestamp):
+        if not self.speed:
+            return
+        if self._start is None:
+            self._start = time.monotonic() - timestamp / self.speed
+        delay = self._start + timestamp / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def replay(recording, pipeline, use_frames=None, speed=None):
+    """Run a recording through `pipeline`; yields (index, PipelineStep).
+
+    Frames go through the whole pipeline (MediaPipe included) when the
+    recording has them, unless `use_frames` is False; otherwise only the
+    recorded landmarks are replayed. The state machine runs on the
+    recording's own clock, so results don't depend on `speed`.
+    """
+    use_frames = recording.has_frames if use_frames is None else use_frames
+    if use_frames and not recording.has_frames:
+        raise ValueError(f"{recording.path} has no frames, only landmarks")
+    if not use_frames and not recording.has_landmarks:
+        raise ValueError(f"{recording.path} has no landmarks, only frames")
+
+    source = ReplaySource(recording, speed)
+    for i in range(len(recording)):
+        now = float(recording.timestamps[i])
+        if use_frames:
+            _, frame = source.read()
+            yield i, pipeline.process(frame, now)
+        else:
+            source._pace(now)
+            yield i, pipeline.process_landmarks(recording.result(i), recording.frame_size, now)
+
+
+def main():
+    import mediapipe as mp
+
+    from capture import open_camera
+    from hand_tracker import HandTracker
+    from pipeline import GesturePipeline
+
+    parser = argparse.ArgumentParser(description="Record camera frames and hand landmarks for replay and benchmarks")
+    parser.add_argument("path", help="recording directory to create")
+    parser.add_argument("--no-frames", action="store_true", help="keep only the landmarks (a few KB per second)")
+    parser.add_argument("--seconds", type=float, default=None, help="stop after this long")
+    args = parser.parse_args()
+
+    cap = open_camera()
+    if cap is None:
+        print("Error: Could not open any camera")
+        return
+    hands = mp.solutions.hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
+    pipeline = GesturePipeline(HandTracker(hands))
+
+    print("Hold a gesture and press the key for it while you do: 1 two fingers, 2 fist, 3 open palm, "
+          "0 nothing. Press 'q' to stop.")
+    label = None
+    start = time.monotonic()
+    with Recorder(args.path, frames=not args.no_frames) as recorder:
+        while args.seconds is None or time.monotonic() - start < args.seconds:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            now = time.monotonic()
+            step = pipeline.process(frame, now)
+            recorder.add(frame, step.result, label, now)
+
+            preview = step.frame.copy()
+            text = f"label: {label or '-'}  seen: {', '.join(pose.describe() for pose in step.poses) or '-'}"
+            cv2.putText(preview, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            cv2.imshow("AirShare - Recording", preview)
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            label = LABEL_KEYS.get(key, label)
+    cap.release()
+    cv2.destroyAllWindows()
+    print(f"Saved {len(recorder)} frames to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import time
+
+import cv2
+import numpy as np
+
+# policy name -> (seconds without a hand before idling, seconds between idle inferences,
+# seconds of full-rate inference after motion wakes it)
+POLICIES = {
+    "always": (None, 0.0, 0.0),  # inference on every frame, as before
+    "responsive": (5.0, 0.25, 1.0),
+    "balanced": (2.0, 0.5, 1.0),
+    "eco": (1.0, 1.0, 0.5),
+}
+DEFAULT_POLICY = "balanced"
+MOTION_WIDTH = 64  # the motion gate compares frames downscaled to this width
+MOTION_THRESHOLD = 18  # a pixel moved if its gray level is this far from the background
+MOTION_FRACTION = 0.01  # ...and motion means at least this share of pixels moved
+BACKGROUND_RATE = 0.05  # how fast the background absorbs slow changes such as daylight
+
+
+class _NoHands:
+    """What a skipped frame returns: a hands.process() result with nothing in it."""
+
+    multi_hand_landmarks = None
+    multi_handedness = None
+
+
+NO_HANDS = _NoHands()
+
+
+class MotionGate:
+    """Cheap "did anything move?" test: a tiny gray frame against a slowly updated background."""
+
+    def __init__(self, width=MOTION_WIDTH, threshold=MOTION_THRESHOLD, fraction=MOTION_FRACTION,
+                 rate=BACKGROUND_RATE):
+        self.width = width
+        self.threshold = threshold
+        self.fraction = fraction
+        self.rate = rate
+        self.moved = 0.0  # share of pixels that moved on the last frame
+        self._background = None
+
+    def check(self, rgb_frame):
+        frame_h, frame_w = rgb_frame.shape[:2]
+        small = cv2.resize(rgb_frame, (self.width, max(1, frame_h * self.width // frame_w)),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.float32)
+        if self._background is None or self._background.shape != gray.shape:
+            self._background = gray
+            self.moved = 0.0
+            return False
+        self.moved = float(np.count_nonzero(cv2.absdiff(gray, self._background) > self.threshold)) / gray.size
+        cv2.accumulateWeighted(gray, self._background, self.rate)
+        return self.moved >= self.fraction
+
+    def reset(self):
+        self._background = None
+
+
+class InferenceScheduler:
+    """Wraps a HandTracker and skips inference while nobody is in front of the camera.
+
+    Full rate while a hand is tracked and for `idle_after` seconds after it
+    was last seen. Idle, the tracker runs once every `idle_interval` seconds
+    and the motion gate checks the other frames; motion brings back full
+    rate for `wake_for` seconds, and a hand keeps it there. Skipped frames
+    return a result with no hands, so callers see the same contract as
+    `hands.process()`. `stats()` reports the duty cycle and the inference
+    time saved.
+    """
+
+    def __init__(self, tracker, policy=DEFAULT_POLICY, gate=None, clock=time.monotonic):
+        self.tracker = tracker
+        self.policy = policy
+        self.idle_after, self.idle_interval, self.wake_for = POLICIES[policy]
+        self.gate = gate or MotionGate()
+        self.clock = clock
+        self.frames = 0
+        self.inferences = 0
+        self.wakeups = 0
+        self.gate_ms = 0.0
+        self._inference_ms = 0.0  # mean over the frames that ran, to price the skipped ones
+        self._awake_until = float("inf") if self.idle_after is None else clock() + self.idle_after
+        self._next_idle_run = 0.0
+        self._skipping = False
+        self._gating = False
+
+    @property
+    def inference_ms(self):
+        return 0.0 if self._skipping else self.tracker.inference_ms
+
+    @property
+    def mode(self):
+        return "idle" if self._skipping else self.tracker.mode
+
+    @property
+    def duty_cycle(self):
+        return self.inferences / self.frames if self.frames else 1.0
+
+    @property
+    def idle(self):
+        return self.clock() >= self._awake_until
+
+    def process(self, rgb_frame):
+        """Same contract as hands.process(); frames that aren't due return NO_HANDS."""
+        now = self.clock()
+        self.frames += 1
+        run = now < self._awake_until
+        if not run:
+            if not self._gating:
+                # Just gone idle: what the camera sees now becomes the background
+                self.gate.reset()
+                self._gating = True
+            start = time.perf_counter()
+            moved = self.gate.check(rgb_frame)
+            self.gate_ms += (time.perf_counter() - start) * 1000
+            if moved:
+                self.wakeups += 1
+                self._awake_until = now + self.wake_for
+                run = True
+            elif now >= self._next_idle_run:
+                run = True
+        if not run:
+            self._skipping = True
+            return NO_HANDS
+
+        self._skipping = False
+        self._gating = self._gating and now >= self._awake_until
+        result = self.tracker.process(rgb_frame)
+        self.inferences += 1
+        self._inference_ms += (self.tracker.inference_ms - self._inference_ms) / self.inferences
+        if result.multi_hand_landmarks and self.idle_after is not None:
+            self._awake_until = max(self._awake_until, now + self.idle_after)
+        if now >= self._awake_until:
+            self._next_idle_run = now + self.idle_interval
+        return result
+
+    def reset(self):
+        """Forget the tracked region and come back at full rate, as if a hand had just been seen."""
+        self.tracker.reset()
+        if self.idle_after is not None:
+            self._awake_until = self.clock() + self.idle_after
+
+    def stats(self):
+        """Duty cycle (share of frames that ran inference) and the inference time it saved."""
+        skipped = self.frames - self.inferences
+        return {
+            "policy": self.policy,
+            "frames": self.frames,
+            "inferences": self.inferences,
+            "duty_cycle": self.duty_cycle,
+            "wakeups": self.wakeups,
+            "inference_ms_mean": self._inference_ms,
+            "saved_ms": skipped * self._inference_ms - self.gate_ms,
+        }
+
+    def describe(self):
+        stats = self.stats()
+        return (f"inference on {stats['duty_cycle']:.0%} of {stats['frames']} frames ({self.policy}), "
+                f"{stats['wakeups']} motion wakeups, ~{stats['saved_ms'] / 1000:.1f} s of inference saved")
@@ -0,0 +1,122 @@
+import concurrent.futures
+import io
+import struct
+import time
+import zlib
+
+from PIL import Image
+
+# codec name -> (PIL format, save options, file extension, content type); a format of None is raw pixels
+CODECS = {
+    "png-fast": ("PNG", {"compress_level": 1}, ".png", "image/png"),
+    "png": ("PNG", {"compress_level": 6}, ".png", "image/png"),
+    "jpeg": ("JPEG", {"optimize": False}, ".jpg", "image/jpeg"),
+    "webp": ("WEBP", {"method": 0}, ".webp", "image/webp"),
+    "webp-lossless": ("WEBP", {"lossless": True, "method": 0}, ".webp", "image/webp"),
+    "raw-zlib": (None, {"level": 1}, ".rawz", "application/x-airshare-raw"),
+}
+LOSSY_CODECS = {"jpeg", "webp"}
+# Codecs any receiver can save as they arrive; raw-zlib only goes to receivers that advertise it
+STANDARD_CODECS = [codec for codec, (image_format, _, _, _) in CODECS.items() if image_format]
+RAW_MAGIC = b"ASRAW1"
+RAW_HEADER = struct.Struct("!6s4sII")  # magic, PIL mode, width, height; the zlib-compressed pixels follow
+DEFAULT_CODEC = "png-fast"
+DEFAULT_QUALITY = 85
+
+
+class EncodedImage:
+    """An encoded screenshot held in memory, ready to hand to the transfer layer."""
+
+    def __init__(self, data, codec, width, height, encode_ms, image=None):
+        self.data = data
+        self.codec = codec
+        self.width = width
+        self.height = height
+        self.encode_ms = encode_ms
+        self.image = image  # the source PIL image, kept for callers that need pixels
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def extension(self):
+        return CODECS[self.codec][2]
+
+    @property
+    def content_type(self):
+        return CODECS[self.codec][3]
+
+    def save(self, path):
+        """Write the encoded bytes to disk as-is (no re-encode)."""
+        with open(path, 'wb') as f:
+            f.write(self.data)
+
+    def describe(self):
+        return f"{self.codec} {self.size / 1024:.0f} KB, encoded in {self.encode_ms:.0f} ms"
+
+
+def encode_image(image, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY):
+    """Encode a PIL image into an in-memory buffer with the chosen codec."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec {codec!r}; choose one of {', '.join(CODECS)}")
+    image_format, options, _, _ = CODECS[codec]
+    options = dict(options)
+    if codec in LOSSY_CODECS:
+        options["quality"] = quality
+    if image_format == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+
+    start = time.perf_counter()
+    if image_format is None:
+        # No filtering or entropy modelling, just the fastest zlib level over the pixels
+        header = RAW_HEADER.pack(RAW_MAGIC, image.mode.encode(), image.width, image.height)
+        data = header + zlib.compress(image.tobytes(), options["level"])
+    else:
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, **options)
+        data = buffer.getvalue()
+    encode_ms = (time.perf_counter() - start) * 1000
+    return EncodedImage(data, codec, image.width, image.height, encode_ms, image)
+
+
+def decode_image(data):
+    """Decode the bytes of any codec in CODECS back into a PIL image."""
+    if bytes(data[:len(RAW_MAGIC)]) == RAW_MAGIC:
+        _, mode, width, height = RAW_HEADER.unpack_from(data)
+        pixels = zlib.decompress(memoryview(data)[RAW_HEADER.size:])
+        return Image.frombytes(mode.rstrip(b"\0").decode(), (width, height), pixels)
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+class ScreenshotEncoder:
+    """Captures and encodes screenshots on a worker thread so the gesture loop never waits.
+
+    `capture()` returns a Future for an EncodedImage right away. A disk copy
+    is only written when `save_path` is given.
+    """
+
+    def __init__(self, codec=DEFAULT_CODEC, quality=DEFAULT_QUALITY):
+        self.codec = codec
+        self.quality = quality
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="encoder")
+
+    def capture(self, save_path=None, codec=None, quality=None):
+        return self._executor.submit(self._capture, save_path, codec or self.codec, quality or self.quality)
+
+    def encode(self, image, codec=None, quality=None):
+        """Encode an existing image in the background."""
+        return self._executor.submit(encode_image, image, codec or self.codec, quality or self.quality)
+
+    def _capture(self, save_path, codec, quality):
+        import pyautogui  # only senders need a screen; receivers import this module for the codecs
+
+        encoded = encode_image(pyautogui.screenshot(), codec, quality)
+        if save_path:
+            encoded.save(save_path)
+        return encoded
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
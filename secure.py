@@ -0,0 +1,189 @@
+import concurrent.futures
+import hashlib
+import hmac
+import secrets
+import struct
+import threading
+
+try:
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+except ImportError:
+    AESGCM = None
+
+import protocol
+
+# RFC 3526 group 14: a 2048-bit safe prime p; 2 generates its subgroup of prime order q = (p - 1) / 2
+P = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74"
+    "020BBEA63B139B22514A08798E3404DDEF9519B3CD3A431B302B0A6DF25F1437"
+    "4FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF05"
+    "98DA48361C55D39A69163FA8FD24CF5F83655D23DCA3AD961C62F356208552BB"
+    "9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF695581718"
+    "3995497CEA956AE515D2261898FA051015728E5A8AACAA68FFFFFFFFFFFFFFFF", 16)
+Q = (P - 1) // 2
+G = 2
+ELEMENT_SIZE = 256  # bytes of a group element on the wire
+CONTEXT = b"AirShare SPAKE2 v1"
+SENDER, RECEIVER = "sender", "receiver"
+NUMBER = struct.Struct("!Q")  # leads every sealed body: the frame's number within its stream
+NONCE = struct.Struct("!IQ")  # stream id, frame number; never repeats under one key
+AAD = struct.Struct("!BI")  # frame type and stream id, so a sealed body can't be replayed as another frame
+
+
+class VerificationFailed(Exception):
+    """The peer's verification code doesn't match ours, or someone in between tampered with the handshake."""
+
+
+def require():
+    """Raise unless the optional `cryptography` package, which does the encryption, is installed."""
+    if AESGCM is None:
+        raise RuntimeError("Encrypted transfers need the cryptography package: pip install cryptography")
+
+
+def _hash_to_group(label):
+    """A group element nobody knows the discrete log of, for SPAKE2's M and N."""
+    digest = b"".join(hashlib.sha512(CONTEXT + label + bytes([i])).digest() for i in range(5))
+    return pow(int.from_bytes(digest, "big") % P, 2, P)  # squaring lands in the order-q subgroup
+
+
+M = _hash_to_group(b" M")
+N = _hash_to_group(b" N")
+
+
+def _element(value):
+    """Parse and check a group element from the peer; a bad one could leak our secret."""
+    element = int(value, 16)
+    if not 1 < element < P - 1 or pow(element, Q, P) != 1:
+        raise VerificationFailed("Peer sent an invalid key exchange value")
+    return element
+
+
+def _encode(element):
+    return element.to_bytes(ELEMENT_SIZE, "big")
+
+
+class KeyExchange:
+    """SPAKE2 over the verification code: both sides end up with the same session keys only if
+    their codes match, and an eavesdropper can't test guesses of the code offline.
+
+    Each side sends `message()`, passes the other's to `finish()`, then sends
+    `confirmation()` and checks the other's with `verify()`. The receiver
+    confirms first, so a wrong code is reported at once on the sender, to
+    the person making the gesture. Exponentiation is the stdlib's `pow`.
+    """
+
+    def __init__(self, code, role, session_id):
+        self.role = role
+        self.session_id = session_id.encode()
+        self._w = int.from_bytes(hashlib.sha256(CONTEXT + b" code " + str(code).encode()).digest(), "big") % Q
+        self._secret = secrets.randbelow(Q - 1) + 1
+        mask = M if role == SENDER else N
+        self._message = pow(G, self._secret, P) * pow(mask, self._w, P) % P
+        self._keys = None
+
+    def message(self):
+        return format(self._message, "x")
+
+    def finish(self, peer_message):
+        """Derive the session keys from the peer's message."""
+        peer = _element(peer_message)
+        peer_mask = N if self.role == SENDER else M
+        shared = pow(peer * pow(peer_mask, Q - self._w, P) % P, self._secret, P)
+        sender, receiver = (self._message, peer) if self.role == SENDER else (peer, self._message)
+        transcript = hashlib.sha256()
+        for part in (CONTEXT, self.session_id, _encode(sender), _encode(receiver), _encode(shared),
+                     self._w.to_bytes(ELEMENT_SIZE, "big")):
+            transcript.update(struct.pack("!I", len(part)) + part)
+        secret = transcript.digest()
+        self._keys = {label: hmac.new(secret, label.encode(), hashlib.sha256).digest()
+                      for label in ("sender key", "receiver key", "sender confirm", "receiver confirm")}
+        return self
+
+    def confirmation(self):
+        return hmac.new(self._keys[f"{self.role} confirm"], CONTEXT, hashlib.sha256).hexdigest()
+
+    def verify(self, confirmation):
+        """Check the peer's confirmation; raises VerificationFailed if the codes differ."""
+        peer_role = RECEIVER if self.role == SENDER else SENDER
+        expected = hmac.new(self._keys[f"{peer_role} confirm"], CONTEXT, hashlib.sha256).hexdigest()
+        if not isinstance(confirmation, str) or not hmac.compare_digest(confirmation, expected):
+            raise VerificationFailed("Verification codes don't match")
+
+    def channel(self):
+        """The SecureChannel for this side's end of the connection."""
+        peer_role = RECEIVER if self.role == SENDER else SENDER
+        return SecureChannel(self._keys[f"{self.role} key"], self._keys[f"{peer_role} key"])
+
+
+class SecureChannel:
+    """AES-256-GCM for the frame bodies of one session connection, one key each way.
+
+    The tag replaces the frame's CRC, so sealing is about as cheap as the
+    checksum it saves. Every sealed body starts with the frame's number
+    within its stream, which is also its nonce; the receiver only takes
+    numbers that go up, so frames can't be replayed or reordered, and AAD
+    binds each body to its frame type and stream. Numbers may skip (a chunk
+    sealed ahead and then cancelled), and each stream counts on its own, so
+    a stream can seal its next chunk while other frames are on the wire.
+    The headers stay in the clear.
+    """
+
+    def __init__(self, send_key, receive_key):
+        require()
+        self._send = AESGCM(send_key)
+        self._receive = AESGCM(receive_key)
+        self._sent = {}  # stream id -> frames sealed so far
+        self._received = {}  # stream id -> frames opened so far
+        self._lock = threading.Lock()
+
+    def seal(self, frame_type, body=b"", stream=0):
+        """The frame with `body` encrypted and authenticated, as (header, ciphertext) to write in turn."""
+        with self._lock:
+            number = self._sent.get(stream, 0)
+            self._sent[stream] = number + 1
+        ciphertext = self._send.encrypt(NONCE.pack(stream, number), body, AAD.pack(frame_type, stream))
+        header = protocol.sealed_header(frame_type, NUMBER.size + len(ciphertext), stream) + NUMBER.pack(number)
+        return header, ciphertext
+
+    def open(self, frame_type, stream, body):
+        """Decrypt a received frame body; raises protocol.ProtocolError if it was forged or replayed."""
+        if len(body) < protocol.SEAL_OVERHEAD:
+            raise protocol.ProtocolError(f"Sealed frame of {len(body)} bytes is too short")
+        (number,) = NUMBER.unpack_from(body)
+        if number < self._received.get(stream, 0):
+            raise protocol.ProtocolError(f"Frame {number} of stream {stream} was replayed or reordered")
+        try:
+            plain = self._receive.decrypt(NONCE.pack(stream, number), memoryview(body)[NUMBER.size:],
+                                          AAD.pack(frame_type, stream))
+        except Exception:
+            raise protocol.ProtocolError(f"Frame {number} of stream {stream} failed authentication")
+        self._received[stream] = number + 1
+        return plain
+
+
+def sealed_data(channel, chunks, stream, executor):
+    """(offset, chunk length, sealed DATA frame parts) for each (offset, chunk), sealing one chunk ahead.
+
+    The next chunk is encrypted on `executor` while the caller writes the
+    current one, so encryption overlaps the socket write instead of adding
+    to it. A chunk is always sealed before the iterator is advanced, because
+    file chunks share one read buffer.
+    """
+    def seal(position, chunk):
+        return channel.seal(protocol.DATA, protocol.OFFSET.pack(position) + chunk, stream)
+
+    ready = None
+    for position, chunk in chunks:
+        future = executor.submit(seal, position, chunk)
+        if ready is not None:
+            yield ready
+        ready = position, len(chunk), future.result()
+    if ready is not None:
+        yield ready
+
+
+def sealer():
+    """The executor that seals chunks ahead of a session's writes."""
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sealer")
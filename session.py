@@ -0,0 +1,301 @@
+import itertools
+import json
+import queue
+import socket
+import threading
+import time
+import uuid
+
+import protocol
+import secure
+import transfer
+
+HEARTBEAT_INTERVAL = 2.0  # seconds of silence before an idle session sends a PING
+HEARTBEAT_TIMEOUT = 6.0  # a session that hears nothing and sends nothing for this long is reconnected
+PIPELINE_LIMIT = 1024 * 1024  # payloads up to this size stream right after HELLO, without waiting for RESUME
+REPLY_TIMEOUT = 60  # seconds to wait for a receiver's DONE on a live connection
+
+
+class SessionUnsupported(transfer.IncompatiblePeer):
+    """The receiver doesn't accept sessions; send each transfer on its own connection."""
+
+
+class SessionRefused(Exception):
+    """The receiver turned the session down (e.g. it wants a verification code), or won't encrypt one."""
+
+
+class Session:
+    """One long-lived, heartbeated connection to a peer that carries many transfers as streams.
+
+    Each `send()` is a stream with its own id: its frames interleave with
+    other streams' at chunk granularity, so several threads can send at once
+    over the same connection. Small payloads are written straight after
+    HELLO, so a send costs no round trip beyond the receiver's DONE. If the
+    connection drops, or the heartbeat stops being answered, it is reopened
+    in the background and in-flight sends retry; large ones resume from the
+    receiver's partial file. OPEN advertises the codecs this side can
+    encode, and the receiver answers with the ones it can take in
+    `peer_codecs` (None if it doesn't say). With a verification `code`,
+    opening the connection runs a key exchange on it (secure.KeyExchange)
+    and every frame after that is encrypted; a receiver with another code,
+    or none, is refused rather than sent anything in the clear.
+    """
+
+    def __init__(self, host, port, connect_timeout=5, heartbeat=HEARTBEAT_INTERVAL, timeout=HEARTBEAT_TIMEOUT,
+                 retries=3, retry_delay=1, codecs=None, code=None):
+        if code is not None:
+            secure.require()
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.heartbeat = heartbeat
+        self.timeout = timeout
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.codecs = codecs
+        self.code = code
+        self.peer_codecs = None
+        self.id = uuid.uuid4().hex
+        self.reconnects = 0
+        self._sock = None
+        self._channel = None  # secure.SecureChannel of the current connection when encrypting
+        self._sealer = secure.sealer() if code is not None else None
+        self._generation = 0
+        self._streams = {}  # stream id -> queue of (frame type, body) replies
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._keepalive_thread = None
+        self._last_received = 0.0
+        self._last_progress = 0.0  # last time a DATA chunk left; a busy upload is proof of life too
+        self._last_sent = 0.0
+
+    @property
+    def connected(self):
+        return self._sock is not None
+
+    def connect(self):
+        """Open the connection now rather than on the first send; returns self."""
+        self._ensure_connected()
+        return self
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            generation = self._generation
+        self._drop(generation, ConnectionError("session closed"))
+        if self._sealer is not None:
+            self._sealer.shutdown(wait=False)
+
+    def send(self, payload, metadata=None, progress=None, cancel=None):
+        """Send a payload as one stream and return the receiver's DONE reply.
+
+        `payload` is a file path, a bytes-like buffer or an EncodedImage.
+        Retries across reconnects; raises the last error if every attempt fails.
+        """
+        if metadata is None:
+            metadata = protocol.describe(payload)
+        hello = dict(metadata, pipelined=metadata["size"] <= PIPELINE_LIMIT)
+        data = getattr(payload, "data", payload)
+
+        for attempt in range(self.retries):
+            generation = None
+            try:
+                sock, generation, channel = self._ensure_connected()
+                return self._send_stream(sock, channel, data, hello, progress, cancel)
+            except (transfer.TransferCancelled, transfer.IncompatiblePeer, SessionRefused, secure.VerificationFailed):
+                raise
+            except (OSError, ConnectionError, protocol.ProtocolError) as e:
+                if generation is not None and not isinstance(e, protocol.ProtocolError):
+                    self._drop(generation, e)
+                if attempt == self.retries - 1:
+                    raise
+                print(f"Session to {self.host} interrupted ({e}); retrying in {self.retry_delay} seconds...")
+
+            if cancel is not None:
+                if cancel.wait(self.retry_delay):
+                    raise transfer.TransferCancelled()
+            else:
+                time.sleep(self.retry_delay)
+
+    def _send_stream(self, sock, channel, data, hello, progress, cancel):
+        stream = next(self._ids)
+        replies = queue.Queue()
+        self._streams[stream] = replies
+        try:
+            self._write_frame(sock, channel, protocol.HELLO, json.dumps(hello).encode(), stream)
+
+            offset = 0
+            if not hello["pipelined"]:
+                frame_type, body = self._reply(replies)
+                if frame_type == protocol.DONE:
+                    raise protocol.ProtocolError(f"Receiver refused the transfer: {json.loads(body).get('error')}")
+                if frame_type != protocol.RESUME:
+                    raise protocol.ProtocolError(f"Expected RESUME, got frame type {frame_type}")
+                offset = json.loads(body).get("offset", 0)
+                if not 0 <= offset <= hello["size"]:
+                    raise protocol.ProtocolError(f"Receiver asked to resume at {offset} of {hello['size']} bytes")
+                if offset:
+                    print(f"Resuming transfer at {offset / 1024:.0f} of {hello['size'] / 1024:.0f} KB")
+
+            chunks = protocol.iter_chunks(data, offset)
+            if channel is not None:
+                # Each chunk is encrypted while the one before it is being written
+                frames = secure.sealed_data(channel, chunks, stream, self._sealer)
+            else:
+                frames = ((position, len(chunk), (protocol.data_header(position, chunk, stream), chunk))
+                          for position, chunk in chunks)
+            for position, length, parts in frames:
+                if cancel is not None and cancel.is_set():
+                    self._write_frame(sock, channel, protocol.CANCEL, b"", stream)
+                    raise transfer.TransferCancelled()
+                self._write(sock, *parts)
+                self._last_progress = time.monotonic()
+                if progress:
+                    progress(position + length, hello["size"])
+
+            self._write_frame(sock, channel, protocol.END, b"", stream)
+            frame_type, body = self._reply(replies)
+            reply = json.loads(body)
+            if frame_type != protocol.DONE or not reply.get("ok"):
+                raise protocol.ProtocolError(f"Receiver rejected the transfer: {reply.get('error')}")
+            return reply
+        finally:
+            self._streams.pop(stream, None)
+
+    def _reply(self, replies):
+        try:
+            frame_type, body = replies.get(timeout=REPLY_TIMEOUT)
+        except queue.Empty:
+            raise ConnectionError(f"No reply from {self.host} in {REPLY_TIMEOUT} seconds")
+        if frame_type is None:
+            raise ConnectionError(f"Session lost: {body}")
+        return frame_type, body
+
+    def _write(self, sock, *parts):
+        with self._write_lock:
+            for part in parts:
+                sock.sendall(part)
+            self._last_sent = time.monotonic()
+
+    def _write_frame(self, sock, channel, frame_type, body=b"", stream=0):
+        """Write one frame, sealed when the connection is encrypted."""
+        with self._write_lock:
+            # Sealed under the lock: control frames come from several threads and must go out in number order
+            if channel is not None:
+                sock.sendall(b"".join(channel.seal(frame_type, body, stream)))
+            else:
+                sock.sendall(protocol.pack_frame(frame_type, body, stream) + body)
+            self._last_sent = time.monotonic()
+
+    def _ensure_connected(self):
+        """The live socket, its generation and its SecureChannel (or None), connecting first if there is none."""
+        with self._connect_lock:
+            with self._lock:
+                if self._sock is not None:
+                    return self._sock, self._generation, self._channel
+            if self._closed.is_set():
+                raise ConnectionError("session closed")
+
+            sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            try:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                opening = {"session": self.id}
+                if self.codecs:
+                    opening["codecs"] = list(self.codecs)
+                exchange = None
+                if self.code is not None:
+                    exchange = secure.KeyExchange(self.code, secure.SENDER, self.id)
+                    opening["spake2"] = exchange.message()
+                protocol.send_json(sock, protocol.OPEN, opening)
+                try:
+                    frame_type, _, body = protocol.recv_frame(sock)
+                except (ConnectionError, protocol.ProtocolError) as e:
+                    raise SessionUnsupported(f"{self.host} does not accept sessions ({e})")
+                if frame_type != protocol.OPEN:
+                    raise SessionUnsupported(f"{self.host} answered OPEN with frame type {frame_type}")
+                reply = json.loads(body) if body else {}
+                if reply.get("error"):
+                    raise SessionRefused(f"{self.host} refused the session: {reply['error']}")
+                channel = None
+                if exchange is not None:
+                    if "spake2" not in reply:
+                        raise SessionRefused(f"{self.host} doesn't encrypt sessions; not sending to it in the clear")
+                    exchange.finish(reply["spake2"]).verify(reply.get("confirm"))
+                    protocol.send_json(sock, protocol.OPEN, {"confirm": exchange.confirmation()})
+                    channel = exchange.channel()
+                self.peer_codecs = reply.get("codecs")
+                # The reader blocks for as long as the session lives; the heartbeat notices dead peers
+                sock.settimeout(None)
+            except BaseException:
+                sock.close()
+                raise
+
+            with self._lock:
+                if self._generation:
+                    self.reconnects += 1
+                self._generation += 1
+                self._sock = sock
+                self._channel = channel
+                generation = self._generation
+                self._last_received = self._last_sent = time.monotonic()
+            threading.Thread(target=self._read, args=(sock, generation, channel), daemon=True).start()
+            if self._keepalive_thread is None:
+                self._keepalive_thread = threading.Thread(target=self._keepalive, daemon=True)
+                self._keepalive_thread.start()
+            return sock, generation, channel
+
+    def _read(self, sock, generation, channel):
+        """Route the receiver's replies to the streams waiting for them."""
+        try:
+            while True:
+                frame_type, stream, body = protocol.recv_frame(sock, sealed=channel is not None)
+                if channel is not None:
+                    body = channel.open(frame_type, stream, body)
+                self._last_received = time.monotonic()
+                if frame_type == protocol.PING:
+                    self._write_frame(sock, channel, protocol.PONG)
+                elif frame_type != protocol.PONG:
+                    replies = self._streams.get(stream)
+                    if replies is not None:
+                        replies.put((frame_type, body))
+        except Exception as e:
+            self._drop(generation, e)
+
+    def _drop(self, generation, error):
+        """Close connection `generation` (if it's still the current one) and fail its waiting streams."""
+        with self._lock:
+            if generation != self._generation or self._sock is None:
+                return
+            sock, self._sock = self._sock, None
+        try:
+            sock.shutdown(socket.SHUT_RDWR)  # wakes the reader thread blocked in recv
+        except OSError:
+            pass
+        sock.close()
+        for replies in list(self._streams.values()):
+            replies.put((None, error))
+        if not self._closed.is_set():
+            print(f"🔌 Session to {self.host} lost ({error}); reconnecting in the background")
+
+    def _keepalive(self):
+        while not self._closed.wait(self.heartbeat):
+            with self._lock:
+                sock, generation, channel = self._sock, self._generation, self._channel
+            now = time.monotonic()
+            if sock is None:
+                # Keep the pipe open so the next send doesn't pay for the connect
+                try:
+                    self._ensure_connected()
+                    print(f"🔗 Session to {self.host} reconnected")
+                except Exception:
+                    pass
+            elif now - max(self._last_received, self._last_progress) > self.timeout:
+                self._drop(generation, ConnectionError(f"no heartbeat for {self.timeout:.0f} seconds"))
+            elif now - self._last_sent >= self.heartbeat:
+                try:
+                    self._write_frame(sock, channel, protocol.PING)
+                except OSError as e:
+                    self._drop(generation, e)
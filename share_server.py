@@ -0,0 +1,205 @@
+import collections
+import email.utils
+import hashlib
+import html
+import http.server
+import re
+import threading
+import time
+
+SHARE_PORT = 8000
+GALLERY_SIZE = 12  # shares kept in memory; older ones drop off the gallery and return 404
+WRITE_CHUNK = 256 * 1024  # bytes per socket write, so one slow phone only ever blocks its own thread
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class Share:
+    """One shared image held in memory, with the validators HTTP caching needs."""
+
+    def __init__(self, share_id, data, content_type, extension, description=""):
+        self.id = share_id
+        self.data = data
+        self.content_type = content_type
+        self.name = f"{share_id}{extension}"
+        self.description = description
+        self.etag = '"' + hashlib.blake2b(data, digest_size=12).hexdigest() + '"'
+        self.created = time.time()
+        self.last_modified = email.utils.formatdate(self.created, usegmt=True)
+
+
+class ShareServer:
+    """Persistent threaded HTTP server that hands shared screenshots to phones on the network.
+
+    Started once per session; `publish()` makes an encoded image available
+    at `/s/<name>` straight from memory, without a file on disk. Every
+    connection gets its own thread, so several phones can pull large images
+    at once. Responses carry an ETag and Last-Modified (If-None-Match gives
+    304) and honour single byte ranges (206), which lets phone browsers
+    resume and stream. `/` is a gallery of the last `history` shares and
+    `/latest` redirects to the newest.
+    """
+
+    def __init__(self, port=SHARE_PORT, host='', history=GALLERY_SIZE):
+        self.port = port
+        self.host = host
+        self.history = history
+        self.served = 0
+        self._shares = collections.OrderedDict()  # name -> Share, oldest first
+        self._lock = threading.Lock()
+        self._counter = 0
+        self._server = None
+
+    def start(self):
+        """Bind the port and serve on a daemon thread; raises OSError if the port is taken."""
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def publish(self, image):
+        """Share an EncodedImage (or anything with data, content_type and extension); returns the Share."""
+        with self._lock:
+            self._counter += 1
+            share_id = time.strftime("%Y%m%d-%H%M%S") + f"-{self._counter}"
+            share = Share(share_id, bytes(image.data), image.content_type, image.extension,
+                          image.describe() if hasattr(image, "describe") else "")
+            self._shares[share.name] = share
+            while len(self._shares) > self.history:
+                self._shares.popitem(last=False)
+        return share
+
+    def get(self, name):
+        with self._lock:
+            return self._shares.get(name)
+
+    def shares(self):
+        """Shares still in the gallery, newest first."""
+        with self._lock:
+            return list(reversed(self._shares.values()))
+
+    def url(self, share=None, address="localhost"):
+        path = f"/s/{share.name}" if share else "/"
+        return f"http://{address}:{self.port}{path}"
+
+    def _gallery(self):
+        items = "".join(
+            f'<li><a href="/s/{share.name}"><img src="/s/{share.name}" loading="lazy" alt="{share.name}"></a>'
+            f'<br>{html.escape(time.strftime("%H:%M:%S", time.localtime(share.created)))} '
+            f'{html.escape(share.description)}</li>'
+            for share in self.shares())
+        return ("<!DOCTYPE html><html><head><meta charset='utf-8'><title>AirShare</title>"
+                "<meta name='viewport' content='width=device-width, initial-scale=1'>"
+                "<style>body{font-family:sans-serif}ul{list-style:none;padding:0}"
+                "img{max-width:100%;border:1px solid #ccc}li{margin-bottom:1.5em}</style></head>"
+                f"<body><h1>AirShare</h1><ul>{items or '<li>Nothing shared yet.</li>'}</ul></body></html>").encode()
+
+    def _handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so a phone reuses one connection for the gallery
+
+            def do_HEAD(self):
+                self.do_GET(head=True)
+
+            def do_GET(self, head=False):
+                path = self.path.split("?", 1)[0]
+                if path == "/":
+                    self._send(200, server._gallery(), "text/html; charset=utf-8", head,
+                               {"Cache-Control": "no-cache"})
+                elif path == "/latest":
+                    shares = server.shares()
+                    if not shares:
+                        self._send(404, b"Nothing shared yet\n", "text/plain", head)
+                    else:
+                        self._send(302, b"", "text/plain", head,
+                                   {"Location": f"/s/{shares[0].name}", "Cache-Control": "no-cache"})
+                elif path.startswith("/s/"):
+                    share = server.get(path[3:])
+                    if share is None:
+                        self._send(404, b"No such share (it may have dropped off the gallery)\n", "text/plain", head)
+                    else:
+                        self._send_share(share, head)
+                else:
+                    self._send(404, b"Not found\n", "text/plain", head)
+
+            def _send_share(self, share, head):
+                headers = {"ETag": share.etag, "Last-Modified": share.last_modified, "Accept-Ranges": "bytes",
+                           # names are never reused, so phones may keep a copy for good
+                           "Cache-Control": "public, max-age=31536000, immutable"}
+                if _etag_matches(self.headers.get("If-None-Match"), share.etag):
+                    self._send(304, b"", None, True, headers)
+                    return
+                body, status = memoryview(share.data), 200
+                wanted = self.headers.get("Range")
+                if wanted and self.headers.get("If-Range", share.etag) in (share.etag, share.last_modified):
+                    try:
+                        span = _byte_range(wanted, len(body))
+                    except ValueError:
+                        headers["Content-Range"] = f"bytes */{len(body)}"
+                        self._send(416, b"", None, head, headers)
+                        return
+                    if span:
+                        start, end = span
+                        headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(body)}"
+                        body, status = body[start:end], 206
+                self._send(status, body, share.content_type, head, headers)
+                with server._lock:
+                    server.served += 1
+
+            def _send(self, status, body, content_type, head, headers=None):
+                self.send_response(status)
+                if content_type:
+                    self.send_header("Content-Type", content_type)
+                if status != 304:
+                    self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if head:
+                    return
+                try:
+                    for start in range(0, len(body), WRITE_CHUNK):
+                        self.wfile.write(body[start:start + WRITE_CHUNK])
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the phone gave up or got what it needed
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _etag_matches(header, etag):
+    """Whether an If-None-Match header lists this entity tag (weak or strong) or is "*"."""
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+def _byte_range(header, size):
+    """(start, end) for a single byte range, None to ignore the header; ValueError if unsatisfiable."""
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None  # several ranges or another unit: answering with the whole body is allowed
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # bytes=-N: the last N bytes
+        start, end = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            return None  # bytes=5-3 is invalid, not unsatisfiable: ignore it and send everything
+        end = min(size, int(last) + 1) if last else size
+    if start >= size or start >= end:
+        raise ValueError(f"range {header!r} is outside {size} bytes")
+    return start, end
@@ -0,0 +1,61 @@
+import types
+
+import numpy as np
+
+from hand_tracker import HandTracker
+
+
+class FakeHands:
+    """Stands in for MediaPipe Hands: records what it was given and answers with canned landmarks."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)  # [(x, y)] in the input's own normalized coordinates, or None
+        self.shapes = []
+
+    def process(self, rgb):
+        self.shapes.append(rgb.shape)
+        answer = self.answers.pop(0)
+        if answer is None:
+            return types.SimpleNamespace(multi_hand_landmarks=None)
+        x, y = answer
+        points = [types.SimpleNamespace(x=x + dx, y=y + dy, z=0.01)
+                  for dx in (-0.02, 0.0, 0.02) for dy in (-0.02, 0.0, 0.02)]
+        return types.SimpleNamespace(multi_hand_landmarks=[types.SimpleNamespace(landmark=points)])
+
+
+def centre(result):
+    points = result.multi_hand_landmarks[0].landmark
+    return (sum(p.x for p in points) / len(points), sum(p.y for p in points) / len(points))
+
+
+def test_crops_and_searches_use_separate_instances_and_map_back_to_the_frame():
+    frame = np.zeros((480, 640, 3), dtype=np.uint8)
+    roi = FakeHands([(0.5, 0.5), None, (0.25, 0.75)])
+    search = FakeHands([(0.3, 0.4), (0.6, 0.2)])
+    tracker = HandTracker(roi, inference_width=320, roi_size=128, search_hands=search)
+
+    # No hand yet: the downscaled full frame is searched
+    result = tracker.process(frame)
+    assert tracker.mode == "search"
+    assert np.allclose(centre(result), (0.3, 0.4))
+
+    # Then the crop around it is tracked, and its landmarks come back in frame coordinates
+    x0, y0, side = tracker._roi
+    result = tracker.process(frame)
+    assert tracker.mode == "roi"
+    assert np.allclose(centre(result), ((x0 + 0.5 * side) / 640, (y0 + 0.5 * side) / 480))
+
+    # The crop loses the hand: the search instance takes over for the same frame
+    result = tracker.process(frame)
+    assert tracker.mode == "search"
+    assert np.allclose(centre(result), (0.6, 0.2))
+
+    # And tracking resumes in the new crop
+    x0, y0, side = tracker._roi
+    result = tracker.process(frame)
+    assert tracker.mode == "roi"
+    assert np.allclose(centre(result), ((x0 + 0.25 * side) / 640, (y0 + 0.75 * side) / 480))
+
+    # The video-mode instance only ever saw crops, the search instance only full frames
+    assert roi.shapes == [(128, 128, 3)] * 3
+    assert search.shapes == [(240, 320, 3)] * 2
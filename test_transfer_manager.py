@@ -0,0 +1,79 @@
+import concurrent.futures
+import threading
+
+from transfer_manager import CANCELLED, TransferManager
+
+TIMEOUT = 10
+
+
+def test_submit_group_after_shutdown_cancels_every_job():
+    manager = TransferManager(59999, sessions=False)
+    manager.shutdown()
+
+    group = manager.submit_group(["10.0.0.2", "10.0.0.3"], b"screenshot")
+
+    assert group.wait(TIMEOUT)
+    assert [job.status for job in group.jobs] == [CANCELLED, CANCELLED]
+
+
+def test_shutdown_cancels_group_jobs_that_are_queued_or_waiting_for_the_payload():
+    statuses = []
+    manager = TransferManager(59999, sessions=False, fanout_workers=1,
+                              on_status=lambda job: statuses.append((job.id, job.status)))
+    payload = concurrent.futures.Future()  # still encoding: the group can't start sending
+    group = manager.submit_group([f"10.0.0.{i}" for i in range(2, 7)], payload)
+
+    manager.shutdown()
+    payload.set_result(b"screenshot")
+
+    assert group.wait(TIMEOUT)
+    assert all(job.status == CANCELLED for job in group.jobs)
+    # Each job is finished exactly once
+    finished = [job_id for job_id, status in statuses if status == CANCELLED]
+    assert sorted(finished) == sorted(job.id for job in group.jobs)
+
+
+def test_submit_group_racing_shutdown_never_raises_or_leaves_jobs_pending():
+    manager = TransferManager(59999, sessions=False, fanout_workers=2)
+    payload = concurrent.futures.Future()
+    groups, errors = [], []
+
+    def submit():
+        try:
+            for _ in range(200):
+                groups.append(manager.submit_group(["10.0.0.2", "10.0.0.3", "10.0.0.4"], payload))
+        except Exception as e:
+            errors.append(e)
+
+    submitter = threading.Thread(target=submit)
+    submitter.start()
+    manager.shutdown()
+    submitter.join(TIMEOUT)
+    payload.set_result(b"screenshot")
+
+    assert not errors
+    assert all(group.wait(TIMEOUT) for group in groups)
+    assert all(job.status == CANCELLED for group in groups for job in group.jobs)
+
+
+def test_submit_racing_shutdown_never_leaves_jobs_pending():
+    manager = TransferManager(59999, sessions=False, workers=2)
+    payload = concurrent.futures.Future()  # holds the workers until every job is queued
+    jobs, errors = [], []
+
+    def submit():
+        try:
+            for _ in range(200):
+                jobs.append(manager.submit("10.0.0.2", payload))
+        except Exception as e:
+            errors.append(e)
+
+    submitter = threading.Thread(target=submit)
+    submitter.start()
+    manager.shutdown()
+    submitter.join(TIMEOUT)
+    payload.set_result(b"screenshot")
+
+    assert not errors
+    assert all(job.finished.wait(TIMEOUT) for job in jobs)
+    assert all(job.status == CANCELLED for job in jobs)
@@ -0,0 +1,294 @@
+import collections
+import hashlib
+import socket
+import struct
+import threading
+import zlib
+
+import numpy as np
+from PIL import Image
+
+import transfer
+from screenshot_encoder import LOSSY_CODECS, decode_image
+
+TILE_SIZE = 64
+DIGEST_SIZE = 16
+FRAMES_KEPT = 2  # frames per peer whose tiles both ends remember
+MAX_PEERS = 8  # peers remembered before the least recently used one is evicted
+MIN_REUSE = 0.25  # below this share of reusable tiles a full image is cheaper to send
+TILE_COMPRESSION = 1  # zlib level for raw tiles; fast beats small on a LAN
+
+DELTA_HEADER = b"DELTA"  # sent instead of the ASCII size to start a delta transfer
+MODE_FULL = 0
+MODE_DELTA = 1
+REPLY_OK = b"OK"
+REPLY_NEED_FULL = b"NO"  # receiver is missing tiles the sender assumed it had
+
+MANIFEST = struct.Struct("!BIIHBI")  # mode, width, height, tile size, channels, tile count
+TILE = struct.Struct("!II")  # tile index, compressed length
+COUNT = struct.Struct("!I")
+SIZE = struct.Struct("!Q")
+
+
+class DeltaUnsupported(transfer.IncompatiblePeer):
+    """The receiver doesn't speak the delta protocol; send the full image the old way."""
+
+
+def split_tiles(pixels, tile_size=TILE_SIZE):
+    """Cut an HxWxC pixel array into row-major tiles; returns (tile bytes, digests)."""
+    height, width = pixels.shape[:2]
+    tiles = []
+    digests = []
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            tile = np.ascontiguousarray(pixels[y:y + tile_size, x:x + tile_size])
+            digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+            digest.update(struct.pack("!HH", *tile.shape[:2]))
+            digest.update(tile)
+            tiles.append(tile.tobytes())
+            digests.append(digest.digest())
+    return tiles, digests
+
+
+def assemble(tiles, width, height, channels, tile_size=TILE_SIZE):
+    """Inverse of split_tiles: rebuild the pixel array from row-major tile bytes."""
+    pixels = np.empty((height, width, channels), dtype=np.uint8)
+    tiles = iter(tiles)
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            tile_h = min(tile_size, height - y)
+            tile_w = min(tile_size, width - x)
+            pixels[y:y + tile_h, x:x + tile_w] = np.frombuffer(next(tiles), dtype=np.uint8).reshape(
+                tile_h, tile_w, channels)
+    return pixels
+
+
+class PeerTileCache:
+    """Tiles of the last few frames exchanged with each peer, bounded on both ends.
+
+    The receiver keeps tile bytes; the sender keeps only digests, mirroring
+    what it believes the receiver holds. Both evict with the same policy
+    (last `frames_kept` frames per peer, `max_peers` peers LRU) so the two
+    views normally agree; when they don't, the transfer falls back to a full
+    image and the peer's entry is rebuilt from it.
+    """
+
+    def __init__(self, frames_kept=FRAMES_KEPT, max_peers=MAX_PEERS):
+        self.frames_kept = frames_kept
+        self.max_peers = max_peers
+        self._peers = collections.OrderedDict()  # peer -> deque of {digest: tile bytes or None}
+        self._lock = threading.Lock()
+
+    def record(self, peer, digests, tiles=None):
+        """Remember one frame's tiles (or just their digests) as held by `peer`."""
+        frame = dict(zip(digests, tiles if tiles is not None else [None] * len(digests)))
+        with self._lock:
+            frames = self._peers.pop(peer, None) or collections.deque(maxlen=self.frames_kept)
+            frames.append(frame)
+            self._peers[peer] = frames
+            while len(self._peers) > self.max_peers:
+                self._peers.popitem(last=False)
+
+    def digests(self, peer):
+        """Every digest currently held for `peer`."""
+        with self._lock:
+            frames = self._peers.get(peer, ())
+            return set().union(*frames) if frames else set()
+
+    def tile(self, peer, digest):
+        """Tile bytes for `digest` from `peer`'s recent frames, or None."""
+        with self._lock:
+            for frame in reversed(self._peers.get(peer, ())):
+                tile = frame.get(digest)
+                if tile is not None:
+                    return tile
+        return None
+
+    def forget(self, peer):
+        with self._lock:
+            self._peers.pop(peer, None)
+
+    def nbytes(self):
+        """Bytes of tile data held across all peers (frames share no storage)."""
+        with self._lock:
+            return sum(len(tile) for frames in self._peers.values()
+                       for frame in frames for tile in frame.values() if tile)
+
+
+def can_send(encoded):
+    """Whether an EncodedImage can go out as a tile delta.
+
+    Lossy images can't: the receiver caches the tiles it decoded, which
+    differ from the pixels the sender digested, so later deltas would skip
+    tiles the peer holds a different version of and its image would drift.
+    """
+    return getattr(encoded, "image", None) is not None and getattr(encoded, "codec", None) not in LOSSY_CODECS
+
+
+def send_delta_to(host, port, encoded, cache, timeout=5, progress=None, cancel=None):
+    """Connect to a receiver and send an EncodedImage as a tile delta; returns bytes sent.
+
+    Raises DeltaUnsupported if the receiver only understands the plain size header.
+    """
+    with socket.create_connection((host, port), timeout=timeout) as s:
+        s.sendall(DELTA_HEADER)
+        if s.recv(1024) != b"ACK":
+            raise DeltaUnsupported(f"{host} does not accept delta transfers")
+        return send_delta(s, host, encoded, cache, progress=progress, cancel=cancel)
+
+
+def send_delta(sock, peer, encoded, cache, progress=None, cancel=None):
+    """Send only the tiles `peer` doesn't hold yet, or the full image if that's cheaper."""
+    mode, manifest, tiles, digests, missing = _plan(peer, encoded, cache)
+    sock.sendall(manifest)
+    if mode == MODE_DELTA:
+        sent = _send_tiles(sock, tiles, missing, progress, cancel)
+    else:
+        sent = _send_full(sock, encoded, progress, cancel)
+
+    reply = bytes(transfer.recv_exactly(sock, 2))
+    if reply == REPLY_NEED_FULL:
+        # Caches disagree (receiver restarted or evicted us): start this peer over from a full image
+        cache.forget(peer)
+        sent += _send_full(sock, encoded, progress, cancel)
+        reply = bytes(transfer.recv_exactly(sock, 2))
+    if reply != REPLY_OK:
+        raise ConnectionError(f"Receiver rejected delta transfer: {reply!r}")
+
+    cache.record(peer, digests)
+    return sent
+
+
+def send_delta_stream(session, peer, encoded, cache, progress=None, cancel=None):
+    """send_delta over a session.Session: the delta travels as one stream instead of its own connection."""
+    try:
+        mode, manifest, tiles, digests, missing = _plan(peer, encoded, cache)
+        body = manifest + (_pack_tiles(tiles, missing) if mode == MODE_DELTA else _pack_full(encoded))
+        reply = session.send(body, _stream_metadata(body), progress=progress, cancel=cancel)
+        if reply.get("need_full"):
+            # Caches disagree (receiver restarted or evicted us): start this peer over from a full image
+            cache.forget(peer)
+            mode, manifest, tiles, digests, missing = _plan(peer, encoded, cache)
+            body = manifest + _pack_full(encoded)
+            session.send(body, _stream_metadata(body), progress=progress, cancel=cancel)
+    except BaseException:
+        cache.forget(peer)
+        raise
+    cache.record(peer, digests)
+
+
+def read_delta(data):
+    """Parse a delta sent as one buffer; returns (manifest fields, {index: tile bytes} or encoded image bytes)."""
+    view = memoryview(data)
+    try:
+        count = MANIFEST.unpack_from(view)[-1]
+        position = MANIFEST.size + count * DIGEST_SIZE
+        manifest = parse_manifest(view[:MANIFEST.size], view[MANIFEST.size:position])
+        if manifest[0] == MODE_FULL:
+            (size,) = SIZE.unpack_from(view, position)
+            position += SIZE.size
+            content = bytes(view[position:position + size])
+            if len(content) != size:
+                raise ValueError(f"Delta holds {len(content)} of {size} image bytes")
+            return manifest, content
+
+        (tile_count,) = COUNT.unpack_from(view, position)
+        position += COUNT.size
+        tiles = {}
+        for _ in range(tile_count):
+            index, length = TILE.unpack_from(view, position)
+            position += TILE.size
+            if index >= count:
+                raise ValueError(f"Tile index {index} out of range")
+            tiles[index] = zlib.decompress(view[position:position + length])
+            position += length
+        return manifest, tiles
+    except struct.error as e:
+        raise ValueError(f"Truncated delta: {e}")
+
+
+def _plan(peer, encoded, cache):
+    """Split an image into tiles and decide what `peer` needs; returns (mode, manifest bytes, tiles, digests, missing)."""
+    pixels = np.asarray(encoded.image.convert("RGB"))
+    height, width, channels = pixels.shape
+    tiles, digests = split_tiles(pixels)
+
+    known = cache.digests(peer)
+    missing = [i for i, digest in enumerate(digests) if digest not in known]
+    reusable = 1 - len(missing) / len(digests)
+    mode = MODE_DELTA if known and reusable >= MIN_REUSE else MODE_FULL
+    manifest = MANIFEST.pack(mode, width, height, TILE_SIZE, channels, len(digests)) + b"".join(digests)
+    return mode, manifest, tiles, digests, missing
+
+
+def _pack_tiles(tiles, indices):
+    parts = [COUNT.pack(len(indices))]
+    for index in indices:
+        data = zlib.compress(tiles[index], TILE_COMPRESSION)
+        parts += [TILE.pack(index, len(data)), data]
+    return b"".join(parts)
+
+
+def _pack_full(encoded):
+    return SIZE.pack(encoded.size) + encoded.data
+
+
+def _stream_metadata(body):
+    """HELLO metadata marking a stream as a tile delta, which receivers rebuild in memory."""
+    return {"name": "delta", "type": "application/x-airshare-delta", "size": len(body),
+            "sha256": hashlib.sha256(body).hexdigest(), "kind": "delta"}
+
+
+def _send_tiles(sock, tiles, indices, progress, cancel):
+    """Send the chosen tiles zlib-compressed; progress counts bytes of the delta body, like a full send.
+
+    The tiles are packed before the first write so the total is known:
+    progress feeds link throughput and byte metrics, which a tile count
+    would corrupt.
+    """
+    return transfer.send_buffer(sock, _pack_tiles(tiles, indices), progress=progress, cancel=cancel)
+
+
+def _send_full(sock, encoded, progress, cancel):
+    sock.sendall(SIZE.pack(encoded.size))
+    return transfer.send_buffer(sock, encoded.data, progress=progress, cancel=cancel)
+
+
+async def receive_tiles(sock, manifest_digests):
+    """Read a delta's tile section; returns {tile index: raw tile bytes}."""
+    (count,) = COUNT.unpack(await transfer.recv_exactly_async(sock, COUNT.size))
+    tiles = {}
+    for _ in range(count):
+        index, length = TILE.unpack(await transfer.recv_exactly_async(sock, TILE.size))
+        if index >= len(manifest_digests):
+            raise ValueError(f"Tile index {index} out of range")
+        tiles[index] = zlib.decompress(await transfer.recv_exactly_async(sock, length))
+    return tiles
+
+
+async def receive_full(sock):
+    """Read a full encoded image sent as the fallback of a delta transfer."""
+    (size,) = SIZE.unpack(await transfer.recv_exactly_async(sock, SIZE.size))
+    return await transfer.recv_exactly_async(sock, size)
+
+
+def parse_manifest(header, digest_bytes):
+    """Split a manifest into (mode, width, height, tile size, channels, digests)."""
+    mode, width, height, tile_size, channels, count = MANIFEST.unpack(header)
+    if mode not in (MODE_FULL, MODE_DELTA) or not tile_size:
+        raise ValueError(f"Bad delta manifest (mode {mode}, tile size {tile_size})")
+    digests = [bytes(digest_bytes[i:i + DIGEST_SIZE]) for i in range(0, count * DIGEST_SIZE, DIGEST_SIZE)]
+    return mode, width, height, tile_size, channels, digests
+
+
+def save_pixels(pixels, path):
+    """Write a rebuilt pixel array to `path` as a fast PNG."""
+    with transfer.atomic_output(path) as f:
+        Image.fromarray(pixels).save(f, format="PNG", compress_level=1)
+
+
+def decode_tiles(data, tile_size, expected_tiles):
+    """Decode a full encoded image into tiles for the cache (None if they don't line up)."""
+    pixels = np.asarray(decode_image(data).convert("RGB"))
+    tiles, _ = split_tiles(pixels, tile_size)
+    return tiles if len(tiles) == expected_tiles else None
@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import os
+import socket
+import tempfile
+import time
+
+# Bytes moved per read/send when the kernel can't splice the file for us.
+# 1024-byte chunks cost one syscall per KB; 256 KB keeps the socket buffer full.
+DEFAULT_CHUNK_SIZE = 256 * 1024
+
+
+def sendfile_supported():
+    """Check whether the OS offers zero-copy file-to-socket transfer."""
+    return hasattr(os, "sendfile")
+
+
+class TransferCancelled(Exception):
+    """Raised inside a send when its job was cancelled."""
+
+
+class IncompatiblePeer(Exception):
+    """The receiver doesn't understand this wire format; retrying won't help, falling back might."""
+
+
+def send_file(sock, path, chunk_size=DEFAULT_CHUNK_SIZE, use_sendfile=None, progress=None, cancel=None):
+    """Send the whole file at `path` over a connected socket and return the bytes sent.
+
+    Uses sendfile() when available so the data never passes through Python,
+    otherwise falls back to reading into one reusable buffer and sendall().
+    If `progress` (called with bytes sent and total) or `cancel` (a
+    threading.Event) is given, the file goes out in `chunk_size` slices so
+    both can be serviced between them.
+    """
+    if use_sendfile is None:
+        use_sendfile = sendfile_supported()
+
+    with open(path, 'rb') as f:
+        total = os.fstat(f.fileno()).st_size
+        if use_sendfile and progress is None and cancel is None:
+            return sock.sendfile(f)
+
+        buffer = None if use_sendfile else bytearray(chunk_size)
+        sent = 0
+        while sent < total:
+            if cancel is not None and cancel.is_set():
+                raise TransferCancelled()
+            if use_sendfile:
+                n = sock.sendfile(f, sent, min(chunk_size, total - sent))
+            else:
+                n = _send_chunk(sock, f, buffer)
+            if not n:
+                break
+            sent += n
+            if progress:
+                progress(sent, total)
+        return sent
+
+
+def _send_chunk(sock, f, buffer):
+    """Copy the next chunk of a file object to the socket through a preallocated buffer."""
+    n = f.readinto(buffer)
+    if n:
+        sock.sendall(memoryview(buffer)[:n])
+    return n
+
+
+def send_buffer(sock, data, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, cancel=None):
+    """Send an in-memory payload without copying it and return the bytes sent."""
+    view = memoryview(data).cast('B')
+    total = len(view)
+    if progress is None and cancel is None:
+        sock.sendall(view)
+        return total
+
+    sent = 0
+    while sent < total:
+        if cancel is not None and cancel.is_set():
+            raise TransferCancelled()
+        end = min(sent + chunk_size, total)
+        sock.sendall(view[sent:end])
+        sent = end
+        if progress:
+            progress(sent, total)
+    return sent
+
+
+def payload_size(payload):
+    """Size in bytes of a payload given as a file path or a bytes-like buffer."""
+    if isinstance(payload, (str, os.PathLike)):
+        return os.path.getsize(payload)
+    return memoryview(payload).nbytes
+
+
+def send_payload(sock, payload, progress=None, cancel=None):
+    """Send a file path with send_file() or a bytes-like buffer with send_buffer()."""
+    if isinstance(payload, (str, os.PathLike)):
+        return send_file(sock, payload, progress=progress, cancel=cancel)
+    return send_buffer(sock, payload, progress=progress, cancel=cancel)
+
+
+def send_sized(sock, payload, progress=None, cancel=None):
+    """Original wire format: ASCII size, wait for ACK, then the raw bytes."""
+    # Send payload size first
+    size = payload_size(payload)
+    sock.sendall(str(size).encode())
+
+    # Wait for acknowledgment
+    sock.recv(1024)
+
+    # Send the payload (zero-copy sendfile or memoryview slices)
+    send_payload(sock, payload, progress=progress, cancel=cancel)
+    return size
+
+
+def send_to(host, port, payload, timeout=5, retries=3, retry_delay=2, progress=None, cancel=None,
+            send=send_sized):
+    """Connect to a receiver and run `send(sock, payload, progress=, cancel=)`, retrying on failure.
+
+    `payload` is a file path or an in-memory buffer. Waits between retries on
+    `cancel` instead of sleeping, so a cancelled job stops right away. Raises
+    the last error if every attempt fails.
+    """
+    for attempt in range(retries):
+        try:
+            with socket.create_connection((host, port), timeout=timeout) as s:
+                return send(s, payload, progress=progress, cancel=cancel)
+
+        except (TransferCancelled, IncompatiblePeer):
+            raise
+        except ConnectionRefusedError:
+            if attempt == retries - 1:
+                raise
+            print(f"Connection refused. Make sure the receiver is in receive mode. Retrying in {retry_delay} seconds...")
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"Error on attempt {attempt + 1}: {e}")
+
+        if cancel is not None:
+            if cancel.wait(retry_delay):
+                raise TransferCancelled()
+        else:
+            time.sleep(retry_delay)
+
+
+# Leading bytes of the image formats the sender can produce
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"RIFF", ".webp"),
+    (b"ASRAW1", ".rawz"),  # screenshot_encoder's raw-zlib pixels
+]
+
+
+def sniff_extension(path, default=".png"):
+    """Guess an image file's extension from its first bytes."""
+    with open(path, 'rb') as f:
+        head = f.read(16)
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            if extension == ".webp" and head[8:12] != b"WEBP":
+                continue
+            return extension
+    return default
+
+
+@contextlib.contextmanager
+def atomic_output(path, size=0):
+    """Open a temporary file next to `path` that replaces `path` only if the block succeeds."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=".airshare-", suffix=".part", dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            _preallocate(f, size)
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def receive_file(sock, size, path, chunk_size=DEFAULT_CHUNK_SIZE, buffer=None):
+    """Stream exactly `size` bytes from the socket into `path` and return the bytes received.
+
+    Data goes through one reusable buffer with recv_into() straight into a
+    temporary file next to `path`, which is renamed into place only once the
+    whole payload has arrived, so memory use doesn't grow with the file size
+    and readers never see a half-written file.
+    """
+    if buffer is None:
+        buffer = bytearray(chunk_size)
+    with atomic_output(path, size) as f:
+        received = _receive_into_file(sock, f, size, buffer)
+        if received < size:
+            raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+    return received
+
+
+async def receive_file_async(sock, size, path, buffer):
+    """Event-loop version of receive_file for a non-blocking socket."""
+    loop = asyncio.get_running_loop()
+    view = memoryview(buffer)
+    received = 0
+    with atomic_output(path, size) as f:
+        while received < size:
+            n = await loop.sock_recv_into(sock, view[:min(len(view), size - received)])
+            if not n:
+                raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+            f.write(view[:n])
+            received += n
+    return received
+
+
+def recv_exactly(sock, size):
+    """Read exactly `size` bytes from a blocking socket."""
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+        received += n
+    return data
+
+
+async def recv_exactly_async(sock, size):
+    """Event-loop version of recv_exactly for a non-blocking socket."""
+    loop = asyncio.get_running_loop()
+    data = bytearray(size)
+    view = memoryview(data)
+    received = 0
+    while received < size:
+        n = await loop.sock_recv_into(sock, view[received:])
+        if not n:
+            raise ConnectionError(f"Connection closed after {received} of {size} bytes")
+        received += n
+    return data
+
+
+def _receive_into_file(sock, f, size, buffer):
+    """Copy up to `size` bytes from the socket into a file object via `buffer`."""
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view, min(len(view), size - received))
+        if not n:
+            break
+        f.write(view[:n])
+        received += n
+    return received
+
+
+def _preallocate(f, size):
+    """Reserve disk space up front where the OS supports it, so a full disk fails early."""
+    if size and hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError:
+            pass
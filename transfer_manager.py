@@ -0,0 +1,390 @@
+import concurrent.futures
+import itertools
+import queue
+import threading
+import time
+
+import fanout
+import protocol
+import secure
+import session
+import tile_delta
+import transfer
+from screenshot_encoder import STANDARD_CODECS, encode_image
+
+QUEUED = "queued"
+SENDING = "sending"
+DONE = "sent"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class TransferJob:
+    """One queued send. Workers update its status and progress; anyone may cancel it.
+
+    `payload` is a file path, a bytes-like buffer, an object carrying one in
+    `.data` (such as an EncodedImage), or a Future that resolves to any of
+    these; futures are waited on by the worker, never by the caller.
+    """
+
+    def __init__(self, job_id, target, payload):
+        self.id = job_id
+        self.target = target
+        self.payload = payload
+        self.status = QUEUED
+        self.sent = 0
+        self.total = 0
+        self.error = None
+        self.wire_start = None  # (time, bytes sent) at the first progress report, to time the link
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    @property
+    def active(self):
+        return not self.finished.is_set()
+
+    @property
+    def progress(self):
+        return self.sent / self.total if self.total else 0.0
+
+    def describe(self):
+        """Short status line for the video overlay."""
+        if self.status == SENDING:
+            return f"To {self.target}: sending {self.progress:.0%}"
+        if self.status == FAILED:
+            return f"To {self.target}: failed ({self.error})"
+        return f"To {self.target}: {self.status}"
+
+
+class TransferManager:
+    """Sends files on background worker threads so the camera loop never waits on the network.
+
+    `submit()` only enqueues a job and returns immediately. `on_status(job)`
+    fires whenever a job changes state and `on_progress(job)` after every
+    chunk; both run on the worker thread, so they must be quick. With a
+    `tile_cache`, screenshots go out as tile deltas against the last frames
+    each peer received, falling back to a full send if the peer can't take them.
+    With `sessions`, every peer gets one persistent connection that all its
+    jobs share as streams. Otherwise, or for receivers that don't accept
+    sessions, each job connects with the framed protocol, so a retry after a
+    dropped connection resumes instead of starting over; receivers that
+    predate it get the plain size header. With a `codec_selector`
+    (codec_select.CodecSelector), screenshots are re-encoded, when it pays,
+    in whichever codec the peer accepts that reaches it soonest, and every
+    send is timed to keep the selector's link estimate current. With a
+    verification `code`, every session is encrypted and jobs for peers
+    that can't open one with the same code fail instead of going out in
+    the clear.
+
+    `submit_group()` sends one payload to many peers at once: it is encoded
+    once, for the slowest peer in a codec they all accept, and every peer's
+    job writes the same read-only buffer on the fan-out pool, so the group
+    doesn't wait behind the workers or behind each other.
+    """
+
+    def __init__(self, port, workers=2, on_status=None, on_progress=None, history=5, tile_cache=None,
+                 sessions=True, codec_selector=None, code=None, fanout_workers=fanout.FANOUT_WORKERS):
+        if code is not None:
+            secure.require()
+            if not sessions:
+                raise ValueError("Encrypted transfers need sessions")
+        self.port = port
+        self.code = code
+        self.tile_cache = tile_cache
+        self.codec_selector = codec_selector
+        self._sessions = {} if sessions else None  # peer -> session.Session
+        self._no_session = set()  # peers that don't accept sessions
+        self._no_delta = set()  # peers that don't take tile deltas
+        self._legacy = set()  # peers that only understand the plain size header
+        self.on_status = on_status
+        self.on_progress = on_progress
+        self._jobs = queue.Queue()
+        self._ids = itertools.count(1)
+        self._recent = []
+        self._outstanding = set()  # jobs not finished yet, however far back in _recent
+        self._history = history
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for worker in self._workers:
+            worker.start()
+        self._fanout = concurrent.futures.ThreadPoolExecutor(max_workers=fanout_workers + 1,
+                                                             thread_name_prefix="fanout")
+
+    def submit(self, target, payload):
+        """Queue a send of `payload` to `target` and return its TransferJob."""
+        job = TransferJob(next(self._ids), target, payload)
+        with self._lock:
+            self._recent.append(job)
+            del self._recent[:-self._history]
+            self._outstanding.add(job)
+            closed = self._closed
+            if not closed:
+                self._jobs.put(job)  # under the lock, so it can't land behind shutdown()'s sentinels
+        if closed:
+            self._finish(job, CANCELLED)  # no worker is left to run it
+            return job
+        self._notify_status(job)
+        return job
+
+    def submit_group(self, targets, payload):
+        """Queue a send of `payload` to every one of `targets` and return their TransferGroup.
+
+        The payload is resolved and encoded once, off the caller's thread;
+        each job waits for that, then sends on its own.
+        """
+        targets = list(dict.fromkeys(targets))
+        shared = concurrent.futures.Future()
+        jobs = [TransferJob(next(self._ids), target, shared) for target in targets]
+        with self._lock:
+            self._recent.extend(jobs)
+            del self._recent[:-max(self._history, len(jobs))]
+            self._outstanding.update(jobs)
+        if self._closed:
+            for job in jobs:
+                self._finish(job, CANCELLED)
+            return fanout.TransferGroup(jobs)
+        for target in targets:
+            self.connect(target)  # sessions open while the payload is prepared
+        submitted = 0
+        try:
+            # Submitted first, so it never waits behind the jobs that wait for it
+            prepare = self._fanout.submit(self._prepare_group, targets, payload, shared)
+            # Cancelled by shutdown() before it ran: the jobs waiting on it must not wait forever
+            prepare.add_done_callback(lambda future: future.cancelled() and shared.cancel())
+            for job in jobs:
+                self._notify_status(job)
+                run = self._fanout.submit(self._run, job)
+                submitted += 1
+                run.add_done_callback(lambda future, job=job: future.cancelled() and self._finish(job, CANCELLED))
+        except RuntimeError:  # shutdown() closed the pool while this group was being queued
+            shared.cancel()
+            for job in jobs[submitted:]:
+                self._finish(job, CANCELLED)
+        return fanout.TransferGroup(jobs)
+
+    def recent_jobs(self):
+        """The last few jobs, oldest first, for status display."""
+        with self._lock:
+            return list(self._recent)
+
+    def cancel_all(self):
+        """Cancel every job that hasn't finished."""
+        with self._lock:
+            jobs = list(self._outstanding)
+        for job in jobs:
+            job.cancel()
+
+    def choose_codec(self, target=None):
+        """The codec to capture the next screenshot in for `target`, or None without a codec selector."""
+        if self.codec_selector is None:
+            return None
+        target = target or self.codec_selector.last_peer
+        return self.codec_selector.choose(target, self._accepted_codecs(target))
+
+    def connect(self, target):
+        """Open the session to `target` in the background so the first send doesn't wait for it."""
+        peer_session = self._session(target)
+        if peer_session is not None and not peer_session.connected:
+            threading.Thread(target=self._warm_up, args=(target, peer_session), daemon=True).start()
+
+    def shutdown(self):
+        """Cancel outstanding jobs, stop the workers and close the sessions.
+
+        Jobs submitted afterwards are cancelled straight away.
+        """
+        with self._lock:
+            self._closed = True
+            for _ in self._workers:
+                self._jobs.put(None)
+        self.cancel_all()
+        # Group jobs that never started are finished as cancelled by their futures' callbacks
+        self._fanout.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            sessions = list(self._sessions.values()) if self._sessions else []
+        for peer_session in sessions:
+            peer_session.close()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            self._run(job)
+
+    def _run(self, job):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = SENDING
+        self._notify_status(job)
+        try:
+            self._send(job)
+        except (transfer.TransferCancelled, concurrent.futures.CancelledError):
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED)
+        else:
+            if self.codec_selector is not None and job.wire_start is not None:
+                started, already_sent = job.wire_start
+                self.codec_selector.record_transfer(job.target, job.total - already_sent,
+                                                    time.perf_counter() - started)
+            self._finish(job, DONE)
+
+    def _prepare_group(self, targets, payload, shared):
+        """Resolve and encode a group's payload once, then hand it to every job as a SharedPayload."""
+        try:
+            payload = _resolve(payload)
+            if self.codec_selector is not None and getattr(payload, "image", None) is not None:
+                payload = self._transcode(targets, payload)
+            shared.set_result(fanout.SharedPayload(payload))
+        except Exception as e:
+            shared.set_exception(e)
+
+    def _send(self, job):
+        payload = _resolve(job.payload)
+        if job.cancel_event.is_set():
+            raise transfer.TransferCancelled()  # cancelled while its payload was being prepared
+        if self.codec_selector is not None and getattr(payload, "image", None) is not None:
+            payload = self._transcode([job.target], payload)
+        metadata = getattr(payload, "metadata", None)
+
+        def progress(sent, total):
+            self._report(job, sent, total)
+
+        use_delta = self.tile_cache is not None and tile_delta.can_send(payload) and job.target not in self._no_delta
+
+        peer_session = self._session(job.target)
+        if peer_session is not None:
+            try:
+                if use_delta:
+                    tile_delta.send_delta_stream(peer_session, job.target, payload, self.tile_cache,
+                                                 progress=progress, cancel=job.cancel_event)
+                else:
+                    peer_session.send(payload, metadata=metadata, progress=progress, cancel=job.cancel_event)
+                return
+            except session.SessionUnsupported:
+                self._drop_session(job.target)
+        if self.code is not None:
+            raise session.SessionRefused(f"{job.target} doesn't accept encrypted sessions; not sending in the clear")
+
+        if use_delta:
+            try:
+                tile_delta.send_delta_to(job.target, self.port, payload, self.tile_cache,
+                                         progress=progress, cancel=job.cancel_event)
+                return
+            except transfer.TransferCancelled:
+                raise
+            except tile_delta.DeltaUnsupported:
+                self._no_delta.add(job.target)
+            except Exception as e:
+                print(f"Delta transfer to {job.target} failed ({e}); sending the full image")
+                self.tile_cache.forget(job.target)
+
+        if job.target not in self._legacy:
+            try:
+                protocol.send_to(job.target, self.port, payload, metadata=metadata, progress=progress,
+                                 cancel=job.cancel_event)
+                return
+            except protocol.FramingUnsupported:
+                self._legacy.add(job.target)
+
+        transfer.send_to(job.target, self.port, getattr(payload, "data", payload),
+                         progress=progress, cancel=job.cancel_event)
+
+    def _transcode(self, targets, encoded):
+        """`encoded`, or the same image re-encoded if the selector expects another codec to arrive sooner.
+
+        For several targets the codec must be one they all accept, and is
+        chosen for the slowest of them, whose send finishes last.
+        """
+        self.codec_selector.record_encode(encoded)
+        warm_ups = []
+        for target in targets:
+            peer_session = self._session(target)
+            if peer_session is not None and not peer_session.connected:
+                # Learn which codecs the peers take before choosing, all at once
+                warm_up = threading.Thread(target=self._warm_up, args=(target, peer_session), daemon=True)
+                warm_up.start()
+                warm_ups.append(warm_up)
+        for warm_up in warm_ups:
+            warm_up.join()
+        accepted = self._accepted_codecs(targets[0])
+        for target in targets[1:]:
+            accepted = [codec for codec in accepted if codec in self._accepted_codecs(target)]
+        slowest = min(targets, key=self.codec_selector.throughput)
+        codec = self.codec_selector.choose(slowest, accepted, have=encoded)
+        if codec == encoded.codec:
+            return encoded
+        transcoded = encode_image(encoded.image, codec)
+        self.codec_selector.record_encode(transcoded)
+        peers = targets[0] if len(targets) == 1 else f"{len(targets)} peers"
+        print(f"Re-encoded screenshot for {peers} as {transcoded.describe()}")
+        return transcoded
+
+    def _accepted_codecs(self, target):
+        """Codecs `target` advertised when its session opened; only the standard image formats otherwise."""
+        with self._lock:
+            peer_session = self._sessions.get(target) if self._sessions else None
+        if peer_session is not None and peer_session.peer_codecs:
+            return peer_session.peer_codecs
+        return STANDARD_CODECS
+
+    def _session(self, target):
+        """The shared session for `target`, created on first use; None if sessions are off for it."""
+        with self._lock:
+            if self._sessions is None or target in self._no_session:
+                return None
+            if target not in self._sessions:
+                codecs = self.codec_selector.codecs if self.codec_selector else None
+                self._sessions[target] = session.Session(target, self.port, codecs=codecs, code=self.code)
+            return self._sessions[target]
+
+    def _drop_session(self, target):
+        with self._lock:
+            self._no_session.add(target)
+            peer_session = self._sessions.pop(target, None)
+        if peer_session is not None:
+            peer_session.close()
+
+    def _warm_up(self, target, peer_session):
+        try:
+            peer_session.connect()
+        except session.SessionUnsupported:
+            self._drop_session(target)
+        except Exception:
+            pass  # the first send will retry and report the error
+
+    def _report(self, job, sent, total):
+        if job.wire_start is None:
+            job.wire_start = (time.perf_counter(), sent)
+        job.sent = sent
+        job.total = total
+        if self.on_progress:
+            self.on_progress(job)
+
+    def _finish(self, job, status):
+        with self._lock:
+            self._outstanding.discard(job)
+        job.status = status
+        job.finished.set()
+        self._notify_status(job)
+
+    def _notify_status(self, job):
+        if self.on_status:
+            try:
+                self.on_status(job)
+            except Exception as e:
+                print(f"Error in transfer status callback: {e}")
+
+
+def _resolve(payload):
+    """Wait for a Future payload; anything else is returned as-is."""
+    if isinstance(payload, concurrent.futures.Future):
+        return payload.result()
+    return payload
@@ -0,0 +1,380 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import re
+import secrets
+import shutil
+import time
+
+import aiohttp
+from aiohttp import web
+
+import protocol
+from netinfo import get_ip_address
+
+UPLOAD_PORT = 8001
+OUTPUT_DIR = "received_uploads"
+WRITE_CHUNK = 1024 * 1024  # bytes buffered per upload before they're written; all an upload holds in RAM
+MAX_UPLOAD = 16 * 1024 ** 3  # largest file a resumable upload may announce
+DISK_RESERVE = 512 * 1024 * 1024  # free space an upload may never take, so the laptop keeps working
+COMPLETED_TTL = 600  # seconds a finished upload still answers resume queries, in case its last reply was lost
+CLIENT_CHUNK = 8 * 1024 * 1024  # slice size the upload page sends per request
+_UNSAFE = re.compile(r"[^\w.\- ]")
+
+
+class Upload:
+    """One resumable upload: a partial file plus a small JSON sidecar, so it survives restarts."""
+
+    def __init__(self, upload_id, name, size, partial):
+        self.id = upload_id
+        self.name = name
+        self.size = size
+        self.partial = partial
+        self.offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+        self.seconds = 0.0  # time spent receiving, over all requests
+
+    @property
+    def sidecar(self):
+        return self.partial + ".json"
+
+    def save(self):
+        with open(self.sidecar, "w") as f:
+            json.dump({"name": self.name, "size": self.size, "seconds": self.seconds}, f)
+
+    def info(self):
+        return {"id": self.id, "name": self.name, "size": self.size, "offset": self.offset,
+                "done": self.offset == self.size}
+
+
+class UploadService:
+    """Phone-to-laptop uploads over HTTP, streamed to disk and never held in memory.
+
+    Routes, added to any aiohttp application with `attach()`:
+    - GET  /upload: a page that uploads files resumably, with a plain form as fallback
+    - POST /upload: multipart/form-data; every file part is streamed to disk
+    - POST /upload/resumable: {"name", "size", "key"} opens or finds an upload, giving its id and offset
+    - GET  /upload/resumable/<id>: how far an upload got
+    - PUT  /upload/resumable/<id>: append the body at the `Upload-Offset` header, which must match
+    Bodies may be sized or chunked. Each request reads at most `WRITE_CHUNK`
+    bytes before writing them out on an executor thread, so many uploads can
+    run at once, each holding one buffer. Finished files land in `output_dir`,
+    and `on_received(path, info)` gets their size, time and throughput.
+    With a `token`, every route wants it as `?token=` or an `Upload-Token`
+    header; the page passes it on. Uploads never take more than the free
+    disk space, less DISK_RESERVE.
+    """
+
+    def __init__(self, output_dir=OUTPUT_DIR, on_received=None, on_progress=None, max_upload=MAX_UPLOAD,
+                 token=None):
+        self.output_dir = output_dir
+        self.token = token
+        self.on_received = on_received
+        self.on_progress = on_progress  # (upload name, bytes so far, total or None), after every write
+        self.max_upload = max_upload
+        self.active = 0
+        self.completed = 0
+        self.received_bytes = 0
+        self._uploads = {}  # id -> Upload
+        self._writing = set()  # ids with a PUT in progress
+        self._completed = {}  # id -> (final info, time finished), for clients that missed the last reply
+        self._counter = 0
+        self._forms = itertools.count(1)
+        os.makedirs(os.path.join(output_dir, protocol.PARTIAL_DIR), exist_ok=True)
+        protocol.clean_partials(output_dir)
+
+    def attach(self, app):
+        app.router.add_get("/upload", self.page)
+        app.router.add_post("/upload", self.multipart)
+        app.router.add_post("/upload/resumable", self.open_upload)
+        app.router.add_get("/upload/resumable/{id}", self.upload_status)
+        app.router.add_put("/upload/resumable/{id}", self.append)
+        return app
+
+    def _check(self, request):
+        """Refuse a request without the token, when there is one."""
+        if self.token is None:
+            return
+        token = request.query.get("token") or request.headers.get("Upload-Token", "")
+        if not hmac.compare_digest(token.encode(), self.token.encode()):
+            raise web.HTTPForbidden(text="Open the upload link with its token, as printed on the laptop\n")
+
+    def _room(self):
+        """Bytes an upload may still write: free disk space less the reserve and what open uploads still need."""
+        free = shutil.disk_usage(self.output_dir).free - DISK_RESERVE
+        return free - sum(upload.size - upload.offset for upload in self._uploads.values())
+
+    async def page(self, request):
+        self._check(request)
+        page = UPLOAD_PAGE.replace("CLIENT_CHUNK", str(CLIENT_CHUNK)).replace("UPLOAD_TOKEN", self.token or "")
+        return web.Response(text=page, content_type="text/html")
+
+    async def multipart(self, request):
+        """Stream every file part of a multipart/form-data body to disk."""
+        self._check(request)
+        room = self._room()
+        if request.content_length is not None and request.content_length > room:
+            raise web.HTTPRequestEntityTooLarge(max_size=max(room, 0), actual_size=request.content_length)
+        reader = await request.multipart()
+        received = []
+        self.active += 1
+        try:
+            async for part in reader:
+                if not part.filename:
+                    continue
+                name = _safe_name(part.filename)
+                partial = os.path.join(self.output_dir, protocol.PARTIAL_DIR, f"form-{next(self._forms)}.part")
+                start = time.perf_counter()
+                try:
+                    with open(partial, "wb") as f:
+                        # One byte past the room left tells a chunked body that's too big
+                        size = await self._copy(part.read_chunk, f, name, None, limit=max(room, 0) + 1)
+                    if size > room:
+                        raise web.HTTPRequestEntityTooLarge(max_size=max(room, 0), actual_size=size)
+                    room -= size
+                except BaseException:
+                    os.remove(partial)
+                    raise
+                received.append(self._finish(partial, name, size, time.perf_counter() - start, request))
+        finally:
+            self.active -= 1
+        if not received:
+            raise web.HTTPBadRequest(text="No files in the form\n")
+        if "application/json" not in request.headers.get("Accept", ""):
+            names = "".join(f"<li>{info['name']}: {info['mb_s']:.1f} MB/s</li>" for info in received)
+            return web.Response(text=f"<p>Uploaded:</p><ul>{names}</ul><a href='/upload'>More</a>",
+                                content_type="text/html")
+        return web.json_response(received)
+
+    async def open_upload(self, request):
+        self._check(request)
+        try:
+            body = await request.json()
+            name, size = _safe_name(str(body["name"])), int(body["size"])
+        except (ValueError, KeyError, TypeError):
+            raise web.HTTPBadRequest(text="Expected JSON with name and size\n")
+        if size <= 0:
+            raise web.HTTPBadRequest(text="Nothing to upload\n")
+        if size > self.max_upload:
+            raise web.HTTPRequestEntityTooLarge(max_size=self.max_upload, actual_size=size)
+        # The same file from the same page maps to the same upload, so a reload resumes it
+        key = f"{body.get('key') or name}|{size}"
+        upload_id = hashlib.sha256(key.encode()).hexdigest()[:32]
+        completed = self._finished(upload_id)
+        if completed is not None:
+            return web.json_response(completed)
+        upload = self._upload(upload_id)
+        if upload is None:
+            if size > self._room():
+                raise web.HTTPRequestEntityTooLarge(max_size=max(self._room(), 0), actual_size=size)
+            partial = os.path.join(self.output_dir, protocol.PARTIAL_DIR, f"upload-{upload_id}.part")
+            upload = self._uploads[upload_id] = Upload(upload_id, name, size, partial)
+            open(upload.partial, "ab").close()
+            upload.save()
+        return web.json_response(upload.info())
+
+    async def upload_status(self, request):
+        self._check(request)
+        completed = self._finished(request.match_info["id"])
+        if completed is not None:
+            return web.json_response(completed)
+        upload = self._upload(request.match_info["id"])
+        if upload is None:
+            raise web.HTTPNotFound(text="No such upload\n")
+        return web.json_response(upload.info())
+
+    async def append(self, request):
+        self._check(request)
+        completed = self._finished(request.match_info["id"])
+        if completed is not None:
+            # The last reply got lost: the client is told it's done instead of starting over
+            return web.json_response(completed)
+        upload = self._upload(request.match_info["id"])
+        if upload is None:
+            raise web.HTTPNotFound(text="No such upload\n")
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            raise web.HTTPBadRequest(text="Upload-Offset header required\n")
+        if upload.id in self._writing or offset != upload.offset:
+            # Another request is writing it, or the client lost track: it should ask for the offset again
+            return web.json_response(upload.info(), status=409)
+
+        self._writing.add(upload.id)
+        self.active += 1
+        start = time.perf_counter()
+        written = 0
+        try:
+            with open(upload.partial, "ab") as f:
+                # Stop at the announced size, so a wrong client can't grow the file past it
+                written = await self._copy(request.content.read, f, upload.name, upload.size, upload.offset,
+                                           limit=upload.size - upload.offset)
+        except (ConnectionError, aiohttp.ClientPayloadError):
+            pass  # the phone lost its connection; what arrived is kept and it resumes from there
+        finally:
+            # Also runs when the request is cancelled, so the offset reached is never lost
+            upload.offset = os.path.getsize(upload.partial)
+            upload.seconds += time.perf_counter() - start
+            upload.save()
+            self._writing.discard(upload.id)
+            self.active -= 1
+        info = upload.info()
+        info["mb_s"] = _mb_s(written, time.perf_counter() - start)
+        if upload.offset == upload.size:
+            os.remove(upload.sidecar)
+            del self._uploads[upload.id]
+            info.update(self._finish(upload.partial, upload.name, upload.size, upload.seconds, request))
+            self._completed[upload.id] = (info, time.monotonic())
+        return web.json_response(info)
+
+    async def _copy(self, read, f, name, total, offset=0, limit=None):
+        """Move a body to `f` through a buffer of about WRITE_CHUNK; returns the bytes written."""
+        loop = asyncio.get_running_loop()
+        written = 0
+        buffer = bytearray()
+        while True:
+            wanted = WRITE_CHUNK if limit is None else min(WRITE_CHUNK, limit - written - len(buffer))
+            try:
+                chunk = await read(wanted) if wanted > 0 else b""
+            except (ConnectionError, aiohttp.ClientPayloadError, asyncio.CancelledError):
+                f.write(buffer)  # keep what did arrive, so a resume doesn't send it again
+                self.received_bytes += len(buffer)
+                raise
+            buffer += chunk
+            if buffer and (not chunk or len(buffer) >= WRITE_CHUNK):
+                await loop.run_in_executor(None, f.write, buffer)
+                written += len(buffer)
+                self.received_bytes += len(buffer)
+                buffer = bytearray()
+                if self.on_progress:
+                    self.on_progress(name, offset + written, total)
+            if not chunk:
+                return written
+
+    def _finished(self, upload_id):
+        """The final info of an upload that completed within COMPLETED_TTL, or None."""
+        cutoff = time.monotonic() - COMPLETED_TTL
+        for old in [key for key, (_, finished) in self._completed.items() if finished < cutoff]:
+            del self._completed[old]
+        completed = self._completed.get(upload_id)
+        return completed[0] if completed else None
+
+    def _upload(self, upload_id):
+        """An upload by id, reloading its sidecar if it was started before a restart."""
+        upload = self._uploads.get(upload_id)
+        if upload is None and re.fullmatch(r"[0-9a-f]{32}", upload_id):
+            partial = os.path.join(self.output_dir, protocol.PARTIAL_DIR, f"upload-{upload_id}.part")
+            try:
+                with open(partial + ".json") as f:
+                    saved = json.load(f)
+            except (OSError, ValueError):
+                return None
+            upload = self._uploads[upload_id] = Upload(upload_id, saved["name"], saved["size"], partial)
+            upload.seconds = saved.get("seconds", 0.0)
+        return upload
+
+    def _finish(self, partial, name, size, seconds, request):
+        """Move a complete upload to a unique name in `output_dir` and report it."""
+        self._counter += 1
+        path = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d-%H%M%S')}_{self._counter}_{name}")
+        os.replace(partial, path)
+        self.completed += 1
+        info = {"name": name, "file": os.path.basename(path), "bytes": size, "seconds": round(seconds, 3),
+                "mb_s": _mb_s(size, seconds)}
+        print(f"📥 {name} from {request.remote}: {size / 1024 / 1024:.1f} MB at {info['mb_s']:.1f} MB/s")
+        if self.on_received:
+            self.on_received(path, info)
+        return info
+
+
+def _safe_name(name):
+    """A file name from a client, reduced to something that can't leave the output directory."""
+    name = _UNSAFE.sub("_", os.path.basename(name.replace("\\", "/"))).strip(" .")
+    return name[:120] or "upload"
+
+
+def _mb_s(size, seconds):
+    return round(size / 1024 / 1024 / seconds, 2) if seconds > 0 else 0.0
+
+
+UPLOAD_PAGE = """<!DOCTYPE html><html><head><meta charset="utf-8"><title>AirShare upload</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<style>body{font-family:sans-serif;margin:1.5em}progress{width:100%}li{margin:.8em 0}</style></head>
+<body><h1>Send to this laptop</h1>
+<form method="post" action="/upload?token=UPLOAD_TOKEN" enctype="multipart/form-data">
+<input type="file" name="file" multiple id="files"> <button>Upload</button></form>
+<ul id="list"></ul>
+<script>
+const CHUNK = CLIENT_CHUNK, TOKEN = "UPLOAD_TOKEN";
+document.querySelector("form").addEventListener("submit", (event) => {
+  event.preventDefault();
+  for (const file of document.getElementById("files").files) upload(file);
+});
+class Refused extends Error {}
+// The JSON reply; a 4xx other than 409 (bad token, too large, unknown upload) won't get better
+// by retrying, so it stops the upload with the server's message, while 5xx is retried like a lost network
+async function reply(response) {
+  if (response.status >= 400 && response.status < 500 && response.status !== 409) {
+    throw new Refused((await response.text()).trim() || `refused (${response.status})`);
+  }
+  if (!response.ok && response.status !== 409) throw new Error(`server error ${response.status}`);
+  return response.json();
+}
+async function upload(file) {
+  const item = document.createElement("li");
+  item.innerHTML = `${file.name}<br><progress max="1" value="0"></progress> <span></span>`;
+  document.getElementById("list").appendChild(item);
+  const bar = item.querySelector("progress"), label = item.querySelector("span");
+  const started = performance.now();
+  let state = null, sent = 0;
+  while (true) {
+    try {
+      if (state === null) {
+        const response = await fetch("/upload/resumable", {method: "POST",
+          headers: {"Content-Type": "application/json", "Upload-Token": TOKEN},
+          body: JSON.stringify({name: file.name, size: file.size, key: `${file.name}|${file.lastModified}`})});
+        state = await reply(response);
+      }
+      if (state.done) break;
+      const response = await fetch(`/upload/resumable/${state.id}`, {method: "PUT",
+        headers: {"Upload-Offset": String(state.offset), "Upload-Token": TOKEN}, body: file.slice(state.offset, state.offset + CHUNK)});
+      const offset = state.offset;
+      state = await reply(response);
+      if (response.status === 409) await new Promise((resolve) => setTimeout(resolve, 1000));
+      sent += Math.max(0, state.offset - offset);
+      bar.value = state.offset / file.size;
+      label.textContent = `${(sent / 1048576 / ((performance.now() - started) / 1000)).toFixed(1)} MB/s`;
+    } catch (error) {
+      if (error instanceof Refused) {
+        label.textContent = `failed: ${error.message}`;
+        return;
+      }
+      // Lost the network: wait, then ask the laptop how far it got and carry on from there
+      label.textContent = "reconnecting...";
+      await new Promise((resolve) => setTimeout(resolve, 2000));
+      state = null;
+    }
+  }
+  label.textContent = `done, ${label.textContent}`;
+}
+</script></body></html>
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Take uploads from phones on the network")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=UPLOAD_PORT)
+    parser.add_argument("--output", default=OUTPUT_DIR, help="directory for finished uploads")
+    args = parser.parse_args()
+    service = UploadService(args.output, token=secrets.token_urlsafe(16))
+    app = service.attach(web.Application())
+    print(f"📤 Phones can upload at http://{get_ip_address()}:{args.port}/upload?token={service.token}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,127 +1,133 @@
+import signal
+import sys
+
 import cv2
 import mediapipe as mp
-import pyautogui
-import http.server
-import socketserver
-import threading
-import os
+
+from capture import FrameGrabber
+from gesture_engine import FIST, OPEN_PALM, TWO_FINGERS
+from gesture_state import GestureFlow
+from hand_tracker import HandTracker
+from netinfo import get_ip_address
+from pipeline import GesturePipeline
+from preview import PREVIEW_FPS, PreviewRenderer
+from scheduler import InferenceScheduler
+from screenshot_encoder import ScreenshotEncoder
+from share_server import ShareServer
 
 
 mp_hands = mp.solutions.hands
 mp_drawing = mp.solutions.drawing_utils
 hands = mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
 
-screenshot_path = "screenshot.png"
+# Track the hand in a small region of interest; search a downscaled frame when it's lost
+INFERENCE_WIDTH = 320
+tracker = HandTracker(hands, inference_width=INFERENCE_WIDTH)
+# Only a trickle of inferences while nobody is in front of the camera; motion or a hand
+# brings back full rate. See scheduler.POLICIES ("always" runs every frame)
+INFERENCE_POLICY = "balanced"
+scheduler = InferenceScheduler(tracker, policy=INFERENCE_POLICY)
+# Same gestures as the other scripts; one has to hold for several frames before it
+# fires, so one noisy frame can't start the server or reset the screenshot
+pipeline = GesturePipeline(scheduler)
+
+# --headless shares with gestures but opens no window and draws nothing (stop it with
+# Ctrl+C or SIGTERM); otherwise the preview redraws at most PREVIEW_FPS times a second
+HEADLESS = "--headless" in sys.argv
+
+SCREENSHOT_CODEC = "png-fast"  # png-fast, png, jpeg, webp or webp-lossless
+screenshot_encoder = ScreenshotEncoder(codec=SCREENSHOT_CODEC)
+pending_screenshot = None  # Future for the last EncodedImage
 port = 8000  
-
-def start_http_server():
-    """Starts an HTTP server to share the screenshot."""
-    os.makedirs("shared", exist_ok=True)
-    if os.path.exists(screenshot_path):
-        os.rename(screenshot_path, f"shared/{screenshot_path}")
-
-    handler = http.server.SimpleHTTPRequestHandler
-    with socketserver.TCPServer(("", port), handler) as httpd:
-        print(f"📡 Serving on port {port}. Access the file on your phone at: http://{get_ip_address()}:{port}/shared/{screenshot_path}")
-        httpd.serve_forever()
-
-def get_ip_address():
-    """Get the IP address of the MacBook."""
-    import socket
-    hostname = socket.gethostname()
-    return socket.gethostbyname(hostname)
+# One threaded server for the whole session; shares are served from memory and the
+# last few stay in a gallery at http://<ip>:8000/
+share_server = ShareServer(port)
+
+def publish_screenshot(future):
+    """Put the encoded screenshot on the share server once the worker has finished."""
+    try:
+        share = share_server.publish(future.result())
+    except Exception as e:
+        print(f"Error sharing screenshot: {e}")
+        return
+    print(f"✅ Screenshot Shared! Visit: {share_server.url(share, get_ip_address())}")
+
+def take_screenshot():
+    """✌️ Two Fingers: capture and encode a screenshot in the background."""
+    global pending_screenshot
+    pending_screenshot = screenshot_encoder.capture()
+    print("📸 Screenshot Taken!")
+
+def share_screenshot():
+    """✊ Closed Fist: serve the screenshot over HTTP."""
+    pending_screenshot.add_done_callback(publish_screenshot)
+
+def reset_screenshot():
+    """🖐️ Open Palm: start over (only after sharing)."""
+    print("🔄 Screenshot Reset. You can take a new one.")
+
+# Take, share, reset in that order; a gesture that doesn't fit the current state is ignored
+IDLE, TAKEN, SHARED = "idle", "taken", "shared"
+flow = GestureFlow(IDLE, {
+    (IDLE, TWO_FINGERS): (TAKEN, take_screenshot),
+    (TAKEN, FIST): (SHARED, share_screenshot),
+    (SHARED, OPEN_PALM): (IDLE, reset_screenshot),
+})
+INSTRUCTIONS = {
+    IDLE: "✌️ Two Fingers: Take Screenshot",
+    TAKEN: "✊ Closed Fist: Share Screenshot",
+    SHARED: "🖐️ Open Palm: Reset Screenshot",
+}
+
+share_server.start()
+print(f"📡 Serving on port {share_server.port}. Shared screenshots: {share_server.url(address=get_ip_address())}")
 
 cap = cv2.VideoCapture(0)
-screenshot_taken = False
-file_ready = False
-server_started = False
-reset_ready = False  # Ensures reset only happens AFTER sharing
-
-def is_two_fingers_up(landmarks):
-    """Detects if index and middle fingers are extended, while ring and pinky are curled."""
-    index_up = landmarks[mp_hands.HandLandmark.INDEX_FINGER_TIP].y < landmarks[mp_hands.HandLandmark.INDEX_FINGER_PIP].y
-    middle_up = landmarks[mp_hands.HandLandmark.MIDDLE_FINGER_TIP].y < landmarks[mp_hands.HandLandmark.MIDDLE_FINGER_PIP].y
-    ring_down = landmarks[mp_hands.HandLandmark.RING_FINGER_TIP].y > landmarks[mp_hands.HandLandmark.RING_FINGER_PIP].y
-    pinky_down = landmarks[mp_hands.HandLandmark.PINKY_TIP].y > landmarks[mp_hands.HandLandmark.PINKY_PIP].y
-    
-    return index_up and middle_up and ring_down and pinky_down
-
-def is_fist(landmarks):
-    """Detects a closed fist (all fingers curled)."""
-    folded_fingers = sum(landmarks[finger].y > landmarks[mp_hands.HandLandmark.WRIST].y for finger in [
-        mp_hands.HandLandmark.INDEX_FINGER_TIP,
-        mp_hands.HandLandmark.MIDDLE_FINGER_TIP,
-        mp_hands.HandLandmark.RING_FINGER_TIP,
-        mp_hands.HandLandmark.PINKY_TIP
-    ])
-    return folded_fingers == 4  # All fingers must be curled
-
-def is_open_palm(landmarks):
-    """Detects an open palm (all fingers extended)."""
-    extended_fingers = sum(landmarks[finger].y < landmarks[mp_hands.HandLandmark.WRIST].y for finger in [
-        mp_hands.HandLandmark.INDEX_FINGER_TIP,
-        mp_hands.HandLandmark.MIDDLE_FINGER_TIP,
-        mp_hands.HandLandmark.RING_FINGER_TIP,
-        mp_hands.HandLandmark.PINKY_TIP
-    ])
-    return extended_fingers == 4  # All fingers must be extended
-
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
-
-    frame = cv2.flip(frame, 1)
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-    result = hands.process(rgb_frame)
-
-    if result.multi_hand_landmarks:
-        for hand_landmarks in result.multi_hand_landmarks:
-
-            mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
-
-            landmarks = hand_landmarks.landmark
-
-            # Gesture logic
-            if not screenshot_taken and is_two_fingers_up(landmarks):  # ✌️ Two Fingers - Take Screenshot
-                screenshot = pyautogui.screenshot()
-                screenshot.save(screenshot_path)
-                screenshot_taken = True
-                file_ready = True
-                reset_ready = False  # Reset is not allowed until sharing happens
-                print("📸 Screenshot Taken!")
-
-            elif file_ready and is_fist(landmarks):  # ✊ Closed Fist - Start Sharing
-                if not server_started:
-                    server_thread = threading.Thread(target=start_http_server, daemon=True)
-                    server_thread.start()
-                    server_started = True
-                    reset_ready = True  # Now we allow resetting
-                    print(f"✅ Screenshot Shared! Visit: http://{get_ip_address()}:{port}/shared/{screenshot_path}")
-
-            elif reset_ready and is_open_palm(landmarks):  # 🖐️ Open Palm - Reset
-                screenshot_taken = False
-                file_ready = False
-                server_started = False
-                reset_ready = False  # Prevent multiple resets
-                print("🔄 Screenshot Reset. You can take a new one.")
+grabber = FrameGrabber(cap).start()  # always hand the newest frame to gesture detection
+# drawn less often than gestures are read, and never when headless
+preview = PreviewRenderer("Gesture Recognition", PREVIEW_FPS, headless=HEADLESS)
+if HEADLESS:
+    print("Running headless: no preview window. Press Ctrl+C to quit")
+# A headless run is stopped with SIGTERM as cleanly as with Ctrl+C
+signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+try:
+    while True:
+        ret, frame = grabber.read()
+        if not ret:
+            break
+
+        # Mirror, track, classify and vote, exactly as the replay benchmarks do
+        step = pipeline.process(frame)
+        frame, result = step.frame, step.result
+
+        # Gesture logic: only gestures that held steady for a few frames arrive here
+        for gesture in step.events:
+            flow.fire(gesture)
+
+        if not preview.due():
+            continue
+
+        if result.multi_hand_landmarks:
+            for hand_landmarks in result.multi_hand_landmarks:
+                mp_drawing.draw_landmarks(frame, hand_landmarks, mp_hands.HAND_CONNECTIONS)
 
             # Display gesture instructions
-            if not file_ready:
-                gesture = "✌️ Two Fingers: Take Screenshot"
-            elif server_started:
-                gesture = "🖐️ Open Palm: Reset Screenshot"
-            else:
-                gesture = "✊ Closed Fist: Share Screenshot"
-
-            cv2.putText(frame, gesture, (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
-
-    cv2.imshow("Gesture Recognition", frame)
-
-    # Break loop with 'q' 
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
-
+            cv2.putText(frame, INSTRUCTIONS[flow.state], (10, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+
+        inference_text = f"Inference: {scheduler.inference_ms:.1f} ms ({scheduler.mode})"
+        cv2.putText(frame, inference_text, (frame.shape[1] - 260, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                    (255, 255, 255), 1)
+
+        # Break loop with 'q' 
+        if preview.show(frame) == ord('q'):
+            break
+except KeyboardInterrupt:
+    pass
+
+grabber.stop()
+screenshot_encoder.shutdown()
+share_server.stop()
+print(f"Ran {scheduler.describe()}")
 cap.release()
-cv2.destroyAllWindows()
+preview.close()
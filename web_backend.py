@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import hmac
+import os
+import secrets
+import threading
+import time
+
+import socketio
+from aiohttp import web
+
+from capture import FrameGrabber, open_camera
+from codec_select import CodecSelector
+from discovery import RECEIVE, Discovery
+from gesture_engine import FIST, OPEN_PALM, TWO_FINGERS
+from gesture_state import ANY_STATE, GestureFlow
+from hand_tracker import HandTracker
+from netinfo import get_ip_address
+from pipeline import GesturePipeline
+from receive_service import ReceiveService
+from scheduler import InferenceScheduler
+from screenshot_encoder import ScreenshotEncoder
+from tile_delta import PeerTileCache
+from transfer_manager import CANCELLED, DONE, FAILED, TransferManager
+from upload_service import UploadService
+
+HTTP_PORT = 8080  # the control panel; 8000 is the phone share server and 5001/5002 the transfer ports
+PORT = 5001
+PROGRESS_INTERVAL = 0.1  # seconds between progress pushes for one transfer; every state change is pushed
+INDEX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "index.html")
+READY, CAPTURED = "ready", "captured"  # screenshot flow states
+
+
+def job_info(job):
+    return {"id": job.id, "target": job.target, "status": job.status, "sent": job.sent, "total": job.total,
+            "progress": round(job.progress, 3), "error": str(job.error) if job.error else None}
+
+
+class WebBackend:
+    """index.html's backend: one asyncio process serving the page and its Socket.IO events.
+
+    The page's `setup_connection` and `start_receive_server` drive the same
+    discovery, TransferManager and ReceiveService the scripts use. The
+    camera and gesture pipeline run on their own thread and transfers on the
+    manager's workers; both hand their events to the event loop with
+    `run_coroutine_threadsafe`, which never waits, so a slow browser can't
+    hold up a frame. Events are broadcast to every connected page. Phones can
+    upload files to the same process at `/upload` (see upload_service.py).
+    With a verification `code`, laptop-to-laptop transfers are encrypted.
+
+    Only pages of the panel's own origin may connect, and only a page
+    opened with the per-run `token` (printed at startup, passed as
+    `?token=`) may pick a partner IP or take, send or cancel screenshots
+    itself; any other page just sets the role and starts receiving. The
+    backend's own `camera` is off by default, because index.html holds the
+    webcam for its preview and most platforms won't share it.
+    """
+
+    def __init__(self, http_port=HTTP_PORT, port=PORT, camera=False, code=None, token=None):
+        self.http_port = http_port
+        self.port = port
+        self.camera = camera
+        self.code = code
+        self.token = token or secrets.token_urlsafe(16)
+        # No cors_allowed_origins: python-socketio then only accepts the page's own origin
+        self.sio = socketio.AsyncServer(async_mode="aiohttp")
+        self.app = web.Application()
+        self.sio.attach(self.app)
+        self.app.router.add_get("/", self.index)
+        # Phones upload to the same process at /upload, with the panel's token
+        self.uploads = UploadService(on_received=self._report_upload, on_progress=self._report_upload_progress,
+                                     token=self.token)
+        self.uploads.attach(self.app)
+        self.app.on_startup.append(self._startup)
+        self.app.on_cleanup.append(self._cleanup)
+        for event in ("connect", "disconnect", "setup_connection", "start_receive_server", "take_screenshot",
+                      "send_screenshot", "cancel_transfers"):
+            self.sio.on(event, getattr(self, "on_" + event))
+
+        self.role = None
+        self.partner_ip = None  # None sends to the first receiver discovered
+        self.encoder = ScreenshotEncoder()
+        self.pending_screenshot = None
+        self.discovery = None
+        self.transfer_manager = None
+        self.receive_service = None
+        self.flow = GestureFlow(READY, {
+            (READY, TWO_FINGERS): (CAPTURED, self.take_screenshot),
+            (CAPTURED, FIST): (READY, self.send_screenshot),
+            (ANY_STATE, OPEN_PALM): (ANY_STATE, self.start_receive_server),
+        })
+        self._loop = None
+        self._stop = threading.Event()
+        self._gesture_thread = None
+        self._last_progress = {}  # job id or upload name -> time of its last progress push
+        self._trusted = set()  # sids of pages that connected with the token
+
+    # Pushing to the browsers, from any thread
+
+    def emit(self, event, data=None):
+        """Broadcast `event` to every page without waiting; safe to call from worker threads."""
+        if self._loop is None or self._loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self.sio.emit(event, data), self._loop)
+
+    def status(self):
+        return {"role": self.role, "ip": get_ip_address(), "partner": self.partner_ip or "auto",
+                "receiving": self.receive_service is not None, "state": self.flow.state,
+                "receivers": [peer.address for peer in self.discovery.peers(receiving=True)],
+                "transfers": [job_info(job) for job in self.transfer_manager.recent_jobs()]}
+
+    # HTTP and Socket.IO handlers, on the event loop
+
+    async def index(self, request):
+        return web.FileResponse(INDEX)
+
+    async def on_connect(self, sid, environ, auth=None):
+        token = (auth or {}).get("token") if isinstance(auth, dict) else None
+        if isinstance(token, str) and hmac.compare_digest(token, self.token):
+            self._trusted.add(sid)
+        await self.sio.emit("status", self.status(), to=sid)
+
+    async def on_disconnect(self, sid, reason=None):
+        self._trusted.discard(sid)
+
+    async def _refuse(self, sid, action):
+        """Tell a page without the token that `action` needs it; True if it was refused."""
+        if sid in self._trusted:
+            return False
+        await self.sio.emit("error", {"message": f"{action} needs the panel link with its token, "
+                                                 "as printed when the backend started"}, to=sid)
+        return True
+
+    async def on_setup_connection(self, sid, data):
+        data = data or {}
+        self.role = "sender" if str(data.get("role", "")).lower().startswith("s") else "receiver"
+        partner_ip = str(data.get("ip") or "").strip() or None
+        if partner_ip and not await self._refuse(sid, "Choosing the receiver's IP"):
+            self.partner_ip = partner_ip
+            self.transfer_manager.connect(self.partner_ip)
+        if self.camera and self._gesture_thread is None:
+            self._gesture_thread = threading.Thread(target=self._gesture_loop, daemon=True)
+            self._gesture_thread.start()
+        await self.sio.emit("connection_setup", {"role": self.role, "ip": get_ip_address(),
+                                                 "partner": self.partner_ip or "auto"})
+
+    async def on_start_receive_server(self, sid, data=None):
+        # Binding waits on the service's thread, so it's kept off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.start_receive_server)
+
+    async def on_take_screenshot(self, sid, data=None):
+        if not await self._refuse(sid, "Taking a screenshot"):
+            self.take_screenshot()
+
+    async def on_send_screenshot(self, sid, data=None):
+        if not await self._refuse(sid, "Sending a screenshot"):
+            self.send_screenshot()
+
+    async def on_cancel_transfers(self, sid, data=None):
+        if not await self._refuse(sid, "Cancelling transfers"):
+            self.transfer_manager.cancel_all()
+
+    # Actions, shared by the page and the gestures
+
+    def take_screenshot(self):
+        codec = self.transfer_manager.choose_codec(self.partner_ip)
+        self.pending_screenshot = self.encoder.capture(codec=codec)
+        self.pending_screenshot.add_done_callback(self._report_screenshot)
+
+    def _report_screenshot(self, future):
+        try:
+            self.emit("screenshot_taken", {"description": future.result().describe()})
+        except Exception as e:
+            self.emit("error", {"message": f"Error taking screenshot: {e}"})
+
+    def send_screenshot(self):
+        if self.pending_screenshot is None:
+            self.emit("error", {"message": "No screenshot found to send!"})
+            return
+        target = self.partner_ip
+        if not target:
+            peer = self.discovery.resolve()
+            if peer is None:
+                receivers = self.discovery.peers(receiving=True)
+                if receivers:
+                    self.emit("error", {"message": f"Several receivers found: "
+                                                   f"{', '.join(p.describe() for p in receivers)}. "
+                                                   "Choose one by its IP at setup."})
+                else:
+                    self.emit("error", {"message": "No receivers found on the network yet."})
+                return
+            target = peer.address
+        return self.transfer_manager.submit(target, self.pending_screenshot)
+
+    def start_receive_server(self):
+        if self.receive_service is None:
+            try:
+                service = ReceiveService(port=self.port, on_received=self._report_received, code=self.code)
+                service.start()
+            except Exception as e:
+                self.emit("error", {"message": f"Error starting receive server: {e}"})
+                return
+            self.receive_service = service
+            self.discovery.set_caps(RECEIVE)
+        self.emit("receive_server_started", {"ip": get_ip_address(), "port": self.port})
+
+    # Callbacks from the transfer workers and the receive service
+
+    def _report_status(self, job):
+        self.emit("transfer_status", job_info(job))
+        if job.status == DONE:
+            self.emit("screenshot_sent", {"target": job.target, "bytes": job.total})
+        if job.status in (DONE, FAILED, CANCELLED):
+            self._last_progress.pop(job.id, None)
+
+    def _report_progress(self, job):
+        now = time.monotonic()
+        if now - self._last_progress.get(job.id, 0.0) >= PROGRESS_INTERVAL:
+            self._last_progress[job.id] = now
+            self.emit("transfer_progress", job_info(job))
+
+    def _report_received(self, path, addr):
+        self.emit("screenshot_received", {"file": os.path.basename(path), "from": addr[0],
+                                          "bytes": os.path.getsize(path)})
+
+    def _report_upload(self, path, info):
+        self._last_progress.pop(info["name"], None)
+        self.emit("upload_received", info)
+
+    def _report_upload_progress(self, name, received, total):
+        now = time.monotonic()
+        if now - self._last_progress.get(name, 0.0) >= PROGRESS_INTERVAL:
+            self._last_progress[name] = now
+            self.emit("upload_progress", {"name": name, "bytes": received, "total": total})
+
+    # The camera, on its own thread
+
+    def _gesture_loop(self):
+        cap = open_camera()
+        if cap is None:
+            self.emit("error", {"message": "Could not open any camera"})
+            return
+        import mediapipe as mp
+
+        hands = mp.solutions.hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
+        pipeline = GesturePipeline(InferenceScheduler(HandTracker(hands)))
+        grabber = FrameGrabber(cap).start()
+        try:
+            while not self._stop.is_set():
+                ret, frame = grabber.read()
+                if not ret:
+                    self.emit("error", {"message": "Couldn't read frame from camera"})
+                    break
+                for gesture in pipeline.process(frame).events:
+                    fired = self.flow.fire(gesture)
+                    self.emit("gesture", {"gesture": gesture, "fired": fired, "state": self.flow.state})
+        except Exception as e:
+            self.emit("error", {"message": f"Gesture loop stopped: {e}"})
+        finally:
+            grabber.stop()
+            cap.release()
+
+    # Lifecycle
+
+    async def _startup(self, app):
+        self._loop = asyncio.get_running_loop()
+        self.discovery = Discovery(port=self.port).start()
+        self.transfer_manager = TransferManager(self.port, on_status=self._report_status,
+                                                on_progress=self._report_progress, tile_cache=PeerTileCache(),
+                                                codec_selector=CodecSelector(), code=self.code)
+
+    async def _cleanup(self, app):
+        self._stop.set()
+        self.transfer_manager.shutdown()
+        self.encoder.shutdown()
+        if self.receive_service:
+            self.receive_service.stop()
+        self.discovery.stop()
+        if self._gesture_thread:
+            await self._loop.run_in_executor(None, self._gesture_thread.join, 5)
+
+    def run(self, host="127.0.0.1"):
+        address = get_ip_address() if host == "0.0.0.0" else host
+        print(f"🌐 AirShare control panel at http://{address}:{self.http_port}/?token={self.token}")
+        if host != "127.0.0.1":
+            print(f"📤 Phones can upload at http://{address}:{self.http_port}/upload?token={self.token}")
+        web.run_app(self.app, host=host, port=self.http_port, print=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve index.html and its Socket.IO events")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="interface to serve on; 0.0.0.0 also lets phones on the network reach /upload")
+    parser.add_argument("--port", type=int, default=HTTP_PORT, help="port of the control panel")
+    parser.add_argument("--camera", action="store_true",
+                        help="run gesture detection here too; the page's camera preview must then stay closed, "
+                             "since most platforms won't open one webcam twice")
+    parser.add_argument("--code", help="verification code shared with the other laptop; encrypts transfers")
+    args = parser.parse_args()
+    WebBackend(http_port=args.port, camera=args.camera, code=args.code).run(args.host)
+
+
+if __name__ == "__main__":
+    main()